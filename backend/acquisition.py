@@ -0,0 +1,311 @@
+import threading
+import time
+import numpy as np
+from backend.spectrometer import request_spectrum, set_integration_time, set_trigger_mode, BurstReader, \
+    EXTERNAL_TRIGGER_MODES
+from backend.averaging import SpectrumAccumulator, ExponentialAverager
+from backend.pipeline import DarkStage
+
+def read_average(profile, count, dark=None, track_variance=False, integration_time_us=None):
+    """Read ``count`` scans back to back and return their SpectrumAccumulator.
+
+    Used for dark and reference spectra, so no AcquisitionEngine may be
+    reading from the device meanwhile. With ``dark`` every scan is
+    dark-subtracted (negative counts clipped to zero) before it is added; a
+    dark spectrum with another pixel count is ignored with a warning. Pass
+    the device's ``integration_time_us`` so long scans do not time out.
+    """
+    scans = SpectrumAccumulator(track_variance=track_variance)
+    if not profile.usb_device:
+        return scans
+    pixels = (profile.packet_size - 1) // 2
+    dark_stage = None
+    if dark is not None:
+        if len(dark) == pixels:
+            # The same dark stage as the live pipeline (see correction_pipeline)
+            dark_stage = DarkStage(dark)
+        else:
+            print(f"Warning: dark spectrum has {len(dark)} points, the device sends {pixels}; "
+                  f"scans are not dark-corrected")
+    reader = BurstReader.from_profile(profile, integration_time_us=integration_time_us)
+    corrected = np.empty(pixels) if dark_stage is not None else None
+    for scan in reader.burst(count):
+        if dark_stage is not None:
+            scan = dark_stage.apply(scan, corrected)
+        scans.add(scan)
+    print(f"Read {scans.count}/{count} scans at {reader.frame_rate:.1f} frames/s")
+    return scans
+
+class AcquisitionEngine:
+    """Read spectra on a dedicated thread, decoupled from the UI refresh rate.
+
+    Every ``scans_to_average`` raw frames the reader averages them, runs the
+    optional ``processor`` callable on the result and publishes it; the UI
+    then picks up only the newest processed frame with ``latest()`` whenever
+    it redraws.
+    Setting ``ewma_alpha`` switches to live mode, where an exponentially
+    weighted average is published after every frame instead. Frame callbacks
+    (e.g. a recorder) get every raw frame with its timestamp on the reader
+    thread, so they must return quickly. Raw frames are not kept otherwise:
+    averaging streams into a ``SpectrumAccumulator`` and readers take the
+    published result, so no ring of past frames is needed.
+
+    Integration time changes are sent from the reader thread between two
+    reads, so they never interleave with a spectrum request; the next
+    ``discard_frames`` frames may still carry the old exposure and are
+    dropped, and averaging restarts. With ``auto_exposure`` set (see
+    backend.exposure.AutoExposure) every raw frame is used to adjust the
+    integration time.
+
+    With ``pipeline_depth`` above 1 spectra are read through a
+    ``BurstReader`` that keeps that many requests queued at the device, so
+    the next scan integrates while the current one is transferred and
+    processed; queued requests are drained when the reader thread stops, and
+    before an integration time change. Reads wait up to one scan of the
+    current integration time (plus a margin) before timing out.
+
+    A failed read is retried after ``error_backoff`` seconds, so a
+    disconnected device does not keep the reader spinning; after
+    ``max_read_errors`` failures in a row (None for no limit) the reader
+    thread gives up and stops.
+
+    A ``trigger_mode`` other than 'normal' (see trigger_modes) is sent when
+    the reader thread starts and 'normal' is restored when it stops. In the
+    external trigger modes reads always go through a ``BurstReader`` that
+    keeps its requests queued, and a read that times out waiting for a
+    trigger is neither a failed read nor a reason to drain the device.
+    """
+
+    def __init__(self, profile, scans_to_average=1, processor=None, read_spectrum=None,
+                 ewma_alpha=None, write_integration_time=None, auto_exposure=None, discard_frames=1,
+                 pipeline_depth=1, max_read_errors=100, error_backoff=0.05, trigger_mode='normal'):
+        self.profile = profile
+        self.scans_to_average = scans_to_average
+        self.ewma_alpha = ewma_alpha
+        self.processor = processor
+        self.read_spectrum = read_spectrum or self._request_spectrum
+        self.write_integration_time = write_integration_time or self._send_integration_time
+        self.auto_exposure = auto_exposure
+        self.discard_frames = discard_frames
+        self.pipeline_depth = pipeline_depth
+        self.max_read_errors = max_read_errors
+        self.error_backoff = error_backoff
+        self.trigger_mode = trigger_mode
+        self.burst_reader = None
+        self.integration_time_us = None
+        self.frames_discarded = 0
+        self._requested_integration_time = None
+        self._discard = 0
+        self.pixels = None
+        self.accumulator = SpectrumAccumulator()
+        self.live_average = None
+        self.frames_read = 0
+        self.read_errors = 0
+        self.trigger_timeouts = 0
+        self.processed_count = 0
+        self._latest = (0, None)
+        self._published = threading.Condition()
+        self._frame_callbacks = ()
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._started_at = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def frame_rate(self):
+        """Average raw frames per second since the engine was started."""
+        if not self._started_at:
+            return 0.0
+        elapsed = time.perf_counter() - self._started_at
+        return self.frames_read / elapsed if elapsed > 0 else 0.0
+
+    def start(self):
+        """Start the reader thread if it is not already running."""
+        if self.running:
+            if not self._stop_event.is_set():
+                return
+            # An earlier stop() gave up waiting; that reader still owns the device
+            self._thread.join()
+        self._stop_event.clear()
+        self.frames_read = 0
+        self.read_errors = 0
+        self.trigger_timeouts = 0
+        self._started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name='spectrum-reader', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Ask the reader thread to finish and wait until it has drained the device.
+
+        With a ``timeout`` the wait may end earlier; the engine then stays
+        ``running`` until the reader is done, so nobody else must use the
+        device yet.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if not self._thread.is_alive():
+                self._thread = None
+
+    def add_frame_callback(self, callback):
+        """Call ``callback(frame, timestamp)`` for every raw frame read."""
+        self._frame_callbacks = self._frame_callbacks + (callback,)
+
+    def remove_frame_callback(self, callback):
+        self._frame_callbacks = tuple(cb for cb in self._frame_callbacks if cb != callback)
+
+    def latest(self):
+        """Return ``(sequence, processed_frame)`` for the newest processed frame."""
+        return self._latest
+
+    def wait_latest(self, after=0, timeout=None):
+        """Block until a frame newer than sequence ``after`` is processed, then return latest().
+
+        Returns whatever latest() holds once ``timeout`` seconds have passed.
+        """
+        with self._published:
+            self._published.wait_for(lambda: self._latest[0] > after, timeout)
+        return self._latest
+
+    def set_integration_time(self, integration_time_us):
+        """Change the integration time; returns the time set, or None if it is queued.
+
+        While the reader thread runs the change is queued and sent before its
+        next read; otherwise it is sent right away.
+        """
+        if self.running:
+            self._requested_integration_time = integration_time_us
+            return None
+        return self._apply_integration_time(integration_time_us)
+
+    def _apply_integration_time(self, integration_time_us):
+        if self.burst_reader is not None:
+            # Queued scans use the old time, so collect them with the old timeout
+            self.burst_reader.drain()
+        self.integration_time_us = self.write_integration_time(integration_time_us)
+        if self.burst_reader is not None:
+            self.burst_reader.set_integration_time(self.integration_time_us)
+        # Averages must not mix exposures
+        self._discard = self.discard_frames
+        self.accumulator.reset()
+        self.live_average = None
+        return self.integration_time_us
+
+    def _send_integration_time(self, integration_time_us):
+        return set_integration_time(
+            self.profile.usb_device,
+            self.profile.cmd_ep_out,
+            self.profile.model_name,
+            integration_time_us
+        )
+
+    @property
+    def waits_for_trigger(self):
+        return self.trigger_mode in EXTERNAL_TRIGGER_MODES
+
+    def _request_spectrum(self):
+        if self.pipeline_depth > 1 or self.waits_for_trigger:
+            if self.burst_reader is None:
+                self.burst_reader = BurstReader.from_profile(
+                    self.profile, depth=self.pipeline_depth, integration_time_us=self.integration_time_us,
+                    max_timeouts=None if self.waits_for_trigger else 3)
+            return self.burst_reader.read()
+        return request_spectrum(
+            self.profile.usb_device,
+            self.profile.packet_size,
+            self.profile.spectra_ep_in,
+            self.profile.cmd_ep_out
+        )
+
+    def _send_trigger_mode(self, mode):
+        try:
+            set_trigger_mode(self.profile.usb_device, self.profile.cmd_ep_out, mode)
+        except Exception as e:
+            print(f"Error setting trigger mode: {e}")
+
+    def _run(self):
+        # Re-created on the first read, for the current trigger mode
+        self.burst_reader = None
+        if self.trigger_mode != 'normal':
+            self._send_trigger_mode(self.trigger_mode)
+        try:
+            self._read_loop()
+        finally:
+            if self.trigger_mode != 'normal':
+                # Requests still waiting for a trigger are then answered and drained
+                self._send_trigger_mode('normal')
+            # Nothing may stay queued for whoever uses the device next
+            if self.burst_reader is not None:
+                self.burst_reader.drain()
+
+    def _read_loop(self):
+        consecutive_errors = 0
+        while not self._stop_event.is_set():
+            requested, self._requested_integration_time = self._requested_integration_time, None
+            if requested is not None:
+                try:
+                    self._apply_integration_time(requested)
+                except Exception as e:
+                    print(f"Error setting integration time: {e}")
+
+            timeouts = self.burst_reader.timeouts if self.burst_reader is not None else 0
+            frame = self.read_spectrum()
+            if frame is None and self.waits_for_trigger and self.burst_reader is not None \
+                    and self.burst_reader.timeouts > timeouts:
+                # No trigger came yet; the request stays queued
+                self.trigger_timeouts += 1
+                continue
+            if frame is None:
+                self.read_errors += 1
+                consecutive_errors += 1
+                if self.max_read_errors is not None and consecutive_errors >= self.max_read_errors:
+                    print(f"Stopping acquisition after {consecutive_errors} failed reads in a row")
+                    break
+                self._stop_event.wait(self.error_backoff)
+                continue
+            consecutive_errors = 0
+            if self._discard:
+                self._discard -= 1
+                self.frames_discarded += 1
+                continue
+
+            if self.pixels != len(frame):
+                self.pixels = len(frame)
+                self.accumulator = SpectrumAccumulator(len(frame))
+                self.live_average = None
+            timestamp = time.time()
+            self.frames_read += 1
+            for callback in self._frame_callbacks:
+                try:
+                    callback(frame, timestamp)
+                except Exception as e:
+                    print(f"Error in frame callback: {e}")
+
+            if self.auto_exposure is not None and self.integration_time_us:
+                integration_time_us = self.auto_exposure.update(frame, self.integration_time_us)
+                if integration_time_us is not None and self._requested_integration_time is None:
+                    self._requested_integration_time = integration_time_us
+
+            if self.ewma_alpha:
+                if self.live_average is None or self.live_average.alpha != self.ewma_alpha:
+                    self.live_average = ExponentialAverager(self.ewma_alpha)
+                averaged = self.live_average.update(frame).copy()
+            else:
+                self.accumulator.add(frame)
+                if self.accumulator.count < max(1, int(self.scans_to_average)):
+                    continue
+                averaged = self.accumulator.mean()
+                self.accumulator.reset()
+
+            try:
+                result = self.processor(averaged) if self.processor else averaged
+            except Exception as e:
+                print(f"Error processing spectrum: {e}")
+                continue
+            self.processed_count += 1
+            with self._published:
+                self._latest = (self.processed_count, result)
+                self._published.notify_all()
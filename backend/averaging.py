@@ -0,0 +1,110 @@
+import numpy as np
+
+class SpectrumAccumulator:
+    """Average spectra as they arrive, in constant memory.
+
+    Frames are summed in place into one preallocated buffer, so averaging a
+    thousand scans costs no more memory than averaging two. ``dtype`` selects
+    the sum buffer: ``np.float64`` (default) or ``np.uint32`` for exact
+    integer sums of raw uint16 counts. With ``track_variance`` the per-pixel
+    variance is maintained with Welford's algorithm as well.
+    """
+
+    def __init__(self, pixels=None, dtype=np.float64, track_variance=False):
+        self.dtype = np.dtype(dtype)
+        self.track_variance = track_variance
+        self.pixels = None
+        self.count = 0
+        if pixels is not None:
+            self._allocate(pixels)
+
+    def _allocate(self, pixels):
+        self.pixels = pixels
+        self._sum = np.zeros(pixels, dtype=self.dtype)
+        if self.track_variance:
+            self._mean = np.zeros(pixels, dtype=np.float64)
+            self._m2 = np.zeros(pixels, dtype=np.float64)
+            self._delta = np.empty(pixels, dtype=np.float64)
+            self._delta2 = np.empty(pixels, dtype=np.float64)
+
+    def reset(self):
+        """Forget all accumulated frames but keep the buffers."""
+        self.count = 0
+        if self.pixels is not None:
+            self._sum.fill(0)
+            if self.track_variance:
+                self._mean.fill(0)
+                self._m2.fill(0)
+
+    def add(self, frame):
+        """Accumulate one frame."""
+        if self.pixels is None:
+            self._allocate(len(frame))
+        elif len(frame) != self.pixels:
+            raise ValueError(f"Expected {self.pixels} points, got {len(frame)}")
+
+        np.add(self._sum, frame, out=self._sum, casting='unsafe')
+        self.count += 1
+
+        if self.track_variance:
+            # Welford: delta = x - mean; mean += delta / n; m2 += delta * (x - mean)
+            np.subtract(frame, self._mean, out=self._delta)
+            np.divide(self._delta, self.count, out=self._delta2)
+            self._mean += self._delta2
+            np.subtract(frame, self._mean, out=self._delta2)
+            self._delta *= self._delta2
+            self._m2 += self._delta
+
+    def mean(self, out=None):
+        """Return the average of the accumulated frames, or None if empty."""
+        if self.count == 0:
+            return None
+        if out is None:
+            out = np.empty(self.pixels, dtype=np.float64)
+        return np.divide(self._sum, self.count, out=out)
+
+    def variance(self, ddof=1):
+        """Return the per-pixel variance (requires ``track_variance``)."""
+        if not self.track_variance:
+            raise ValueError("Variance is only available with track_variance=True")
+        if self.count <= ddof:
+            return None
+        return self._m2 / (self.count - ddof)
+
+    def std(self, ddof=1):
+        """Return the per-pixel standard deviation (noise)."""
+        variance = self.variance(ddof)
+        return None if variance is None else np.sqrt(variance)
+
+class ExponentialAverager:
+    """Exponentially weighted moving average of a spectrum stream.
+
+    Each ``update`` moves the average towards the new frame by ``alpha``
+    (0 < alpha <= 1); smaller values smooth harder. Used for live mode where a
+    fixed block of scans would lag behind the sample.
+    """
+
+    def __init__(self, alpha=0.2):
+        if not 0 < alpha <= 1:
+            raise ValueError("alpha must be in (0, 1]")
+        self.alpha = alpha
+        self.value = None
+        self.count = 0
+        self._scratch = None
+
+    def reset(self):
+        self.value = None
+        self.count = 0
+
+    def update(self, frame):
+        """Blend ``frame`` into the running average and return it."""
+        if self.value is None or len(self.value) != len(frame):
+            self.value = np.array(frame, dtype=np.float64)
+            self._scratch = np.empty_like(self.value)
+        else:
+            # value = (1 - alpha) * value + alpha * frame, without temporaries
+            np.multiply(frame, self.alpha, out=self._scratch)
+            self.value *= 1.0 - self.alpha
+            self.value += self._scratch
+        self.count += 1
+        return self.value
@@ -0,0 +1,284 @@
+"""Acquisition from several spectrometers at once.
+
+``AcquisitionCoordinator`` runs one reader per spectrometer, either as a
+thread in this process (an ``AcquisitionEngine`` with pipelined reads) or
+as a separate process that owns its device and streams timestamped frames
+back over a pipe. Every raw frame is kept with its timestamp in a short
+per-channel history; ``latest()`` picks one frame per channel around the
+same instant and, when they lie within ``tolerance`` seconds of each other,
+returns them as a ``MergedRecord`` together with one spectrum stitched onto
+a common wavelength axis.
+"""
+import multiprocessing
+import struct
+import threading
+import time
+from collections import deque, namedtuple
+import numpy as np
+from backend.acquisition import AcquisitionEngine
+from backend.spectrometer import (BurstReader, device_key, drop_spectrometer, enumerate_spectrometers,
+                                  scan_usb_devices, set_integration_time)
+from config.ocean_optics_configs import wavelength_ranges
+
+MergedRecord = namedtuple('MergedRecord', 'timestamp, timestamps, channels, wavelengths, spectrum')
+
+# Frames of process readers travel as b'F', a float64 timestamp and the raw counts;
+# a reader that fails sends b'E' and the error message instead
+_FRAME_HEADER = struct.Struct('<cd')
+_FRAME_TAG = b'F'
+_ERROR_TAG = b'E'
+
+DEFAULT_WAVELENGTH_RANGE = (900, 2500)
+
+def model_wavelengths(model_name, pixels):
+    """Nominal wavelength of every pixel of a model (see wavelength_ranges)."""
+    start, end = wavelength_ranges.get(model_name, DEFAULT_WAVELENGTH_RANGE)
+    return np.linspace(start, end, pixels)
+
+class Stitcher:
+    """Resample spectra with different wavelength axes onto one axis.
+
+    The common axis spans all channels with the finest channel spacing (or
+    ``step`` nm). Interpolation indices and weights are computed once, so
+    stitching a set of frames is a few vectorized gathers. Where channels
+    overlap their values are averaged; wavelengths no channel covers are
+    NaN.
+    """
+
+    def __init__(self, channel_wavelengths, step=None):
+        channel_wavelengths = [np.asarray(w, dtype=np.float64) for w in channel_wavelengths]
+        self.pixels = [len(w) for w in channel_wavelengths]
+        if step is None:
+            step = min(np.median(np.diff(w)) for w in channel_wavelengths)
+        start = min(w[0] for w in channel_wavelengths)
+        end = max(w[-1] for w in channel_wavelengths)
+        self.wavelengths = start + step * np.arange(int(round((end - start) / step)) + 1)
+
+        coverage = np.zeros(len(self.wavelengths))
+        self._plans = []
+        for w in channel_wavelengths:
+            inside = np.flatnonzero((self.wavelengths >= w[0]) & (self.wavelengths <= w[-1]))
+            left = np.clip(np.searchsorted(w, self.wavelengths[inside], side='right') - 1, 0, len(w) - 2)
+            fraction = (self.wavelengths[inside] - w[left]) / (w[left + 1] - w[left])
+            self._plans.append((inside, left, fraction))
+            coverage[inside] += 1
+        self.gaps = coverage == 0
+        self._scale = np.divide(1.0, coverage, out=np.full(len(coverage), np.nan), where=~self.gaps)
+
+    def stitch(self, frames, out=None):
+        """Return the channel ``frames`` resampled and merged onto ``wavelengths``."""
+        if out is None:
+            out = np.empty(len(self.wavelengths))
+        out[:] = 0.0
+        for (inside, left, fraction), frame in zip(self._plans, frames):
+            frame = np.asarray(frame, dtype=np.float64)
+            lower = frame[left]
+            out[inside] += lower + (frame[left + 1] - lower) * fraction
+        out *= self._scale
+        return out
+
+class Channel:
+    """One spectrometer of the rig and the history of its recent frames."""
+
+    def __init__(self, profile, history=16):
+        self.profile = profile
+        self.model_name = profile.model_name
+        self.key = device_key(profile.usb_device) if profile.usb_device is not None else None
+        self.history = deque(maxlen=history)
+        self.wavelengths = None
+        self.frames = 0
+        self.started_at = None
+        self.error = None
+        self._lock = threading.Lock()
+
+    @property
+    def frame_rate(self):
+        if not self.started_at or not self.frames:
+            return 0.0
+        return self.frames / (time.perf_counter() - self.started_at)
+
+    def add(self, frame, timestamp):
+        # Readers reuse their buffers, so keep a copy
+        frame = np.array(frame)
+        if self.wavelengths is None or len(self.wavelengths) != len(frame):
+            self.wavelengths = model_wavelengths(self.model_name, len(frame))
+        with self._lock:
+            self.history.append((timestamp, frame))
+        self.frames += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.history)
+
+def _open_device(key):
+    """Find the attached device with this (bus, address, product id) key."""
+    for usb_device in scan_usb_devices():
+        if device_key(usb_device) == key:
+            return usb_device
+    raise ValueError(f"Spectrometer {key} not found")
+
+def _process_reader(key, depth, integration_time_us, connection, stop_event):
+    """Body of a reader process: stream frames of one device until told to stop."""
+    from backend.spectrometer import make_profile
+    usb_device = reader = None
+    try:
+        usb_device = _open_device(key)
+        profile = make_profile(usb_device)
+        if integration_time_us:
+            integration_time_us = set_integration_time(usb_device, profile.cmd_ep_out, profile.model_name,
+                                                       integration_time_us)
+        reader = BurstReader.from_profile(profile, depth=depth, integration_time_us=integration_time_us)
+        while not stop_event.is_set():
+            frame = reader.read()
+            if frame is not None:
+                connection.send_bytes(_FRAME_HEADER.pack(_FRAME_TAG, time.time()) + frame.tobytes())
+    except Exception as e:
+        # The parent only sees the pipe, so the error has to travel over it
+        connection.send_bytes(_ERROR_TAG + f"{type(e).__name__}: {e}".encode())
+    finally:
+        if reader is not None:
+            reader.drain()
+        if usb_device is not None:
+            drop_spectrometer(usb_device)
+        connection.close()
+
+class AcquisitionCoordinator:
+    """Acquire from several spectrometers concurrently and merge their frames.
+
+    ``profiles`` defaults to every attached spectrometer. ``mode='thread'``
+    runs an ``AcquisitionEngine`` per device in this process (USB transfers
+    release the GIL); ``mode='process'`` gives every device its own process,
+    which opens the device itself by bus, address and product id; a process
+    that fails reports its error in ``channel.error``.
+    ``integration_time_us``, when given, is sent to every device on start.
+    """
+
+    def __init__(self, profiles=None, mode='thread', tolerance=0.05, history=16, pipeline_depth=2,
+                 step=None, integration_time_us=None):
+        if mode not in ('thread', 'process'):
+            raise ValueError("mode must be 'thread' or 'process'")
+        if profiles is None:
+            profiles = enumerate_spectrometers()
+        self.channels = [Channel(profile, history) for profile in profiles]
+        self.mode = mode
+        self.tolerance = tolerance
+        self.pipeline_depth = pipeline_depth
+        self.step = step
+        self.integration_time_us = integration_time_us
+        self.merged = 0
+        self.rejected = 0
+        self.engines = []
+        self._stitcher = None
+        self._processes = []
+        self._receivers = []
+        self._stop_event = None
+
+    @property
+    def running(self):
+        return bool(self.engines or self._processes)
+
+    @property
+    def frame_rate(self):
+        """Aggregate raw frames per second over all channels."""
+        return sum(channel.frame_rate for channel in self.channels)
+
+    def frame_rates(self):
+        return {f"{channel.model_name} {channel.key}": channel.frame_rate for channel in self.channels}
+
+    def start(self):
+        if self.running:
+            return
+        now = time.perf_counter()
+        for channel in self.channels:
+            channel.started_at = now
+            channel.frames = 0
+            channel.error = None
+        if self.mode == 'thread':
+            self._start_threads()
+        else:
+            self._start_processes()
+
+    def _start_threads(self):
+        for channel in self.channels:
+            engine = AcquisitionEngine(channel.profile, pipeline_depth=self.pipeline_depth)
+            engine.add_frame_callback(channel.add)
+            if self.integration_time_us:
+                engine.set_integration_time(self.integration_time_us)
+            engine.start()
+            self.engines.append(engine)
+
+    def _start_processes(self):
+        context = multiprocessing.get_context('spawn')
+        self._stop_event = context.Event()
+        for channel in self.channels:
+            # The child opens the device itself; release our handle first
+            drop_spectrometer(channel.profile.usb_device)
+            receive, send = context.Pipe(duplex=False)
+            process = context.Process(target=_process_reader, name=f'spectrum-reader-{channel.key}',
+                                      args=(channel.key, self.pipeline_depth, self.integration_time_us, send,
+                                            self._stop_event),
+                                      daemon=True)
+            process.start()
+            send.close()
+            receiver = threading.Thread(target=self._receive, args=(channel, receive), daemon=True)
+            receiver.start()
+            self._processes.append(process)
+            self._receivers.append(receiver)
+
+    def _receive(self, channel, connection):
+        while True:
+            try:
+                data = connection.recv_bytes()
+            except (EOFError, OSError):
+                break
+            if data[:1] == _ERROR_TAG:
+                channel.error = data[1:].decode()
+                print(f"Reader of {channel.model_name} {channel.key} failed: {channel.error}")
+                continue
+            _, timestamp = _FRAME_HEADER.unpack_from(data)
+            channel.add(np.frombuffer(data, dtype='<u2', offset=_FRAME_HEADER.size), timestamp)
+        connection.close()
+
+    def stop(self, timeout=5.0):
+        for engine in self.engines:
+            engine.stop()
+        self.engines = []
+        if self._stop_event is not None:
+            self._stop_event.set()
+            for process in self._processes:
+                process.join(timeout)
+                if process.is_alive():
+                    process.terminate()
+            for receiver in self._receivers:
+                receiver.join(timeout)
+        self._processes = []
+        self._receivers = []
+
+    def _stitcher_for(self, channels):
+        wavelengths = [channel.wavelengths for channel in channels]
+        if self._stitcher is None or [len(w) for w in wavelengths] != self._stitcher.pixels:
+            self._stitcher = Stitcher(wavelengths, self.step)
+        return self._stitcher
+
+    def latest(self):
+        """Return the newest aligned MergedRecord, or None.
+
+        The slowest channel's newest frame sets the instant; every other
+        channel contributes its frame closest to it. None is returned while
+        some channel has no frame yet or the frames are further apart than
+        ``tolerance`` seconds.
+        """
+        histories = [channel.snapshot() for channel in self.channels]
+        if not histories or not all(histories):
+            return None
+        instant = min(history[-1][0] for history in histories)
+        picks = [min(history, key=lambda item: abs(item[0] - instant)) for history in histories]
+        timestamps = np.array([timestamp for timestamp, _ in picks])
+        if timestamps.max() - timestamps.min() > self.tolerance:
+            self.rejected += 1
+            return None
+        frames = [frame for _, frame in picks]
+        stitcher = self._stitcher_for(self.channels)
+        self.merged += 1
+        return MergedRecord(timestamp=float(timestamps.mean()), timestamps=timestamps, channels=frames,
+                            wavelengths=stitcher.wavelengths, spectrum=stitcher.stitch(frames))
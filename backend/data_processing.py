@@ -1,7 +1,12 @@
 import numpy as np
-from scipy.signal import find_peaks
+from backend.peaks import detect_peaks
 
-def process_data(wavelengths, intensities):
-    peaks, _ = find_peaks(intensities, height=1000)
-    return wavelengths[peaks]
+def process_data(wavelengths, intensities, height=1000, prominence=None, width=None, interpolation=None):
+    """Return the wavelengths of the peaks in a spectrum.
 
+    ``interpolation`` ('parabolic' or 'centroid') gives sub-pixel peak
+    wavelengths instead of the wavelengths of the peak pixels.
+    """
+    peaks = detect_peaks(intensities, np.asarray(wavelengths), height=height, prominence=prominence,
+                         width=width, interpolation=interpolation)
+    return peaks['wavelength']
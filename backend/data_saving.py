@@ -1,9 +1,10 @@
-import pandas as pd
+import numpy as np
 import os
 from datetime import datetime
 
 def save_to_csv(wavelengths, intensities, filename="spectrum_data.csv"):
     """Save wavelength and intensity data to a CSV file."""
+    import pandas as pd
     data = {'Wavelength': wavelengths, 'Intensity': intensities}
     df = pd.DataFrame(data)
     df.to_csv(filename, index=False)
@@ -12,6 +13,7 @@ def save_to_csv(wavelengths, intensities, filename="spectrum_data.csv"):
 def save_with_metadata(wavelengths, intensities, filename="spectrum_data.csv", 
                       metadata=None):
     """Save spectrum data with additional metadata."""
+    import pandas as pd
     data = {'Wavelength': wavelengths, 'Intensity': intensities}
     df = pd.DataFrame(data)
     
@@ -34,33 +36,74 @@ def save_with_metadata(wavelengths, intensities, filename="spectrum_data.csv",
     
     return True
 
-def load_from_csv(filename):
-    """Load spectrum data from a CSV file."""
+def _csv_engine():
+    """Use pandas' pyarrow parser when pyarrow is installed, else its C parser."""
+    try:
+        import pyarrow  # noqa: F401
+        return 'pyarrow'
+    except ImportError:
+        return 'c'
+
+def _is_numeric_row(line):
+    try:
+        [float(field) for field in line.split(b',')]
+        return True
+    except ValueError:
+        return False
+
+def load_from_csv(filename, dtype=np.float32):
+    """Load spectrum data from a CSV file.
+
+    The ``#`` metadata header is parsed while streaming, and the remaining
+    rows go straight to a C-speed parser in the same pass. Files with a
+    ``Wavelength,Intensity`` column header and headerless files (such as
+    the saved dark and reference spectra) are both accepted; without a
+    column header the first two columns are used. Intensities are
+    returned as ``dtype`` (float32 by default, or uint16 for raw counts)
+    and wavelengths as float64.
+    """
+    import pandas as pd
     try:
-        # First check if there's metadata
-        with open(filename, 'r') as f:
-            lines = f.readlines()
-        
         metadata = {}
-        data_start = 0
-        
-        # Process metadata lines
-        for i, line in enumerate(lines):
-            if line.startswith('#'):
-                if ':' in line:
-                    key, value = line[1:].strip().split(':', 1)
+        with open(filename, 'rb') as f:
+            # Process metadata lines
+            while True:
+                position = f.tell()
+                line = f.readline()
+                if not line.startswith(b'#'):
+                    break
+                text = line.decode('utf-8', 'replace')
+                if ':' in text:
+                    key, value = text[1:].strip().split(':', 1)
                     metadata[key.strip()] = value.strip()
-                data_start = i + 1
+
+            # Column header, if any, decides which columns hold the data
+            wavelength_column, intensity_column = 0, 1
+            if _is_numeric_row(line.strip()):
+                f.seek(position)
             else:
-                break
-        
-        # Read the actual data
-        df = pd.read_csv(filename, skiprows=data_start)
-        wavelengths = df['Wavelength'].values
-        intensities = df['Intensity'].values
-        
-        return wavelengths, intensities, metadata
+                names = [name.strip() for name in line.decode('utf-8').split(',')]
+                if 'Wavelength' in names and 'Intensity' in names:
+                    wavelength_column = names.index('Wavelength')
+                    intensity_column = names.index('Intensity')
+
+            # Hand the rest of the file to the parser as plain numbers; only
+            # ask for a column subset when there are extra columns to skip
+            columns = None
+            if line.count(b',') > 1:
+                columns = sorted({wavelength_column, intensity_column})
+                wavelength_column = columns.index(wavelength_column)
+                intensity_column = columns.index(intensity_column)
+            data = pd.read_csv(f, header=None, usecols=columns, dtype=np.float64,
+                               engine=_csv_engine()).to_numpy()
+
+        wavelengths = data[:, wavelength_column]
+        intensities = data[:, intensity_column]
+        dtype = np.dtype(dtype)
+        if dtype.kind in 'ui':
+            info = np.iinfo(dtype)
+            intensities = np.clip(np.rint(intensities), info.min, info.max)
+        return np.ascontiguousarray(wavelengths), intensities.astype(dtype), metadata
     except Exception as e:
         print(f"Error loading CSV file: {e}")
         return None, None, None
-
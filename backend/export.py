@@ -0,0 +1,204 @@
+"""Batch export of many spectra in one pass.
+
+``export_spectra`` takes a stack of spectra (one row per spectrum) plus
+optional per-row metadata and writes a single file:
+
+    .csv      wide CSV: ``#`` metadata lines, then one row per spectrum with
+              the row metadata columns followed by one column per wavelength
+    .parquet  the same table as Parquet (needs pyarrow or fastparquet)
+    .nirs     the binary spectrum format; row metadata goes into the header
+
+``BackgroundExporter`` runs exports (or any other save function) on a
+writer thread, so callers on the UI or acquisition side never wait on disk.
+"""
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+import numpy as np
+from backend.spectrum_file import write_spectra
+
+FORMATS = ('csv', 'parquet', 'nirs')
+CSV_BUFFER_SIZE = 1 << 20
+# Rows formatted per write() call
+CSV_CHUNK_ROWS = 256
+
+def _format_for(filename, format):
+    if format is None:
+        format = os.path.splitext(filename)[1].lstrip('.').lower()
+    if format not in FORMATS:
+        raise ValueError(f"Unsupported export format {format!r}; use one of {FORMATS}")
+    return format
+
+def _row_columns(row_metadata, count):
+    """Turn a list of per-row dicts (or a dict of columns) into ordered columns."""
+    if not row_metadata:
+        return {}
+    if isinstance(row_metadata, dict):
+        columns = {key: list(values) for key, values in row_metadata.items()}
+    else:
+        if len(row_metadata) != count:
+            raise ValueError(f"Got metadata for {len(row_metadata)} rows but {count} spectra")
+        keys = list(dict.fromkeys(key for row in row_metadata for key in row))
+        columns = {key: [row.get(key, '') for row in row_metadata] for key in keys}
+    for key, values in columns.items():
+        if len(values) != count:
+            raise ValueError(f"Metadata column {key!r} has {len(values)} values for {count} spectra")
+    return columns
+
+def _csv_field(value):
+    text = str(value)
+    if any(char in text for char in ',"\n'):
+        text = '"' + text.replace('"', '""') + '"'
+    return text
+
+def _write_csv(filename, wavelengths, spectra, columns, metadata, fmt):
+    with open(filename, 'w', newline='', buffering=CSV_BUFFER_SIZE) as f:
+        f.write(f"# Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        for key, value in (metadata or {}).items():
+            f.write(f"# {key}: {value}\n")
+        f.write(f"# Spectra: {len(spectra)}\n")
+        f.write(f"# Points: {len(wavelengths)}\n")
+        f.write("#\n")
+        f.write(','.join([_csv_field(key) for key in columns] + [f'{w:.3f}' for w in wavelengths]) + '\n')
+
+        # One %-format per row is much cheaper than a DataFrame per spectrum
+        row_format = ','.join([fmt] * len(wavelengths))
+        prefixes = [''] * len(spectra)
+        if columns:
+            prefixes = [','.join(_csv_field(values[i]) for values in columns.values()) + ','
+                        for i in range(len(spectra))]
+        for start in range(0, len(spectra), CSV_CHUNK_ROWS):
+            rows = spectra[start:start + CSV_CHUNK_ROWS].tolist()
+            f.write(''.join(prefix + row_format % tuple(row) + '\n'
+                            for prefix, row in zip(prefixes[start:], rows)))
+
+def _write_parquet(filename, wavelengths, spectra, columns, metadata):
+    import pandas as pd
+    table = pd.DataFrame(spectra.astype(np.float32), columns=[f'{w:.3f}' for w in wavelengths])
+    if columns:
+        table = pd.concat([pd.DataFrame(columns), table], axis=1)
+    table.attrs = {key: str(value) for key, value in (metadata or {}).items()}
+    table.to_parquet(filename, index=False)
+
+def export_spectra(filename, wavelengths, spectra, row_metadata=None, metadata=None, format=None,
+                   fmt='%.7g', dtype='float32'):
+    """Write a stack of spectra to a single CSV, Parquet or ``.nirs`` file.
+
+    ``spectra`` is 2-D (or a single 1-D spectrum), ``row_metadata`` a list of
+    dicts or a dict of columns with one entry per spectrum. The format comes
+    from the file extension unless ``format`` is given.
+    """
+    format = _format_for(filename, format)
+    wavelengths = np.asarray(wavelengths, dtype=np.float64)
+    spectra = np.atleast_2d(np.asarray(spectra))
+    if spectra.shape[1] != len(wavelengths):
+        raise ValueError(f"Expected {len(wavelengths)} points, got {spectra.shape[1]}")
+    columns = _row_columns(row_metadata, len(spectra))
+
+    if format == 'csv':
+        _write_csv(filename, wavelengths, spectra, columns, metadata, fmt)
+    elif format == 'parquet':
+        _write_parquet(filename, wavelengths, spectra, columns, metadata)
+    else:
+        header = dict(metadata or {})
+        if columns:
+            header['rows'] = columns
+        write_spectra(filename, wavelengths, spectra, header, dtype)
+    return True
+
+class BackgroundExporter:
+    """Run exports on a writer thread.
+
+    ``export()`` copies the spectra and queues them; ``submit()`` queues any
+    other save function (e.g. ``save_with_metadata``). Up to ``max_pending``
+    jobs wait in the queue, after which callers block until the writer
+    catches up. Errors are printed and counted, never raised at the caller.
+    """
+
+    def __init__(self, max_pending=64):
+        self._queue = queue.Queue(max_pending)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.files_written = 0
+        self.spectra_written = 0
+        self.write_time = 0.0
+        self.errors = 0
+        self.last_error = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def pending(self):
+        return self._queue.qsize()
+
+    @property
+    def spectra_per_second(self):
+        """Spectra written per second of writer time."""
+        return self.spectra_written / self.write_time if self.write_time > 0 else 0.0
+
+    def start(self):
+        """Start the writer thread if it is not already running."""
+        with self._lock:
+            if self.running:
+                return
+            self._thread = threading.Thread(target=self._run, name='spectrum-writer', daemon=True)
+            self._thread.start()
+
+    def submit(self, func, *args, spectra=0, **kwargs):
+        """Queue ``func(*args, **kwargs)``; ``spectra`` is the count it writes."""
+        self.start()
+        self._queue.put((func, args, kwargs, spectra))
+
+    def export(self, filename, wavelengths, spectra, **kwargs):
+        """Queue ``export_spectra``; the arrays are copied before returning."""
+        spectra = np.atleast_2d(np.array(spectra))
+        self.submit(export_spectra, filename, np.array(wavelengths), spectra,
+                    spectra=len(spectra), **kwargs)
+
+    def join(self):
+        """Wait until every queued job has been written."""
+        self._queue.join()
+
+    def stop(self, timeout=5.0):
+        """Write the remaining jobs and stop the writer thread.
+
+        Waits at most ``timeout`` seconds in all. A writer still busy after
+        that (e.g. on a hung disk) is left running as a daemon thread, and
+        ``running`` stays True.
+        """
+        if self._thread is None:
+            return
+        deadline = time.monotonic() + timeout
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            print(f"Writer is not keeping up; {self.pending} exports still queued")
+            return
+        self._thread.join(max(0.0, deadline - time.monotonic()))
+        if not self._thread.is_alive():
+            self._thread = None
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                func, args, kwargs, count = job
+                start = time.perf_counter()
+                try:
+                    func(*args, **kwargs)
+                except Exception as e:
+                    self.errors += 1
+                    self.last_error = e
+                    print(f"Error writing spectra: {e}")
+                    continue
+                self.write_time += time.perf_counter() - start
+                self.files_written += 1
+                self.spectra_written += count
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,59 @@
+import numpy as np
+from backend.spectrometer import integration_time_config
+
+class AutoExposure:
+    """Pick the integration time from the counts of the frames just read.
+
+    The brightest pixel is steered to ``target`` of the usable range
+    (``dark_level`` to ``saturation``): the shortest integration time that
+    still fills the ADC that far, which gives the best signal-to-noise per
+    frame without saturating and the highest frame rate for that signal.
+    The detector is linear in integration time, so an unsaturated frame
+    gives the new time directly; a saturated frame only tells us the time
+    is too long, so it is cut by ``saturated_step``. Each change is limited
+    to a factor of ``max_step`` and to the ``min_us``/``max_us`` range.
+    """
+
+    def __init__(self, saturation=65535, min_us=1000, max_us=10000000, target=0.8, tolerance=0.1,
+                 dark_level=0.0, max_step=8.0, saturated_step=0.25):
+        if not 0 < target < 1:
+            raise ValueError("target must be between 0 and 1")
+        self.saturation = saturation
+        self.min_us = min_us
+        self.max_us = max_us
+        self.target = target
+        self.tolerance = tolerance
+        self.dark_level = dark_level
+        self.max_step = max_step
+        self.saturated_step = saturated_step
+        self.adjustments = 0
+        self.converged = False
+        self.last_peak = None
+
+    @classmethod
+    def for_model(cls, model_name, max_us=10000000, **options):
+        """AutoExposure with the saturation and integration limits of a spectrometer model."""
+        config = integration_time_config(model_name)
+        return cls(saturation=config.saturation, min_us=config.min_us, max_us=min(max_us, config.max_us),
+                   **options)
+
+    def update(self, frame, integration_time_us):
+        """Return the next integration time (us), or None to keep the current one."""
+        peak = float(np.max(frame))
+        self.last_peak = peak
+        span = self.saturation - self.dark_level
+        if peak >= self.saturation - 1:
+            ratio = self.saturated_step
+        else:
+            signal = peak - self.dark_level
+            ratio = self.target * span / signal if signal > 0 else self.max_step
+            if abs(1.0 / ratio - 1.0) <= self.tolerance:
+                self.converged = True
+                return None
+        ratio = min(max(ratio, 1.0 / self.max_step), self.max_step)
+        new_time = int(min(max(integration_time_us * ratio, self.min_us), self.max_us))
+        self.converged = new_time == integration_time_us
+        if self.converged:
+            return None
+        self.adjustments += 1
+        return new_time
@@ -0,0 +1,349 @@
+"""Acquisition without the GUI.
+
+``HeadlessAcquisition`` runs the chain of the Kivy front end (averaging on
+an ``AcquisitionEngine``, dark subtraction, boxcar smoothing, reflectance
+against a white reference) and writes one processed spectrum per period to
+a sink. It never imports Kivy or matplotlib, so it runs on a headless box
+or from a scheduler:
+
+    python main.py --headless --rate 2 --scans 10 --integration-time 50 \\
+        --dark dark_spectrum.csv --reference reference_spectrum.csv -o spectra.csv
+
+Spectra go to stdout by default as a wide CSV (the layout of
+``export_spectra`` with a leading timestamp column); ``--output-dir``
+saves every spectrum to its own CSV with metadata instead, and
+``--tcp-port``, ``--unix-socket`` and ``--websocket-port`` publish them
+to live clients (see backend.streaming). ``--peaks`` follows the peaks of
+every processed spectrum with a ``PeakTracker`` and writes them to a CSV
+of their own. Status messages go to stderr.
+"""
+import argparse
+import contextlib
+import os
+import signal
+import sys
+import threading
+import time
+from datetime import datetime
+from backend.acquisition import AcquisitionEngine, read_average
+from backend.coordinator import model_wavelengths
+from backend.data_saving import load_from_csv, save_with_metadata
+from backend.export import BackgroundExporter
+from backend.peaks import PeakTracker
+from backend.pipeline import correction_pipeline
+from backend.spectrometer import drop_spectrometer, find_spectrometer
+from config.ocean_optics_configs import trigger_modes
+
+class CsvStream:
+    """Write spectra as rows of a wide CSV to an open text stream.
+
+    ``#`` metadata lines and the column header go out with the first
+    spectrum; every row is flushed so a reader at the end of a pipe sees it
+    right away.
+    """
+
+    def __init__(self, stream, metadata=None, fmt='%.7g', close_stream=False):
+        self.stream = stream
+        self.metadata = metadata or {}
+        self.fmt = fmt
+        self.close_stream = close_stream
+        self.rows = 0
+        self._row_format = None
+        self._columns = 0
+
+    def write(self, wavelengths, spectrum, timestamp):
+        if len(spectrum) != self._columns:
+            self._write_header(wavelengths)
+        self.stream.write(f'{timestamp:.6f},' + self._row_format % tuple(spectrum.tolist()) + '\n')
+        self.stream.flush()
+        self.rows += 1
+
+    def _write_header(self, wavelengths):
+        self.stream.write(f"# Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        for key, value in self.metadata.items():
+            self.stream.write(f"# {key}: {value}\n")
+        self.stream.write(f"# Points: {len(wavelengths)}\n")
+        self.stream.write("#\n")
+        self.stream.write(','.join(['Timestamp'] + [f'{w:.3f}' for w in wavelengths]) + '\n')
+        self._row_format = ','.join([self.fmt] * len(wavelengths))
+        self._columns = len(wavelengths)
+
+    def close(self):
+        if self.close_stream:
+            self.stream.close()
+        else:
+            self.stream.flush()
+
+class PeakStream:
+    """Write tracked peaks as CSV rows (one per peak) to an open text stream."""
+
+    COLUMNS = ('timestamp', 'track', 'wavelength', 'height', 'prominence', 'width')
+
+    def __init__(self, stream, close_stream=False):
+        self.stream = stream
+        self.close_stream = close_stream
+        self.rows = 0
+        self.stream.write(','.join(self.COLUMNS) + '\n')
+
+    def write(self, peaks, timestamp):
+        for peak in peaks:
+            self.stream.write(f"{timestamp:.6f},{peak['track']},{peak['wavelength']:.3f},{peak['height']:.7g},"
+                              f"{peak['prominence']:.7g},{peak['width']:.3f}\n")
+        self.stream.flush()
+        self.rows += len(peaks)
+
+    def close(self):
+        if self.close_stream:
+            self.stream.close()
+        else:
+            self.stream.flush()
+
+class SpectrumFiles:
+    """Save every spectrum to its own CSV in ``directory`` (see save_with_metadata).
+
+    Files are written on a BackgroundExporter thread, so a slow disk never
+    holds up acquisition.
+    """
+
+    def __init__(self, directory, metadata=None):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.metadata = metadata or {}
+        self.exporter = BackgroundExporter()
+        self.rows = 0
+
+    def write(self, wavelengths, spectrum, timestamp):
+        acquired = datetime.fromtimestamp(timestamp)
+        filename = os.path.join(self.directory, acquired.strftime('spectrum_%Y%m%d_%H%M%S_%f.csv'))
+        metadata = dict(self.metadata, Acquired=acquired.isoformat(timespec='milliseconds'))
+        self.exporter.submit(save_with_metadata, wavelengths, spectrum.copy(), filename=filename,
+                             metadata=metadata, spectra=1)
+        self.rows += 1
+
+    def close(self):
+        self.exporter.stop()
+
+class Sinks:
+    """Hand every spectrum to several sinks."""
+
+    def __init__(self, sinks):
+        self.sinks = list(sinks)
+
+    def write(self, wavelengths, spectrum, timestamp):
+        for sink in self.sinks:
+            sink.write(wavelengths, spectrum, timestamp)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+class HeadlessAcquisition:
+    """Acquire, average, correct and write spectra at a fixed rate.
+
+    Every ``scans`` raw frames are averaged on the engine's reader thread
+    and corrected there with ``correction_pipeline(dark, reference)``.
+    ``run()`` hands the newest processed spectrum to ``sink.write(
+    wavelengths, spectrum, timestamp)`` once per ``1 / rate`` seconds;
+    spectra superseded in between are counted in ``skipped``. With
+    ``rate=0`` every processed spectrum is written as soon as it is ready.
+
+    With a ``peak_tracker`` (see backend.peaks.PeakTracker) every processed
+    spectrum, written or not, is also fed to the tracker on the reader
+    thread, and the peaks of each written spectrum go to
+    ``peak_sink.write(peaks, timestamp)``.
+
+    ``trigger_mode`` is passed on to the AcquisitionEngine; in the external
+    modes a spectrum is only read after a trigger pulse, so spectra come at
+    the trigger rate and ``rate=0`` writes every one of them.
+    """
+
+    def __init__(self, profile, sink, rate=1.0, scans=10, integration_time_us=None, dark=None,
+                 reference=None, pipeline_depth=2, peak_tracker=None, peak_sink=None, trigger_mode='normal'):
+        self.profile = profile
+        self.sink = sink
+        self.peak_tracker = peak_tracker
+        self.peak_sink = peak_sink
+        self.rate = rate
+        self.dark = dark
+        self.reference = reference
+        self.pipeline = correction_pipeline(dark, reference)
+        self.engine = AcquisitionEngine(profile, scans_to_average=scans, processor=self._process,
+                                        pipeline_depth=pipeline_depth, trigger_mode=trigger_mode)
+        if integration_time_us:
+            self.engine.set_integration_time(integration_time_us)
+        self.written = 0
+        self.skipped = 0
+        self._wavelengths = None
+        self._stop_event = threading.Event()
+
+    def collect_dark(self, scans=20):
+        """Average ``scans`` scans with the light blocked and use them as the dark spectrum."""
+        self.dark = read_average(self.profile, scans, integration_time_us=self.engine.integration_time_us).mean()
+        self.pipeline = correction_pipeline(self.dark, self.reference)
+        return self.dark
+
+    def collect_reference(self, scans=10):
+        """Average ``scans`` dark-corrected scans of the white reference and switch to reflectance."""
+        self.reference = read_average(self.profile, scans, dark=self.dark,
+                                      integration_time_us=self.engine.integration_time_us).mean()
+        self.pipeline = correction_pipeline(self.dark, self.reference)
+        return self.reference
+
+    def wavelengths(self, pixels):
+        if self._wavelengths is None or len(self._wavelengths) != pixels:
+            self._wavelengths = model_wavelengths(self.profile.model_name, pixels)
+        return self._wavelengths
+
+    def _process(self, averaged):
+        # Runs on the reader thread, right after the average is complete
+        spectrum = self.pipeline(averaged)
+        peaks = None
+        if self.peak_tracker is not None:
+            self.peak_tracker.wavelengths = self.wavelengths(len(spectrum))
+            peaks = self.peak_tracker.update(spectrum)
+        return time.time(), spectrum, peaks
+
+    def stop(self):
+        """Make run() return after the spectrum it is waiting for."""
+        self._stop_event.set()
+
+    def run(self, count=None, duration=None):
+        """Write spectra until ``count`` are written, ``duration`` seconds pass or stop() is called.
+
+        Returns the number of spectra written.
+        """
+        period = 1.0 / self.rate if self.rate else 0.0
+        self._stop_event.clear()
+        started = time.monotonic()
+        deadline = started + duration if duration is not None else None
+        due = started
+        sequence = 0
+        self.engine.start()
+        try:
+            while not self._stop_event.is_set() and (count is None or self.written < count):
+                now = time.monotonic()
+                if deadline is not None and now >= deadline:
+                    break
+                if due > now and self._stop_event.wait(due - now):
+                    break
+                timeout = 0.5 if deadline is None else max(0.0, min(0.5, deadline - time.monotonic()))
+                latest, result = self.engine.wait_latest(sequence, timeout)
+                if latest == sequence:
+                    if not self.engine.running:
+                        break  # the reader gave up on a failing device
+                    continue
+                if sequence:
+                    self.skipped += latest - sequence - 1
+                sequence = latest
+                timestamp, spectrum, peaks = result
+                self.sink.write(self.wavelengths(len(spectrum)), spectrum, timestamp)
+                if peaks is not None and self.peak_sink is not None:
+                    self.peak_sink.write(peaks, timestamp)
+                self.written += 1
+                # A slow average delays the schedule instead of causing a burst of writes
+                due = max(due + period, time.monotonic())
+        finally:
+            self.engine.stop()
+        return self.written
+
+def _load_spectrum(filename):
+    wavelengths, intensities, _ = load_from_csv(filename, dtype='float64')
+    if wavelengths is None:
+        raise SystemExit(f"Could not read a spectrum from {filename}")
+    return intensities
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='main.py --headless',
+                                     description='Acquire and write processed spectra without the GUI.')
+    parser.add_argument('--rate', type=float, default=1.0,
+                        help='spectra written per second (0 writes every averaged spectrum)')
+    parser.add_argument('--scans', type=int, default=10, help='scans averaged per spectrum')
+    parser.add_argument('--integration-time', type=float, default=100, help='integration time in ms')
+    parser.add_argument('--count', type=int, help='stop after this many spectra')
+    parser.add_argument('--duration', type=float, help='stop after this many seconds')
+    parser.add_argument('--dark', help='dark spectrum CSV (as saved by the GUI) to subtract')
+    parser.add_argument('--reference', help='white reference CSV; output becomes reflectance (%%)')
+    parser.add_argument('-o', '--output',
+                        help='CSV file to write, or - for stdout (the default unless streaming)')
+    parser.add_argument('--output-dir', help='save every spectrum to its own CSV in this directory')
+    parser.add_argument('--tcp-port', type=int, help='publish spectra to clients on this TCP port')
+    parser.add_argument('--unix-socket', help='publish spectra to clients on this Unix socket')
+    parser.add_argument('--websocket-port', type=int, help='publish spectra to WebSocket clients on this port')
+    parser.add_argument('--host', default='127.0.0.1', help='address the TCP and WebSocket ports listen on')
+    parser.add_argument('--pipeline-depth', type=int, default=2, help='spectrum requests kept queued')
+    parser.add_argument('--trigger', choices=sorted(trigger_modes), default='normal',
+                        help='trigger mode; the external modes read a spectrum per trigger pulse')
+    parser.add_argument('--peaks', help='track peaks and write them to this CSV file (- for stderr)')
+    parser.add_argument('--peak-height', type=float, help='minimum height of a tracked peak')
+    parser.add_argument('--peak-prominence', type=float, help='minimum prominence of a tracked peak')
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    stdout = sys.stdout
+    # Spectra may go to stdout, so every status message goes to stderr
+    with contextlib.redirect_stdout(sys.stderr):
+        profile = find_spectrometer()
+        if not profile.usb_device:
+            print("No spectrometer found")
+            return 1
+        dark = _load_spectrum(args.dark) if args.dark else None
+        reference = _load_spectrum(args.reference) if args.reference else None
+
+        metadata = {
+            'Device': profile.model_name,
+            'Integration time': f'{args.integration_time:g} ms',
+            'Scans averaged': args.scans,
+            'Trigger mode': args.trigger,
+            'Dark corrected': dark is not None,
+            'Units': 'Reflectance (%)' if reference is not None else 'Counts',
+        }
+        sinks = []
+        streaming = any(option is not None for option in (args.tcp_port, args.unix_socket, args.websocket_port))
+        if streaming:
+            from backend.streaming import FLAG_REFLECTANCE, SpectrumServer
+            server = SpectrumServer(args.tcp_port, args.unix_socket, args.websocket_port, host=args.host,
+                                    flags=FLAG_REFLECTANCE if reference is not None else 0)
+            server.start()
+            print(f"Publishing spectra on {server.addresses}")
+            sinks.append(server)
+        if args.output_dir:
+            sinks.append(SpectrumFiles(args.output_dir, metadata))
+        if args.output == '-' or (args.output is None and not streaming and not args.output_dir):
+            sinks.append(CsvStream(stdout, metadata))
+        elif args.output is not None:
+            sinks.append(CsvStream(open(args.output, 'w', newline=''), metadata, close_stream=True))
+        sink = Sinks(sinks)
+        peak_tracker = peak_sink = None
+        if args.peaks:
+            peak_tracker = PeakTracker(height=args.peak_height, prominence=args.peak_prominence)
+            if args.peaks == '-':
+                peak_sink = PeakStream(sys.stderr)
+            else:
+                peak_sink = PeakStream(open(args.peaks, 'w', newline=''), close_stream=True)
+
+        service = HeadlessAcquisition(profile, sink, rate=args.rate, scans=args.scans,
+                                      integration_time_us=int(args.integration_time * 1000), dark=dark,
+                                      reference=reference, pipeline_depth=args.pipeline_depth,
+                                      peak_tracker=peak_tracker, peak_sink=peak_sink, trigger_mode=args.trigger)
+        # Schedulers stop services with SIGTERM
+        signal.signal(signal.SIGTERM, lambda signum, frame: service.stop())
+        started = time.monotonic()
+        try:
+            service.run(args.count, args.duration)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            sink.close()
+            if peak_sink is not None:
+                peak_sink.close()
+            drop_spectrometer(profile.usb_device)
+        elapsed = time.monotonic() - started
+        print(f"Wrote {service.written} spectra in {elapsed:.1f} s ({service.skipped} superseded, "
+              f"{service.engine.frames_read} frames read at {service.engine.frame_rate:.1f} frames/s)")
+        if service.pipeline.runs:
+            print(f"Processing per spectrum: {service.pipeline.timing_summary()}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
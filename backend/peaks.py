@@ -0,0 +1,274 @@
+"""Peak detection, sub-pixel refinement and frame-to-frame tracking.
+
+Peaks are returned as structured arrays of PEAK_DTYPE. ``position`` is the
+sub-pixel peak position in pixels and ``wavelength`` the matching
+wavelength; ``spectrum`` is the row of a 2-D batch and ``track`` the
+PeakTracker track id (both -1 when unused).
+"""
+import numpy as np
+from scipy.signal import find_peaks, peak_prominences, peak_widths
+
+PEAK_DTYPE = np.dtype([
+    ('spectrum', np.int64),
+    ('track', np.int64),
+    ('index', np.int64),
+    ('position', np.float64),
+    ('wavelength', np.float64),
+    ('height', np.float64),
+    ('prominence', np.float64),
+    ('width', np.float64),
+])
+
+INTERPOLATIONS = (None, 'parabolic', 'centroid')
+
+def refine_positions(spectrum, indices, method='parabolic', radius=2, rows=None):
+    """Sub-pixel positions for integer peak ``indices``.
+
+    ``parabolic`` fits a parabola through each peak and its two neighbours;
+    ``centroid`` takes the intensity-weighted mean over ``radius`` pixels
+    on each side (above the window minimum). For a 2-D stack, ``rows`` gives
+    the row of every index.
+    """
+    spectra = np.atleast_2d(np.asarray(spectrum, dtype=np.float64))
+    indices = np.asarray(indices, dtype=np.int64)
+    rows = np.zeros(len(indices), dtype=np.int64) if rows is None else np.asarray(rows)
+    positions = indices.astype(np.float64)
+    if method is None or len(indices) == 0:
+        return positions
+    last = spectra.shape[-1] - 1
+    if method == 'parabolic':
+        inner = (indices > 0) & (indices < last)
+        i, r = indices[inner], rows[inner]
+        left, centre, right = spectra[r, i - 1], spectra[r, i], spectra[r, i + 1]
+        curvature = left - 2 * centre + right
+        offset = np.zeros(len(i))
+        np.divide(0.5 * (left - right), curvature, out=offset, where=curvature < 0)
+        positions[inner] += np.minimum(np.maximum(offset, -0.5), 0.5)
+        return positions
+    if method == 'centroid':
+        window = np.minimum(np.maximum(indices[:, None] + np.arange(-radius, radius + 1), 0), last)
+        values = spectra[rows[:, None], window]
+        weights = values - values.min(axis=1, keepdims=True)
+        total = weights.sum(axis=1)
+        return np.divide((weights * window).sum(axis=1), total, out=positions, where=total > 0)
+    raise ValueError(f"Unknown interpolation {method!r}; use one of {INTERPOLATIONS}")
+
+def _records(spectra, indices, wavelengths, interpolation, prominences, widths, rows=None):
+    """Build PEAK_DTYPE records for ``indices`` of a spectrum (or of ``rows`` of a stack)."""
+    spectra = np.atleast_2d(spectra)
+    peaks = np.empty(len(indices), dtype=PEAK_DTYPE)
+    peaks['spectrum'] = -1 if rows is None else rows
+    peaks['track'] = -1
+    peaks['index'] = indices
+    positions = refine_positions(spectra, indices, interpolation, rows=rows)
+    peaks['position'] = positions
+    if wavelengths is None:
+        peaks['wavelength'] = positions
+    else:
+        peaks['wavelength'] = np.interp(positions, np.arange(len(wavelengths)), wavelengths)
+    peaks['height'] = spectra[0 if rows is None else rows, indices]
+    peaks['prominence'] = prominences
+    peaks['width'] = widths
+    return peaks
+
+def _find(spectrum, height, prominence, width, distance):
+    indices, properties = find_peaks(spectrum, height=height, prominence=prominence, width=width,
+                                     distance=distance)
+    if 'widths' in properties:
+        return indices, properties['prominences'], properties['widths']
+    if 'prominences' in properties:
+        prominence_data = (properties['prominences'], properties['left_bases'], properties['right_bases'])
+    else:
+        prominence_data = peak_prominences(spectrum, indices)
+    widths = peak_widths(spectrum, indices, rel_height=0.5, prominence_data=prominence_data)[0]
+    return indices, prominence_data[0], widths
+
+def detect_peaks(spectrum, wavelengths=None, height=None, prominence=None, width=None, distance=None,
+                 interpolation='parabolic'):
+    """Find peaks in one spectrum with scipy's ``find_peaks`` criteria."""
+    spectrum = np.asarray(spectrum, dtype=np.float64)
+    indices, prominences, widths = _find(spectrum, height, prominence, width, distance)
+    return _records(spectrum, indices, wavelengths, interpolation, prominences, widths)
+
+def detect_peaks_batch(spectra, wavelengths=None, height=None, prominence=None, width=None,
+                       distance=None, interpolation='parabolic'):
+    """Find peaks in every row of an (N, pixels) stack; returns one PEAK_DTYPE array.
+
+    Rising edges above the height threshold are found for all rows at once,
+    so rows that cannot contain a peak (flat, dark or below ``height``) never
+    reach the per-row scipy search, and the records of all rows are built
+    in one pass.
+    """
+    spectra = np.atleast_2d(np.asarray(spectra, dtype=np.float64))
+    rising = spectra[:, 1:-1] > spectra[:, :-2]
+    low = height[0] if isinstance(height, tuple) else height
+    if low is not None:
+        rising &= spectra[:, 1:-1] >= low
+    rows = np.flatnonzero(rising.any(axis=1))
+
+    found = [_find(spectra[row], height, prominence, width, distance) for row in rows]
+    if not found:
+        return np.empty(0, dtype=PEAK_DTYPE)
+    indices, prominences, widths = (np.concatenate(column) for column in zip(*found))
+    peak_rows = np.repeat(rows, [len(item[0]) for item in found])
+    return _records(spectra, indices, wavelengths, interpolation, prominences, widths, rows=peak_rows)
+
+class PeakTracker:
+    """Follow peaks from one live frame to the next.
+
+    The first frame (and every ``full_search_interval``-th frame) is searched
+    completely. In between, only pixels that changed by more than
+    ``change_threshold`` since the previous frame are looked at: a tracked
+    peak whose neighbourhood did not change is carried over untouched, a
+    peak whose neighbourhood changed is re-located within
+    ``search_radius`` pixels, and new local maxima are only looked for in
+    changed regions. Peaks keep their ``track`` id while they can be
+    followed.
+
+    By default (``change_threshold=None``) the threshold is ``noise_factor``
+    times the detector noise, estimated from the difference between two
+    frames (median absolute deviation) at every full search; pixel noise
+    alone then rarely counts as a change. Pass a number to fix it instead.
+    """
+
+    def __init__(self, wavelengths=None, height=None, prominence=None, width=None, search_radius=5,
+                 change_threshold=None, full_search_interval=100, interpolation='parabolic', noise_factor=8.0):
+        self.wavelengths = wavelengths
+        self.height = height
+        self.prominence = prominence
+        self.width = width
+        self.search_radius = search_radius
+        self.change_threshold = change_threshold
+        self.full_search_interval = full_search_interval
+        self.interpolation = interpolation
+        self.noise_factor = noise_factor
+        self.noise = None
+        self.peaks = np.empty(0, dtype=PEAK_DTYPE)
+        self.previous = None
+        self.next_track = 0
+        self.frames = 0
+        self.full_searches = 0
+        self.peaks_reused = 0
+        self.peaks_searched = 0
+
+    def reset(self):
+        self.peaks = np.empty(0, dtype=PEAK_DTYPE)
+        self.previous = None
+        self.noise = None
+
+    @property
+    def threshold(self):
+        """The change threshold in use (None until the noise has been estimated)."""
+        if self.change_threshold is not None:
+            return self.change_threshold
+        return None if self.noise is None else self.noise_factor * self.noise
+
+    def _estimate_noise(self, spectrum):
+        # 1.4826 * MAD is sigma for Gaussian noise; a difference of two frames carries it twice
+        difference = np.abs(spectrum - self.previous)
+        self.noise = 1.4826 * float(np.median(difference)) / np.sqrt(2)
+
+    def _accept(self, spectrum, indices):
+        """Filter candidate indices by the configured criteria; returns (indices, prominences, widths)."""
+        if len(indices) == 0:
+            return indices, np.empty(0), np.empty(0)
+        keep = np.ones(len(indices), dtype=bool)
+        if self.height is not None:
+            keep &= spectrum[indices] >= self.height
+        prominence_data = peak_prominences(spectrum, indices)
+        prominences = prominence_data[0]
+        if self.prominence is not None:
+            keep &= prominences >= self.prominence
+        widths = peak_widths(spectrum, indices, rel_height=0.5, prominence_data=prominence_data)[0]
+        if self.width is not None:
+            keep &= widths >= self.width
+        return indices[keep], prominences[keep], widths[keep]
+
+    def _new_tracks(self, count):
+        tracks = np.arange(self.next_track, self.next_track + count)
+        self.next_track += count
+        return tracks
+
+    def _full_search(self, spectrum):
+        peaks = detect_peaks(spectrum, self.wavelengths, self.height, self.prominence, self.width,
+                             interpolation=self.interpolation)
+        # Keep the ids of peaks that are still within reach of an old track
+        peaks['track'] = -1
+        if len(self.peaks) and len(peaks):
+            distance = np.abs(peaks['position'][:, None] - self.peaks['position'][None, :])
+            nearest = distance.argmin(axis=1)
+            close = distance[np.arange(len(peaks)), nearest] <= self.search_radius
+            taken = set()
+            for i in np.flatnonzero(close):
+                track = self.peaks['track'][nearest[i]]
+                if track not in taken:
+                    peaks['track'][i] = track
+                    taken.add(track)
+        unassigned = peaks['track'] < 0
+        peaks['track'][unassigned] = self._new_tracks(int(unassigned.sum()))
+        self.full_searches += 1
+        self.peaks_searched += len(peaks)
+        return peaks
+
+    def update(self, spectrum):
+        """Process the next frame and return its peaks (a PEAK_DTYPE array)."""
+        spectrum = np.asarray(spectrum, dtype=np.float64)
+        full = (self.previous is None or len(self.previous) != len(spectrum)
+                or (self.full_search_interval and self.frames % self.full_search_interval == 0))
+        self.frames += 1
+        if self.change_threshold is None and self.previous is not None and len(self.previous) == len(spectrum) \
+                and (full or self.noise is None):
+            self._estimate_noise(spectrum)
+        if full:
+            self.peaks = self._full_search(spectrum)
+            self.previous = spectrum.copy()
+            return self.peaks
+
+        changed = np.flatnonzero(np.abs(spectrum - self.previous) > self.threshold)
+        if len(changed) == 0:
+            self.peaks_reused += len(self.peaks)
+            return self.peaks
+        self.previous[changed] = spectrum[changed]
+        radius = self.search_radius
+        last = len(spectrum) - 1
+
+        # A tracked peak moved if any pixel within search_radius of it changed
+        old = self.peaks
+        first = np.searchsorted(changed, old['index'] - radius)
+        moved = first < len(changed)
+        moved[moved] = changed[first[moved]] <= old['index'][moved] + radius
+        kept = old[~moved]
+        self.peaks_reused += len(kept)
+
+        # Moved peaks are re-located at the highest pixel within search_radius
+        window = np.minimum(np.maximum(old['index'][moved][:, None] + np.arange(-radius, radius + 1), 0), last)
+        located = window[np.arange(len(window)), spectrum[window].argmax(axis=1)]
+        # New peaks can only appear at or next to a changed pixel
+        fresh = np.minimum(np.maximum(np.concatenate((changed - 1, changed, changed + 1)), 1), last - 1)
+        known = np.concatenate((kept['index'], located))
+        if len(known):
+            known.sort()
+            nearest = np.searchsorted(known, fresh - radius)
+            fresh = fresh[(nearest == len(known)) | (known[np.minimum(nearest, len(known) - 1)] > fresh + radius)]
+        candidates = np.concatenate((located, fresh))
+        tracks = np.concatenate((old['track'][moved], np.full(len(fresh), -1)))
+        candidates, first = np.unique(candidates, return_index=True)
+        tracks = tracks[first]
+
+        inner = (candidates > 0) & (candidates < last)
+        candidates, tracks = candidates[inner], tracks[inner]
+        is_peak = (spectrum[candidates] > spectrum[candidates - 1]) & (spectrum[candidates] >= spectrum[candidates + 1])
+        candidates, tracks = candidates[is_peak], tracks[is_peak]
+        accepted, prominences, widths = self._accept(spectrum, candidates)
+        tracks = tracks[np.searchsorted(candidates, accepted)]
+        new = tracks < 0
+        tracks[new] = self._new_tracks(int(new.sum()))
+        self.peaks_searched += len(accepted)
+
+        peaks = np.empty(len(kept) + len(accepted), dtype=PEAK_DTYPE)
+        peaks[:len(kept)] = kept
+        found = peaks[len(kept):]
+        found[:] = _records(spectrum, accepted, self.wavelengths, self.interpolation, prominences, widths)
+        found['track'] = tracks
+        self.peaks = peaks[np.argsort(peaks['index'], kind='stable')]
+        return self.peaks
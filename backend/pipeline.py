@@ -0,0 +1,300 @@
+"""Composable processing pipeline for live frames and archived batches.
+
+A ``Pipeline`` is built once from a list of stages, for example::
+
+    Pipeline([DarkStage(dark), ReferenceStage(reference), SmoothStage('savgol'),
+              BaselineStage(2), NormalizeStage(), FeaturesStage()])
+
+``prepare(pixels)`` validates every stage against the pixel count, fuses
+neighbouring stages that can share one pass (dark + reference) and
+allocates two float64 scratch buffers that the stages ping-pong between,
+so running a frame allocates nothing per stage. ``run()`` takes a single
+spectrum or an (N, pixels) batch and processes all rows at once; a
+pipeline is callable, so it can be handed to ``AcquisitionEngine`` as its
+processor.
+"""
+import time
+import numpy as np
+from backend.smoothing import boxcar, SMOOTHERS
+from data_processing import DataProcessor, _baseline_basis
+from utils import compile_formula
+
+class Stage:
+    """One processing step working along the last axis.
+
+    ``apply(data, out)`` writes its result into ``out`` and returns it.
+    Stages marked ``in_place`` also work when ``out`` is ``data``; the
+    pipeline gives the others a separate buffer.
+    """
+    name = 'stage'
+    in_place = True
+    terminal = False
+    pixels = None
+
+    def prepare(self, pixels):
+        """Check the stage against the pixel count (raise ValueError) and cache what it needs."""
+        if self.pixels is not None and self.pixels != pixels:
+            raise ValueError(f"{self.name} stage has {self.pixels} points, data has {pixels}")
+
+    def fuse(self, following):
+        """Return a single stage doing ``self`` then ``following``, or None."""
+        return None
+
+    def apply(self, data, out):
+        raise NotImplementedError
+
+class DarkStage(Stage):
+    """Subtract a dark spectrum and clip negative counts to zero."""
+    name = 'dark'
+
+    def __init__(self, dark):
+        self.dark = np.array(dark, dtype=np.float64)
+        self.pixels = len(self.dark)
+
+    def fuse(self, following):
+        if isinstance(following, ReferenceStage):
+            return DarkReferenceStage(self, following)
+        return None
+
+    def apply(self, data, out):
+        np.subtract(data, self.dark, out=out)
+        np.maximum(out, 0, out=out)
+        return out
+
+class ReferenceStage(Stage):
+    """Scale counts to reflectance (%) against a reference, clipped to 0-100."""
+    name = 'reference'
+
+    def __init__(self, reference):
+        reference = np.asarray(reference, dtype=np.float64)
+        self.scale = np.zeros(len(reference))
+        np.divide(100.0, reference, out=self.scale, where=reference > 0)
+        self.pixels = len(reference)
+
+    def apply(self, data, out):
+        np.multiply(data, self.scale, out=out)
+        np.clip(out, 0, 100, out=out)
+        return out
+
+class DarkReferenceStage(Stage):
+    """Dark subtraction and reflectance in one pass.
+
+    The reference scale is never negative, so clipping once to 0-100 after
+    scaling gives the same result as clipping the dark-corrected counts at
+    zero first.
+    """
+    name = 'dark+reference'
+
+    def __init__(self, dark_stage, reference_stage):
+        if dark_stage.pixels != reference_stage.pixels:
+            raise ValueError(f"Reference has {reference_stage.pixels} points, dark has {dark_stage.pixels}")
+        self.dark = dark_stage.dark
+        self.scale = reference_stage.scale
+        self.pixels = dark_stage.pixels
+
+    def apply(self, data, out):
+        np.subtract(data, self.dark, out=out)
+        np.multiply(out, self.scale, out=out)
+        np.clip(out, 0, 100, out=out)
+        return out
+
+class SmoothStage(Stage):
+    """Smooth with one of backend.smoothing.SMOOTHERS (boxcar runs in place)."""
+    name = 'smooth'
+
+    def __init__(self, method='boxcar', **options):
+        if method not in SMOOTHERS:
+            raise ValueError(f"Unknown smoothing method {method!r}; use one of {sorted(SMOOTHERS)}")
+        self.method = method
+        self.options = options
+        self.function = SMOOTHERS[method]
+
+    def prepare(self, pixels):
+        window = self.options.get('width', self.options.get('window_length'))
+        if window is not None and window > pixels:
+            raise ValueError(f"Smoothing window {window} is longer than the {pixels} point spectrum")
+
+    def apply(self, data, out):
+        if self.function is boxcar:
+            return boxcar(data, out=out, **self.options)
+        out[...] = self.function(data, **self.options)
+        return out
+
+class BaselineStage(Stage):
+    """Subtract a least-squares polynomial baseline from every row."""
+    name = 'baseline'
+    in_place = False
+
+    def __init__(self, degree=2):
+        self.degree = degree
+
+    def prepare(self, pixels):
+        if self.degree >= pixels:
+            raise ValueError(f"Baseline degree {self.degree} needs more than {pixels} points")
+        self.vandermonde, self.pinv = _baseline_basis(pixels, self.degree)
+
+    def apply(self, data, out):
+        coefficients = data @ self.pinv.T
+        np.matmul(coefficients, self.vandermonde.T, out=out)
+        np.subtract(data, out, out=out)
+        return out
+
+class NormalizeStage(Stage):
+    """Scale every row to 0-1 (flat rows become 0)."""
+    name = 'normalize'
+
+    def apply(self, data, out):
+        minimum = data.min(axis=-1, keepdims=True)
+        spread = data.max(axis=-1, keepdims=True) - minimum
+        spread[spread == 0] = np.inf
+        np.subtract(data, minimum, out=out)
+        np.divide(out, spread, out=out)
+        return out
+
+class FormulaStage(Stage):
+    """Apply a custom formula in ``x`` (see utils.compile_formula)."""
+    name = 'formula'
+
+    def __init__(self, formula):
+        self.formula = compile_formula(formula)
+
+    def apply(self, data, out):
+        out[...] = self.formula(data)
+        return out
+
+class FeaturesStage(Stage):
+    """Final stage returning DataProcessor.extract_features records."""
+    name = 'features'
+    terminal = True
+
+    def apply(self, data, out=None):
+        return DataProcessor.extract_features(data)
+
+class Pipeline:
+    """Run a fixed list of stages over single spectra or (N, pixels) batches.
+
+    Set ``timed=True`` to collect per-stage timings, read with ``timings()``.
+    """
+
+    def __init__(self, stages, pixels=None, timed=False):
+        self.stages = list(stages)
+        for stage in self.stages[:-1]:
+            if stage.terminal:
+                raise ValueError(f"{stage.name} stage must be the last stage")
+        self.timed = timed
+        self.pixels = None
+        self._prepared = []
+        self._buffers = None
+        self._timings = {}
+        self.runs = 0
+        if pixels is not None:
+            self.prepare(pixels)
+
+    @property
+    def stage_names(self):
+        """Names of the stages as they run (after fusion)."""
+        return [stage.name for stage in self._prepared or self.stages]
+
+    def matches(self, frame):
+        """Return True if the pipeline can process frames of this length."""
+        pixels = np.shape(frame)[-1]
+        return all(stage.pixels is None or stage.pixels == pixels for stage in self.stages)
+
+    def prepare(self, pixels, rows=1):
+        """Validate and fuse the stages for ``pixels`` points and allocate scratch buffers."""
+        for stage in self.stages:
+            stage.prepare(pixels)
+        prepared = []
+        for stage in self.stages:
+            fused = prepared[-1].fuse(stage) if prepared else None
+            if fused is not None:
+                fused.prepare(pixels)
+                prepared[-1] = fused
+            else:
+                prepared.append(stage)
+        self._prepared = prepared
+        self.pixels = pixels
+        self._buffers = (np.empty((rows, pixels)), np.empty((rows, pixels)))
+        self._timings = {stage.name: [0, 0.0, 0.0] for stage in prepared}
+
+    def run(self, data, out=None, taps=None):
+        """Process ``data`` and return the result (a new array unless ``out`` is given).
+
+        ``taps`` maps stage names to arrays that receive a copy of that
+        stage's output, e.g. the dark-corrected counts of a live frame.
+        """
+        data = np.asarray(data)
+        batch = data.reshape(-1, data.shape[-1])
+        rows, pixels = batch.shape
+        if pixels != self.pixels:
+            self.prepare(pixels, rows)
+        elif rows > len(self._buffers[0]):
+            self._buffers = (np.empty((rows, pixels)), np.empty((rows, pixels)))
+        buffers = (self._buffers[0][:rows], self._buffers[1][:rows])
+
+        current = batch
+        for stage in self._prepared:
+            start = time.perf_counter() if self.timed else 0.0
+            if stage.terminal:
+                current = stage.apply(current)
+            else:
+                if stage.in_place and current is not batch:
+                    target = current
+                else:
+                    target = buffers[1] if current is buffers[0] else buffers[0]
+                current = stage.apply(current, target)
+            if self.timed:
+                elapsed = time.perf_counter() - start
+                timing = self._timings[stage.name]
+                timing[0] += 1
+                timing[1] += elapsed
+                timing[2] = elapsed
+            if taps and stage.name in taps:
+                np.copyto(taps[stage.name], current.reshape(taps[stage.name].shape))
+        self.runs += 1
+
+        if self._prepared and self._prepared[-1].terminal:
+            return current[0] if data.ndim == 1 else current
+        # The scratch buffers are reused by the next run, so hand out a copy
+        if out is None:
+            out = np.empty(data.shape)
+        np.copyto(out, current.reshape(out.shape))
+        return out
+
+    __call__ = run
+
+    def timings(self):
+        """Return per-stage ``{'calls', 'total_ms', 'mean_ms', 'last_ms'}`` (needs ``timed=True``)."""
+        return {
+            name: {
+                'calls': calls,
+                'total_ms': total * 1e3,
+                'mean_ms': total / calls * 1e3 if calls else 0.0,
+                'last_ms': last * 1e3,
+            }
+            for name, (calls, total, last) in self._timings.items()
+        }
+
+    def timing_summary(self):
+        """One line with the mean time per run of every stage, e.g. for a status message."""
+        return ', '.join(f"{name} {timing['mean_ms']:.3f} ms" for name, timing in self.timings().items()
+                         if timing['calls'])
+
+def correction_pipeline(dark=None, reference=None, smoothing_width=3):
+    """The live processing chain: dark subtraction, boxcar smoothing, reflectance.
+
+    Stages whose spectrum is None are left out. A reference whose length
+    differs from the dark spectrum is ignored with a warning. The pipeline
+    is timed (a few perf_counter calls per frame), so ``timings()`` shows
+    what each stage costs on live frames.
+    """
+    if dark is not None and reference is not None and len(dark) != len(reference):
+        print(f"Warning: Reference has {len(reference)} points, dark has {len(dark)}; reflectance disabled")
+        reference = None
+    stages = []
+    if dark is not None:
+        stages.append(DarkStage(dark))
+    stages.append(SmoothStage('boxcar', width=smoothing_width))
+    if reference is not None:
+        stages.append(ReferenceStage(reference))
+    return Pipeline(stages, timed=True)
@@ -0,0 +1,313 @@
+"""Crash-safe time-series recording of every acquired frame (``.nirr``).
+
+Layout (little endian):
+
+    header        64 bytes, see HEADER below
+    wavelengths   float64[pixels]
+    metadata      UTF-8 JSON, zero padded to a 64-byte boundary
+    chunks        repeated until the end of the file
+
+Each chunk holds up to ``chunk_frames`` frames:
+
+    CHUNK_HEADER  magic, frame count n, CRC-32 of the payload
+    payload       float64[n] timestamps, uint32[n] integration times (us),
+                  uint32[n] scan counts, dtype[n, pixels] frames
+
+A chunk is only valid when it is complete and its CRC matches, so after a
+crash the readers stop at the last good chunk and ``recover_recording`` (or
+opening the file again with ``append=True``) cuts off the torn remainder.
+"""
+import json
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+import numpy as np
+from backend.spectrum_file import DTYPE_CODES, DTYPE_NAMES
+
+MAGIC = b'NIRR'
+VERSION = 1
+# magic, version, dtype code, pixels, chunk frames, metadata length, data offset
+HEADER = struct.Struct('<4sHHIIIQ')
+HEADER_SIZE = 64
+ALIGNMENT = 64
+CHUNK_MAGIC = b'CHNK'
+CHUNK_HEADER = struct.Struct('<4sII')
+
+def _payload_size(count, pixels, dtype):
+    return count * (8 + 4 + 4 + pixels * dtype.itemsize)
+
+class _Chunk:
+    """Preallocated buffers for one chunk of frames."""
+
+    def __init__(self, frames, pixels, dtype):
+        self.timestamps = np.zeros(frames, dtype='<f8')
+        self.integration_times = np.zeros(frames, dtype='<u4')
+        self.scans = np.zeros(frames, dtype='<u4')
+        self.frames = np.zeros((frames, pixels), dtype=dtype)
+        self.count = 0
+
+    def parts(self):
+        count = self.count
+        return (self.timestamps[:count], self.integration_times[:count], self.scans[:count],
+                self.frames[:count])
+
+class Recording:
+    """Read a ``.nirr`` file, stopping at the first incomplete or corrupt chunk.
+
+    Chunks are views into a read-only memory map, so iterating over hours
+    of frames does not load them all at once.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            header = f.read(HEADER_SIZE)
+            if len(header) < HEADER_SIZE or header[:4] != MAGIC:
+                raise ValueError(f"{filename} is not a recording")
+            _, version, dtype_code, pixels, chunk_frames, meta_length, data_offset = HEADER.unpack_from(header)
+            if version > VERSION or dtype_code not in DTYPE_CODES:
+                raise ValueError(f"Unsupported recording version {version}")
+            self.pixels = pixels
+            self.chunk_frames = chunk_frames
+            self.dtype = DTYPE_CODES[dtype_code]
+            self.data_offset = data_offset
+            self.wavelengths = np.frombuffer(f.read(pixels * 8), dtype='<f8')
+            self.metadata = json.loads(f.read(meta_length).decode('utf-8') or '{}')
+
+        size = os.path.getsize(filename)
+        self._map = np.memmap(filename, dtype=np.uint8, mode='r') if size > data_offset else None
+        self.chunk_offsets = []
+        self.count = 0
+        self.valid_end = data_offset
+        self.corrupt = False
+        offset = data_offset
+        while offset + CHUNK_HEADER.size <= size:
+            magic, count, crc = CHUNK_HEADER.unpack_from(self._map, offset)
+            end = offset + CHUNK_HEADER.size + _payload_size(count, pixels, self.dtype)
+            if magic != CHUNK_MAGIC or count == 0 or end > size:
+                break
+            if zlib.crc32(self._map[offset + CHUNK_HEADER.size:end]) != crc:
+                self.corrupt = True
+                break
+            self.chunk_offsets.append((offset, count))
+            self.count += count
+            offset = end
+        self.valid_end = offset
+        self.truncated = self.valid_end < size
+
+    def __len__(self):
+        return self.count
+
+    def _chunk(self, offset, count):
+        position = offset + CHUNK_HEADER.size
+        parts = []
+        for dtype, shape in (('<f8', (count,)), ('<u4', (count,)), ('<u4', (count,)),
+                             (self.dtype, (count, self.pixels))):
+            dtype = np.dtype(dtype)
+            length = int(np.prod(shape)) * dtype.itemsize
+            parts.append(np.frombuffer(self._map, dtype=dtype, count=int(np.prod(shape)),
+                                       offset=position).reshape(shape))
+            position += length
+        return tuple(parts)
+
+    def chunks(self):
+        """Yield ``(timestamps, integration_times_us, scans, frames)`` per chunk."""
+        for offset, count in self.chunk_offsets:
+            yield self._chunk(offset, count)
+
+    def read(self):
+        """Return all valid frames as ``(timestamps, integration_times_us, scans, frames)``."""
+        chunks = list(self.chunks())
+        if not chunks:
+            return (np.empty(0), np.empty(0, dtype='<u4'), np.empty(0, dtype='<u4'),
+                    np.empty((0, self.pixels), dtype=self.dtype))
+        return tuple(np.concatenate(part) for part in zip(*chunks))
+
+def load_recording(filename):
+    """Return ``(wavelengths, timestamps, integration_times_us, scans, frames, metadata)``."""
+    recording = Recording(filename)
+    timestamps, integration_times, scans, frames = recording.read()
+    return recording.wavelengths, timestamps, integration_times, scans, frames, recording.metadata
+
+def recover_recording(filename):
+    """Cut a torn or corrupt tail off a recording; returns the frames kept."""
+    recording = Recording(filename)
+    count, valid_end, truncated = recording.count, recording.valid_end, recording.truncated
+    del recording
+    if truncated:
+        print(f"Recovering {filename}: dropping {os.path.getsize(filename) - valid_end} bytes after frame {count}")
+        with open(filename, 'r+b') as f:
+            f.truncate(valid_end)
+    return count
+
+class SpectrumRecorder:
+    """Append every frame handed to ``record()`` to a ``.nirr`` file.
+
+    ``record()`` only copies the frame into a preallocated chunk, so it is
+    cheap enough to call from the acquisition thread at the device's full
+    frame rate. Full chunks are written (and fsynced every
+    ``fsync_interval`` seconds) by a writer thread. At most
+    ``max_pending_chunks`` chunks are buffered; if the disk falls that far
+    behind, frames are dropped and counted in ``dropped_frames`` rather
+    than stalling acquisition.
+    """
+
+    def __init__(self, filename, wavelengths=None, chunk_frames=64, fsync_interval=5.0, metadata=None,
+                 dtype='uint16', integration_time_us=0, scans=1, max_pending_chunks=8, append=False):
+        self.filename = filename
+        self.fsync_interval = fsync_interval
+        self.integration_time_us = integration_time_us
+        self.scans = scans
+
+        if append and os.path.exists(filename):
+            recover_recording(filename)
+            recording = Recording(filename)
+            self.pixels = recording.pixels
+            self.dtype = recording.dtype
+            self.chunk_frames = recording.chunk_frames
+            self.frames_written = recording.count
+            del recording
+            self._file = open(filename, 'r+b')
+            self._file.seek(0, os.SEEK_END)
+        else:
+            if wavelengths is None:
+                raise ValueError("wavelengths are required to create a recording")
+            if dtype not in DTYPE_NAMES:
+                raise ValueError(f"Unsupported dtype {dtype!r}; use one of {sorted(DTYPE_NAMES)}")
+            wavelengths = np.ascontiguousarray(wavelengths, dtype='<f8')
+            self.pixels = len(wavelengths)
+            self.dtype = DTYPE_CODES[DTYPE_NAMES[dtype]]
+            self.chunk_frames = chunk_frames
+            self.frames_written = 0
+
+            meta_bytes = json.dumps(metadata or {}, default=str).encode('utf-8')
+            meta_offset = HEADER_SIZE + wavelengths.nbytes
+            data_offset = -(-(meta_offset + len(meta_bytes)) // ALIGNMENT) * ALIGNMENT
+            self._file = open(filename, 'wb')
+            header = HEADER.pack(MAGIC, VERSION, DTYPE_NAMES[dtype], self.pixels, chunk_frames,
+                                 len(meta_bytes), data_offset)
+            self._file.write(header.ljust(HEADER_SIZE, b'\0'))
+            self._file.write(wavelengths.tobytes())
+            self._file.write(meta_bytes.ljust(data_offset - meta_offset, b'\0'))
+            self._file.flush()
+
+        self.frames_recorded = 0
+        self.dropped_frames = 0
+        self.chunks_written = 0
+        self.fsyncs = 0
+        self.write_time = 0.0
+        self._last_sync = time.monotonic()
+        self._free = queue.Queue()
+        for _ in range(max(1, max_pending_chunks)):
+            self._free.put(_Chunk(self.chunk_frames, self.pixels, self.dtype))
+        self._pending = queue.Queue()
+        self._current = None
+        self._closed = False
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='spectrum-recorder', daemon=True)
+        self._thread.start()
+
+    def record(self, frame, timestamp=None, integration_time_us=None, scans=None):
+        """Queue one frame; returns False if it had to be dropped."""
+        if len(frame) != self.pixels:
+            raise ValueError(f"Expected {self.pixels} points, got {len(frame)}")
+        with self._lock:
+            if self._closed:
+                return False
+            chunk = self._current
+            if chunk is None:
+                try:
+                    chunk = self._free.get_nowait()
+                except queue.Empty:
+                    self.dropped_frames += 1
+                    return False
+                chunk.count = 0
+                self._current = chunk
+
+            index = chunk.count
+            if self.dtype.kind == 'u' and np.asarray(frame).dtype.kind == 'f':
+                np.copyto(chunk.frames[index], np.clip(np.rint(frame), 0, np.iinfo(self.dtype).max),
+                          casting='unsafe')
+            else:
+                chunk.frames[index] = frame
+            chunk.timestamps[index] = time.time() if timestamp is None else timestamp
+            chunk.integration_times[index] = (self.integration_time_us if integration_time_us is None
+                                              else integration_time_us)
+            chunk.scans[index] = self.scans if scans is None else scans
+            chunk.count = index + 1
+            self.frames_recorded += 1
+
+            if chunk.count == self.chunk_frames:
+                self._current = None
+                self._pending.put(chunk)
+        return True
+
+    def on_frame(self, frame, timestamp):
+        """Frame callback for ``AcquisitionEngine.add_frame_callback``."""
+        self.record(frame, timestamp)
+
+    def flush(self):
+        """Write the partially filled chunk and wait for the writer."""
+        with self._lock:
+            chunk, self._current = self._current, None
+        if chunk is not None and chunk.count:
+            self._pending.put(chunk)
+        elif chunk is not None:
+            self._free.put(chunk)
+        self._pending.join()
+
+    def close(self):
+        """Write everything still buffered, fsync and close the file."""
+        if self._closed:
+            return
+        with self._lock:
+            self._closed = True
+        self.flush()
+        self._pending.put(None)
+        self._thread.join()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.fsyncs += 1
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _write_chunk(self, chunk):
+        parts = chunk.parts()
+        crc = 0
+        for part in parts:
+            crc = zlib.crc32(part, crc)
+        self._file.write(CHUNK_HEADER.pack(CHUNK_MAGIC, chunk.count, crc))
+        for part in parts:
+            self._file.write(part)
+        self.frames_written += chunk.count
+        self.chunks_written += 1
+
+        if self.fsync_interval is not None and time.monotonic() - self._last_sync >= self.fsync_interval:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.fsyncs += 1
+            self._last_sync = time.monotonic()
+
+    def _run(self):
+        while True:
+            chunk = self._pending.get()
+            try:
+                if chunk is None:
+                    return
+                start = time.perf_counter()
+                try:
+                    self._write_chunk(chunk)
+                except Exception as e:
+                    print(f"Error writing recording: {e}")
+                self.write_time += time.perf_counter() - start
+                self._free.put(chunk)
+            finally:
+                self._pending.task_done()
@@ -0,0 +1,193 @@
+import struct
+import threading
+import time
+from array import array
+import numpy as np
+import usb.core
+from config.ocean_optics_configs import vendor_ids, model_configs, command_set, trigger_modes
+from backend.spectrometer import END_MARKER, integration_time_config
+
+# Integration time the default signal level is calibrated for (microseconds)
+REFERENCE_INTEGRATION_TIME_US = 100000
+
+def _default_signal(pixels):
+    """Smooth lamp-like emission curve with a few absorption bands."""
+    x = np.linspace(0.0, 1.0, pixels)
+    lamp = 30000.0 * np.exp(-((x - 0.45) / 0.35) ** 2)
+    for center, depth, width in ((0.25, 0.35, 0.02), (0.55, 0.5, 0.03), (0.8, 0.25, 0.015)):
+        lamp *= 1.0 - depth * np.exp(-((x - center) / width) ** 2)
+    return lamp
+
+class SimulatedSpectrometer:
+    """Hardware-free stand-in for a pyusb ``Device`` of an Ocean Optics model.
+
+    It implements the small part of the pyusb surface the backend uses
+    (``idVendor``, ``idProduct``, ``set_configuration``, ``write`` and
+    ``read``) and answers the ``command_set`` protocol with correctly framed
+    spectra packets terminated by ``END_MARKER``.
+
+    ``noise`` is the standard deviation of the read noise in counts,
+    ``dark_offset`` the dark level, ``saturation`` the ADC full scale
+    (the model's by default),
+    ``latency`` an extra delay per request in seconds and ``frame_rate`` caps
+    the number of frames per second (otherwise the integration time does).
+    Requests are queued like on the real device, so pipelined requests
+    integrate back to back. In the external trigger modes a requested frame
+    only starts integrating when ``trigger()`` is called.
+    """
+
+    def __init__(self, model_name='NIRQUEST', noise=20.0, dark_offset=1500.0, saturation=None,
+                 latency=0.0, frame_rate=None, integration_time_us=10000, signal=None, seed=None,
+                 bus=0, address=1):
+        config = next((item for item in model_configs if item[1] == model_name), None)
+        if config is None:
+            raise ValueError(f'Unknown spectrometer model: {model_name}')
+        (device_ids, self.model_name, self.packet_size, self.cmd_ep_out, self.data_ep_in,
+         self.data_ep_in_size, self.spectra_ep_in, self.spectra_ep_in_size) = config
+
+        self.idVendor = vendor_ids['OCEANOPTICS_VENDOR']
+        self.idProduct = device_ids[0]
+        self.bus = bus
+        self.address = address
+        self.pixels = (self.packet_size - 1) // 2
+        self.integration_encoding = integration_time_config(self.model_name).encoding
+        if saturation is None:
+            saturation = integration_time_config(self.model_name).saturation
+
+        self.noise = noise
+        self.dark_offset = dark_offset
+        self.saturation = saturation
+        self.latency = latency
+        self.frame_rate = frame_rate
+        self.integration_time_us = integration_time_us
+        self.signal = _default_signal(self.pixels) if signal is None else np.asarray(signal, dtype=np.float64)
+        self.light_on = True
+        self.trigger_mode = trigger_modes['normal']
+
+        self.configured = False
+        self.requests = 0
+        self._rng = np.random.default_rng(seed)
+        self._pending = {}
+        self._frame_ready = []
+        self._last_frame_at = 0.0
+        self._awaiting_trigger = 0
+        self._triggered = threading.Event()
+        self._lock = threading.Lock()
+
+    def set_configuration(self, configuration=None):
+        self.configured = True
+
+    def dispose(self):
+        """Release the simulated device (mirrors usb.util.dispose_resources)."""
+        self.configured = False
+        with self._lock:
+            self._pending.clear()
+            self._frame_ready.clear()
+            self._awaiting_trigger = 0
+
+    def render_frame(self):
+        """Return one spectrum as uint16 counts for the current settings."""
+        scale = self.integration_time_us / REFERENCE_INTEGRATION_TIME_US
+        counts = self.dark_offset + (self.signal * scale if self.light_on else np.zeros(self.pixels))
+        if self.noise:
+            counts = counts + self._rng.normal(0.0, self.noise, self.pixels)
+        return np.clip(counts, 0, self.saturation).astype('<u2')
+
+    def _frame_period(self):
+        period = self.integration_time_us / 1e6
+        if self.frame_rate:
+            period = max(period, 1.0 / self.frame_rate)
+        return period
+
+    def write(self, endpoint, data, timeout=None):
+        data = bytes(data)
+        if not data:
+            return 0
+        command = data[0]
+        if command == command_set['SPECTR_INIT']:
+            self.dispose()
+            self.configured = True
+        elif command == command_set['SPECTR_SET_INTEGRATION_TIME']:
+            if self.integration_encoding == 'ms16':
+                self.integration_time_us = struct.unpack('<H', data[1:3].ljust(2, b'\0'))[0] * 1000
+            else:
+                self.integration_time_us = struct.unpack('<I', data[1:5].ljust(4, b'\0'))[0]
+        elif command == command_set['SPECTR_SET_TRIGGER_MODE']:
+            self.trigger_mode = struct.unpack('<H', data[1:3].ljust(2, b'\0'))[0]
+            with self._lock:
+                if self.trigger_mode not in (trigger_modes['external_sync'], trigger_modes['external_hardware']):
+                    # Requests still waiting for a trigger are served right away
+                    while self._awaiting_trigger:
+                        self._awaiting_trigger -= 1
+                        self._start_frame()
+        elif command == command_set['SPECTR_REQUEST_SPECTRA']:
+            self.requests += 1
+            with self._lock:
+                if self.trigger_mode in (trigger_modes['external_sync'], trigger_modes['external_hardware']):
+                    self._awaiting_trigger += 1
+                else:
+                    self._start_frame()
+        elif command == command_set['SPECTR_QUERY_STATUS']:
+            status = struct.pack('<HI', self.pixels, self.integration_time_us)
+            self._queue(self.data_ep_in, status)
+        return len(data)
+
+    def _start_frame(self):
+        # Called with the lock held; frames integrate one after the other
+        ready_at = max(time.perf_counter(), self._last_frame_at) + self._frame_period()
+        self._last_frame_at = ready_at
+        self._frame_ready.append(ready_at + self.latency)
+
+    def trigger(self):
+        """Simulate an external trigger pulse; returns False if no request was waiting for it."""
+        with self._lock:
+            if not self._awaiting_trigger:
+                return False
+            self._awaiting_trigger -= 1
+            self._start_frame()
+        self._triggered.set()
+        return True
+
+    def _queue(self, endpoint, payload):
+        with self._lock:
+            self._pending.setdefault(endpoint, bytearray()).extend(payload)
+
+    def read(self, endpoint, size_or_buffer, timeout=None):
+        size = size_or_buffer if isinstance(size_or_buffer, int) else len(size_or_buffer)
+        if endpoint == self.spectra_ep_in:
+            self._produce_frames(timeout)
+
+        with self._lock:
+            pending = self._pending.get(endpoint)
+            if not pending:
+                raise usb.core.USBTimeoutError('Operation timed out', 110, 110)
+            chunk = bytes(pending[:size])
+            del pending[:size]
+
+        if isinstance(size_or_buffer, int):
+            return array('B', chunk)
+        size_or_buffer[:len(chunk)] = array('B', chunk) if isinstance(size_or_buffer, array) else chunk
+        return len(chunk)
+
+    def _produce_frames(self, timeout):
+        """Render any requested frame whose integration has finished."""
+        with self._lock:
+            if self._pending.get(self.spectra_ep_in):
+                return
+            waiting = not self._frame_ready and self._awaiting_trigger
+            self._triggered.clear()
+        if waiting:
+            self._triggered.wait(None if timeout is None else timeout / 1000.0)
+        with self._lock:
+            if not self._frame_ready:
+                return
+            ready_at = self._frame_ready[0]
+        wait = ready_at - time.perf_counter()
+        if timeout is not None and wait > timeout / 1000.0:
+            time.sleep(timeout / 1000.0)
+            return
+        if wait > 0:
+            time.sleep(wait)
+        with self._lock:
+            self._frame_ready.pop(0)
+        self._queue(self.spectra_ep_in, self.render_frame().tobytes() + bytes([END_MARKER]))
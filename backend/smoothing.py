@@ -0,0 +1,97 @@
+from functools import lru_cache
+import numpy as np
+
+# All functions smooth along the last axis, so they accept a single spectrum
+# or a 2-D (spectra, pixels) batch. scipy is imported on first use: boxcar,
+# the live default, never needs it and scipy.signal is slow to import.
+
+def boxcar(data, width=3, out=None):
+    """Sliding-window mean in O(n) using a cumulative sum.
+
+    Matches the original per-pixel loop: the ``width // 2`` pixels at each
+    edge are left unsmoothed.
+    """
+    if width < 1 or width % 2 == 0:
+        raise ValueError("Boxcar width must be a positive odd number")
+    data = np.asarray(data, dtype=np.float64)
+    if out is None:
+        out = data.copy()
+    elif out is not data:
+        np.copyto(out, data)
+
+    pixels = data.shape[-1]
+    if width == 1 or pixels < width:
+        return out
+    half = width // 2
+    csum = np.zeros(data.shape[:-1] + (pixels + 1,))
+    np.cumsum(data, axis=-1, out=csum[..., 1:])
+    window_sums = np.subtract(csum[..., width:], csum[..., :-width])
+    np.divide(window_sums, width, out=out[..., half:pixels - half])
+    return out
+
+@lru_cache(maxsize=32)
+def _savgol_kernel(window_length, polyorder):
+    """Convolution coefficients plus edge projection matrices."""
+    from scipy.signal import savgol_coeffs
+    coeffs = savgol_coeffs(window_length, polyorder)
+    # Hat matrix of a least-squares polynomial fit over one window; its first
+    # and last rows evaluate the fit at the edge pixels (savgol 'interp' mode)
+    vander = np.vander(np.arange(window_length, dtype=np.float64), polyorder + 1)
+    hat = vander @ np.linalg.pinv(vander)
+    half = window_length // 2
+    for array in (coeffs, hat):
+        array.flags.writeable = False
+    return coeffs, hat[:half].T.copy(), hat[-half:].T.copy()
+
+def savitzky_golay(data, window_length=11, polyorder=3):
+    """Savitzky-Golay filter with cached kernels.
+
+    Equivalent to ``scipy.signal.savgol_filter(data, window_length,
+    polyorder)`` (mode 'interp'), but the convolution coefficients and edge
+    fit matrices are computed once per (window_length, polyorder).
+    """
+    if window_length % 2 == 0 or polyorder >= window_length:
+        raise ValueError("window_length must be odd and greater than polyorder")
+    data = np.asarray(data, dtype=np.float64)
+    if data.shape[-1] < window_length:
+        raise ValueError("window_length must be less than or equal to the number of points")
+    from scipy.ndimage import convolve1d
+    coeffs, left, right = _savgol_kernel(window_length, polyorder)
+    out = convolve1d(data, coeffs, axis=-1, mode='constant')
+    half = window_length // 2
+    # A one-point window has no edges (and out[..., -0:] would be everything)
+    if half:
+        out[..., :half] = data[..., :window_length] @ left
+        out[..., -half:] = data[..., -window_length:] @ right
+    return out
+
+@lru_cache(maxsize=32)
+def _gaussian_kernel(sigma, truncate):
+    radius = max(1, int(truncate * sigma + 0.5))
+    x = np.arange(-radius, radius + 1, dtype=np.float64)
+    kernel = np.exp(-0.5 * (x / sigma) ** 2)
+    kernel /= kernel.sum()
+    kernel.flags.writeable = False
+    return kernel
+
+def gaussian(data, sigma=1.0, truncate=4.0):
+    """Gaussian smoothing with a cached kernel; edges are extended with the nearest value."""
+    if sigma <= 0:
+        raise ValueError("sigma must be positive")
+    from scipy.ndimage import convolve1d
+    data = np.asarray(data, dtype=np.float64)
+    return convolve1d(data, _gaussian_kernel(float(sigma), float(truncate)), axis=-1, mode='nearest')
+
+SMOOTHERS = {
+    'boxcar': boxcar,
+    'savgol': savitzky_golay,
+    'gaussian': gaussian,
+}
+
+def smooth(data, method='boxcar', **kwargs):
+    """Smooth ``data`` with one of the methods in ``SMOOTHERS``."""
+    try:
+        smoother = SMOOTHERS[method]
+    except KeyError:
+        raise ValueError(f"Unknown smoothing method: {method}")
+    return smoother(data, **kwargs)
@@ -1,54 +1,166 @@
+import os
+import time
+from array import array
 import usb.core
 import usb.util
 import struct
+import numpy as np
 from collections import namedtuple
-from config.ocean_optics_configs import vendor_ids, model_configs, end_points, command_set
+from config.ocean_optics_configs import vendor_ids, model_configs, end_points, command_set, integration_time_configs, \
+    trigger_modes
+
+# Every spectra packet ends with this byte
+END_MARKER = 0x69
+
+# In these trigger modes a requested spectrum waits for a pulse on the trigger input
+EXTERNAL_TRIGGER_MODES = ('external_sync', 'external_hardware')
 
 # Definition of global named tuples in use
 Profile = namedtuple('Profile', 'usb_device, device_id, model_name, packet_size, cmd_ep_out, data_ep_in, '
                                 'data_ep_in_size, spectra_ep_in, spectra_ep_in_size')
+IntegrationTimeConfig = namedtuple('IntegrationTimeConfig', 'encoding, min_us, max_us, saturation')
+
+# Models missing from integration_time_configs use the common 32-bit microsecond protocol
+DEFAULT_INTEGRATION_TIME_CONFIG = IntegrationTimeConfig('us32', 1000, 65000000, 65535)
+
+# Model configurations indexed by USB product id, built once
+ModelConfig = namedtuple('ModelConfig', 'device_ids, model_name, packet_size, cmd_epo, data_epi, data_epi_size, '
+                                        'spect_epi, spect_epi_size')
+MODEL_CONFIGS_BY_PRODUCT_ID = {
+    device_id: config
+    for config in map(ModelConfig._make, model_configs)
+    for device_id in config.device_ids
+}
 
-def find_spectrometer():
-    spectrometer_profile = Profile(usb_device=None, device_id=None, model_name='unknown', packet_size=0,
-                                   cmd_ep_out=0, data_ep_in=0, data_ep_in_size=0, spectra_ep_in=0, spectra_ep_in_size=0)
+EMPTY_PROFILE = Profile(usb_device=None, device_id=None, model_name='unknown', packet_size=0,
+                        cmd_ep_out=0, data_ep_in=0, data_ep_in_size=0, spectra_ep_in=0, spectra_ep_in_size=0)
 
-    # Find any vendor devices
-    usb_devices = usb.core.find(find_all=True, idVendor=vendor_ids['OCEANOPTICS_VENDOR'])
+_simulated_devices = {}
+
+def _simulated_spectrometers(models):
+    """The simulated devices named by NIR_SIMULATED_SPECTROMETER (comma separated), created once."""
+    if models not in _simulated_devices:
+        from backend.simulator import SimulatedSpectrometer
+        _simulated_devices[models] = [SimulatedSpectrometer(model.strip(), address=address)
+                                      for address, model in enumerate(models.split(','), start=1)]
+    return _simulated_devices[models]
+
+def scan_usb_devices():
+    """Return the attached vendor devices with a known product id.
+
+    When the ``NIR_SIMULATED_SPECTROMETER`` environment variable names one
+    or more models (comma separated), simulated devices of those models are
+    returned instead of real hardware.
+    """
+    simulated_models = os.environ.get('NIR_SIMULATED_SPECTROMETER')
+    if simulated_models:
+        return list(_simulated_spectrometers(simulated_models))
+    try:
+        return list(usb.core.find(find_all=True, idVendor=vendor_ids['OCEANOPTICS_VENDOR'],
+                                  custom_match=lambda device: device.idProduct in MODEL_CONFIGS_BY_PRODUCT_ID))
+    except usb.core.NoBackendError as e:
+        print(f"USB backend unavailable: {e}")
+        return []
 
+def device_key(usb_device):
+    """Stable identity and sort key of an attached device: (bus, address, product id)."""
+    return (getattr(usb_device, 'bus', None) or 0, getattr(usb_device, 'address', None) or 0,
+            usb_device.idProduct)
+
+def make_profile(usb_device, configure=True):
+    """Return the Profile of a supported device (configuring it), or None if the model is unknown."""
+    config = MODEL_CONFIGS_BY_PRODUCT_ID.get(usb_device.idProduct)
+    if config is None:
+        return None
+    if configure:
+        usb_device.set_configuration()
+    return Profile(
+        usb_device=usb_device,
+        device_id=usb_device.idProduct,
+        model_name=config.model_name,
+        packet_size=config.packet_size,
+        cmd_ep_out=config.cmd_epo,
+        data_ep_in=config.data_epi,
+        data_ep_in_size=config.data_epi_size,
+        spectra_ep_in=config.spect_epi,
+        spectra_ep_in_size=config.spect_epi_size
+    )
+
+def enumerate_spectrometers(usb_devices=None):
+    """Return a Profile for every supported spectrometer, ordered by bus and address.
+
+    ``usb_devices`` overrides the bus scan (see scan_usb_devices) with any
+    iterable of device-like objects. A device that cannot be configured is
+    reported and skipped, so it never hides the others.
+    """
     if usb_devices is None:
+        usb_devices = scan_usb_devices()
+    profiles = []
+    for usb_device in sorted(usb_devices, key=device_key):
+        try:
+            profile = make_profile(usb_device)
+        except Exception as e:
+            # Busy (claimed by another program) or unplugged mid-scan
+            print(f"Error configuring device {device_key(usb_device)}: {e}")
+            continue
+        if profile is not None:
+            print(profile.model_name, 'found (Product Id: ' + hex(profile.device_id) + ')')
+            profiles.append(profile)
+    return profiles
+
+def find_spectrometer(usb_devices=None, required=False):
+    """Return the Profile of the first supported spectrometer.
+
+    ``usb_devices`` overrides the bus scan with any iterable of device-like
+    objects. Without a spectrometer an empty profile (``usb_device`` None)
+    is returned, or ValueError raised when ``required`` is set.
+    """
+    profiles = enumerate_spectrometers(usb_devices)
+    if profiles:
+        return profiles[0]
+    if required:
         raise ValueError('No Vendor Spectrometers found')
+    print('No Vendor Spectrometers found')
+    return EMPTY_PROFILE
+
+class DeviceScanner:
+    """Keep the set of attached spectrometers up to date.
 
-    # Load the Ocean Optics spectrometer configurations
-    ModelConfigs = namedtuple('ModelConfigs', 'device_ids, model_name, packet_size, cmd_epo, data_epi, data_epi_size, '
-                                              'spect_epi, spect_epi_size')
-    spectrometers = list(map(ModelConfigs._make, model_configs))
-
-    # We've found one or more spectrometers
-    for _usb_device in usb_devices:
-        print('Product Id: ' + hex(_usb_device.idProduct))
-
-        # Find device id in product_configs (we only use the first spectrometer found)
-        spectrometer = [item for item in spectrometers for id in item.device_ids if id == _usb_device.idProduct]
-        if spectrometer:
-            # Load in its configuration
-            spectrometer_profile = spectrometer_profile._replace(
-                usb_device=_usb_device,
-                device_id=_usb_device.idProduct,
-                model_name=spectrometer[0].model_name,
-                packet_size=spectrometer[0].packet_size,
-                cmd_ep_out=spectrometer[0].cmd_epo,
-                data_ep_in=spectrometer[0].data_epi,
-                data_ep_in_size=spectrometer[0].data_epi_size,
-                spectra_ep_in=spectrometer[0].spect_epi,
-                spectra_ep_in_size=spectrometer[0].spect_epi_size
-            )
-            print(spectrometer_profile.model_name, 'found ...')
-
-            # Use and set USB configuration for first spectrometer found
-            _usb_device.set_configuration()
-            break
-
-    return spectrometer_profile
+    ``rescan()`` lists the bus and only configures devices it has not seen
+    before; known devices keep their Profile (and open handles) untouched,
+    and unplugged ones are released. ``scan`` replaces the bus scan with any
+    callable returning device-like objects.
+    """
+
+    def __init__(self, scan=None):
+        self.scan = scan or scan_usb_devices
+        self.devices = {}
+
+    @property
+    def profiles(self):
+        """Profiles of the attached spectrometers, ordered by bus and address."""
+        return [self.devices[key] for key in sorted(self.devices)]
+
+    def rescan(self):
+        """Update the device list; returns ``(added_profiles, removed_profiles)``."""
+        attached = {device_key(usb_device): usb_device for usb_device in self.scan()}
+        removed = [self.devices.pop(key) for key in sorted(set(self.devices) - set(attached))]
+        for profile in removed:
+            print(profile.model_name, 'removed')
+            drop_spectrometer(profile.usb_device)
+        added = []
+        for key in sorted(set(attached) - set(self.devices)):
+            try:
+                profile = make_profile(attached[key])
+            except Exception as e:
+                # Busy or unplugged mid-scan; try again on the next rescan
+                print(f"Error configuring device {key}: {e}")
+                continue
+            if profile is not None:
+                print(profile.model_name, 'found (Product Id: ' + hex(profile.device_id) + ')')
+                self.devices[key] = profile
+                added.append(profile)
+        return added, removed
 
 def drop_spectrometer(usb_device):
     """Release resources for the spectrometer."""
@@ -57,7 +169,12 @@ def drop_spectrometer(usb_device):
         return  # Safely exit if usb_device is None
 
     try:
-        usb.util.dispose_resources(usb_device)
+        # Simulated devices release themselves
+        dispose = getattr(usb_device, 'dispose', None)
+        if dispose is not None:
+            dispose()
+        else:
+            usb.util.dispose_resources(usb_device)
         print("USB resources released successfully.")
     except Exception as e:
         print(f"Error releasing USB resources: {e}")
@@ -78,19 +195,12 @@ def request_spectrum(usb_device, packet_size, spectra_epi, commands_epo):
             print("No data received from spectrometer")
             return None
             
-        # Check for end marker - should be 0x69 at the end
-        if actual_size > 0 and received_data[actual_size - 1] != 0x69:
+        # Check for end marker and decode the 16-bit intensity values in one go
+        spectrum = decode_frame(received_data)
+        if spectrum is None:
             print("Invalid end marker in data")
             return None
-            
-        # Process the spectrum data with actual received size
-        spectrum = []
-        # Process 16-bit intensity values (2 bytes per point)
-        for i in range(0, actual_size-1, 2):
-            if i+1 < actual_size:
-                intensity = struct.unpack('<H', bytes([received_data[i], received_data[i+1]]))[0]
-                spectrum.append(intensity)
-        
+
         print(f"Successfully processed spectrum with {len(spectrum)} points")
         return spectrum
         
@@ -98,6 +208,185 @@ def request_spectrum(usb_device, packet_size, spectra_epi, commands_epo):
         print(f"Error in request_spectrum: {e}")
         return None
 
+def integration_time_config(model_name):
+    """Return the IntegrationTimeConfig (encoding, limits, saturation) of a model."""
+    config = integration_time_configs.get(model_name)
+    return IntegrationTimeConfig._make(config) if config else DEFAULT_INTEGRATION_TIME_CONFIG
+
+def encode_integration_time(model_name, integration_time_us):
+    """Build the SPECTR_SET_INTEGRATION_TIME packet for a model.
+
+    The time is clamped to the model's limits and, for models that take
+    milliseconds, rounded to a whole millisecond. Returns
+    ``(packet, integration_time_us)`` with the time the device will use.
+    """
+    config = integration_time_config(model_name)
+    integration_time_us = int(min(max(integration_time_us, config.min_us), config.max_us))
+    if config.encoding == 'ms16':
+        milliseconds = max(1, int(round(integration_time_us / 1000)))
+        return struct.pack('<BH', command_set['SPECTR_SET_INTEGRATION_TIME'], milliseconds), milliseconds * 1000
+    return struct.pack('<BI', command_set['SPECTR_SET_INTEGRATION_TIME'], integration_time_us), integration_time_us
+
+def set_integration_time(usb_device, cmd_ep_out, model_name, integration_time_us):
+    """Send the integration time to the spectrometer; returns the time actually set (us)."""
+    if usb_device is None:
+        raise ValueError('No spectrometer connected')
+    packet, integration_time_us = encode_integration_time(model_name, integration_time_us)
+    usb_send(usb_device, packet, epo=cmd_ep_out)
+    return integration_time_us
+
+def set_trigger_mode(usb_device, cmd_ep_out, mode='normal'):
+    """Select a trigger mode by name (see trigger_modes); in the external modes each
+    requested spectrum waits for a trigger pulse before it is sent."""
+    if mode not in trigger_modes:
+        raise ValueError(f"Unknown trigger mode {mode!r}; use one of {sorted(trigger_modes)}")
+    usb_send(usb_device, struct.pack('<BH', command_set['SPECTR_SET_TRIGGER_MODE'], trigger_modes[mode]),
+             epo=cmd_ep_out)
+
+class BurstReader:
+    """Read spectra back to back with pipelined requests.
+
+    ``request_spectrum`` sends one request and waits for the whole answer
+    before the next request goes out, so every scan pays the USB round trip
+    on top of the integration time. This reader keeps up to ``depth``
+    requests queued at the device: the next scan integrates while the
+    current one is read and decoded. Frames are reassembled from
+    ``chunk_size`` endpoint reads (the endpoint's packet size by default)
+    into a reused buffer, each read waiting at most ``timeout_ms``. Unless
+    given, the timeout is one scan of ``integration_time_us`` plus
+    ``timeout_margin_ms``; call ``set_integration_time()`` whenever the
+    device's integration time changes.
+
+    A read that times out before any byte of the frame arrived returns None
+    and the request stays queued (in the external trigger modes this just
+    means no trigger came). A frame that breaks off mid-way, or ends without
+    the end marker, is dropped and the endpoint is drained so the next
+    frame starts aligned; so is every request after ``max_timeouts``
+    consecutive timeouts. Pass ``max_timeouts=None`` in the external trigger
+    modes, where requests may rightly wait for a trigger for a long time.
+    """
+
+    def __init__(self, usb_device, packet_size, spectra_epi, commands_epo, depth=2, chunk_size=512,
+                 timeout_ms=None, max_timeouts=3, integration_time_us=None, timeout_margin_ms=1000):
+        self.usb_device = usb_device
+        self.packet_size = packet_size
+        self.spectra_epi = spectra_epi
+        self.commands_epo = commands_epo
+        self.depth = max(1, depth)
+        self.chunk_size = chunk_size
+        self.timeout_margin_ms = timeout_margin_ms
+        self.timeout_ms = timeout_ms
+        if timeout_ms is None:
+            self.set_integration_time(integration_time_us or 0)
+        self.max_timeouts = max_timeouts
+        self.outstanding = 0
+        self.frames = 0
+        self.timeouts = 0
+        self.bad_frames = 0
+        self.chunk_reads = 0
+        self._consecutive_timeouts = 0
+        self._request = struct.pack('<B', command_set['SPECTR_REQUEST_SPECTRA'])
+        self._frame = bytearray(packet_size)
+        self._chunk = array('B', bytes(chunk_size))
+        self._started_at = None
+
+    @classmethod
+    def from_profile(cls, profile, **options):
+        options.setdefault('chunk_size', profile.spectra_ep_in_size or 512)
+        return cls(profile.usb_device, profile.packet_size, profile.spectra_ep_in, profile.cmd_ep_out, **options)
+
+    def set_integration_time(self, integration_time_us):
+        """Wait up to one scan of ``integration_time_us`` plus the margin for each read."""
+        self.timeout_ms = int(integration_time_us // 1000) + self.timeout_margin_ms
+
+    @property
+    def frame_rate(self):
+        """Frames per second since the first request."""
+        if not self._started_at or not self.frames:
+            return 0.0
+        return self.frames / (time.perf_counter() - self._started_at)
+
+    def _fill(self, limit):
+        if self._started_at is None:
+            self._started_at = time.perf_counter()
+        while self.outstanding < limit:
+            usb_send(self.usb_device, self._request, epo=self.commands_epo)
+            self.outstanding += 1
+
+    def _read_packet(self):
+        """Reassemble one packet into the frame buffer; returns its length, 0 on a clean timeout."""
+        received = 0
+        chunk = memoryview(self._chunk)
+        while received < self.packet_size:
+            try:
+                count = self.usb_device.read(self.spectra_epi, self._chunk, self.timeout_ms)
+            except usb.core.USBTimeoutError:
+                if received:
+                    return -1
+                return 0
+            self.chunk_reads += 1
+            count = min(count, self.packet_size - received)
+            self._frame[received:received + count] = chunk[:count]
+            received += count
+        return received
+
+    def read(self, prefetch=None):
+        """Return the next spectrum, or None on a timeout or a broken frame.
+
+        The returned array is a view on a buffer reused by the next read.
+        ``prefetch`` caps how many requests may be queued after this one
+        (``depth - 1`` by default).
+        """
+        limit = self.depth if prefetch is None else min(self.depth, prefetch + 1)
+        self._fill(limit)
+        received = self._read_packet()
+        if received == 0:
+            self.timeouts += 1
+            self._consecutive_timeouts += 1
+            if self.max_timeouts is not None and self._consecutive_timeouts >= self.max_timeouts:
+                # The device has lost our requests; start over
+                self.drain()
+            return None
+        self._consecutive_timeouts = 0
+        self.outstanding -= 1
+        spectrum = decode_frame(self._frame) if received > 0 else None
+        if spectrum is None:
+            self.bad_frames += 1
+            self.drain()
+            return None
+        self.frames += 1
+        return spectrum
+
+    def burst(self, count, out=None):
+        """Read ``count`` spectra into ``out`` (a new (count, pixels) array by default).
+
+        Exactly ``count`` requests are sent, so nothing is left queued; rows
+        of frames that could not be read are dropped from the result.
+        """
+        if out is None:
+            out = np.empty((count, (self.packet_size - 1) // 2), dtype='<u2')
+        rows = 0
+        for remaining in range(count - 1, -1, -1):
+            spectrum = self.read(prefetch=remaining)
+            if spectrum is not None:
+                out[rows] = spectrum
+                rows += 1
+        if self.outstanding:
+            self.drain()
+        return out[:rows]
+
+    def drain(self):
+        """Discard queued requests and any bytes still waiting on the endpoint."""
+        while self.outstanding > 0 and self._read_packet() > 0:
+            self.outstanding -= 1
+        while True:
+            try:
+                self.usb_device.read(self.spectra_epi, self._chunk, 10)
+            except usb.core.USBError:
+                break
+        self.outstanding = 0
+        self._consecutive_timeouts = 0
+
 def usb_send(usb_device, data, epo=None):
     if epo is None:
         epo = end_points['EP1_OUT']
@@ -110,30 +399,42 @@ def usb_read(usb_device, epi=None, epi_size=None):
         epi_size = 512
     return usb_device.read(epi, epi_size)
 
+def decode_frame(data, check_end_marker=True):
+    """Decode a raw spectra packet into a little-endian uint16 array.
+
+    ``data`` can be anything exposing the buffer protocol (the ``array('B')``
+    returned by pyusb, ``bytes``, ``bytearray`` ...). The returned array is a
+    read-only view on that buffer, so no bytes are copied. When
+    ``check_end_marker`` is set the last byte must be ``END_MARKER`` and is
+    excluded from the payload; ``None`` is returned if it is not.
+    """
+    size = len(data)
+    if check_end_marker:
+        if size == 0 or data[size - 1] != END_MARKER:
+            return None
+        size -= 1
+    view = np.frombuffer(data, dtype='<u2', count=size // 2)
+    view.flags.writeable = False
+    return view
+
 def process_spectrum(data):
     """Convert raw spectral data bytes to intensity values for NIR-Quest."""
     try:
-        spectrum = []
-        # Process 16-bit intensity values (NIR-Quest uses 16-bit ADC)
-        for i in range(0, len(data)-1, 2):
-            intensity = struct.unpack('<H', data[i:i+2])[0]
-            spectrum.append(intensity)
-            
+        spectrum = decode_frame(data, check_end_marker=False)
+
         # Verify we got the expected number of points (4096 for NIR-Quest)
         if len(spectrum) != 4096:
             print(f"Warning: Expected 4096 points, got {len(spectrum)}")
-            
+
         # Basic data validation
-        if max(spectrum) == 0:
+        max_count = spectrum.max()
+        if max_count == 0:
             print("Warning: All intensity values are zero")
-        elif max(spectrum) >= 65535:
+        elif max_count >= 65535:
             print("Warning: Intensity values may be saturated")
-            
+
         return spectrum
-        
+
     except Exception as e:
         print(f"Error processing spectrum: {e}")
         return None
-
-
-
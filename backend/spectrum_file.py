@@ -0,0 +1,165 @@
+"""Compact binary storage for spectra (``.nirs``).
+
+Layout (little endian):
+
+    header        64 bytes, see HEADER below
+    wavelengths   float64[pixels], stored once for the whole file
+    metadata      UTF-8 JSON, zero padded to a 64-byte boundary
+    spectra       dtype[n, pixels], one row per spectrum, appended over time
+
+The spectrum count is not stored: it follows from the file size, so
+appending is a plain write at the end of the file and a torn final row after
+a crash is simply ignored. Spectra are read through ``np.memmap``, so single
+rows can be sliced out of multi-GB runs without loading the rest.
+"""
+import json
+import os
+import struct
+import numpy as np
+
+MAGIC = b'NIRS'
+VERSION = 1
+# magic, version, dtype code, pixels, metadata length, data offset
+HEADER = struct.Struct('<4sHHIIQ')
+HEADER_SIZE = 64
+ALIGNMENT = 64
+
+DTYPE_CODES = {1: np.dtype('<u2'), 2: np.dtype('<f4')}
+DTYPE_NAMES = {'uint16': 1, 'float32': 2}
+
+# Keys save_with_metadata derives from the data itself
+_DERIVED_CSV_KEYS = ('Timestamp', 'Points', 'Wavelength range', 'Intensity range')
+
+def _to_dtype(spectra, dtype):
+    spectra = np.asarray(spectra)
+    if dtype.kind == 'u' and spectra.dtype.kind == 'f':
+        info = np.iinfo(dtype)
+        spectra = np.clip(np.rint(spectra), info.min, info.max)
+    return np.ascontiguousarray(spectra, dtype=dtype)
+
+class SpectrumWriter:
+    """Create a ``.nirs`` file (or open one for appending) and add spectra."""
+
+    def __init__(self, filename, wavelengths=None, metadata=None, dtype='float32', append=False):
+        self.filename = filename
+        if append and os.path.exists(filename):
+            reader = SpectrumFile(filename)
+            self.pixels = reader.pixels
+            self.dtype = reader.dtype
+            self.count = len(reader)
+            data_offset = reader.data_offset
+            del reader
+            self._file = open(filename, 'r+b')
+            # Drop a partially written last row before appending
+            self._file.truncate(data_offset + self.count * self.pixels * self.dtype.itemsize)
+            self._file.seek(0, os.SEEK_END)
+            return
+
+        if wavelengths is None:
+            raise ValueError("wavelengths are required to create a spectrum file")
+        if dtype not in DTYPE_NAMES:
+            raise ValueError(f"Unsupported dtype {dtype!r}; use one of {sorted(DTYPE_NAMES)}")
+        wavelengths = np.ascontiguousarray(wavelengths, dtype='<f8')
+        self.pixels = len(wavelengths)
+        self.dtype = DTYPE_CODES[DTYPE_NAMES[dtype]]
+        self.count = 0
+
+        meta_bytes = json.dumps(metadata or {}, default=str).encode('utf-8')
+        meta_offset = HEADER_SIZE + wavelengths.nbytes
+        data_offset = -(-(meta_offset + len(meta_bytes)) // ALIGNMENT) * ALIGNMENT
+
+        self._file = open(filename, 'wb')
+        header = HEADER.pack(MAGIC, VERSION, DTYPE_NAMES[dtype], self.pixels, len(meta_bytes), data_offset)
+        self._file.write(header.ljust(HEADER_SIZE, b'\0'))
+        self._file.write(wavelengths.tobytes())
+        self._file.write(meta_bytes.ljust(data_offset - meta_offset, b'\0'))
+
+    def append(self, spectra):
+        """Append one spectrum or a 2-D block of spectra."""
+        spectra = _to_dtype(spectra, self.dtype)
+        if spectra.shape[-1] != self.pixels:
+            raise ValueError(f"Expected {self.pixels} points, got {spectra.shape[-1]}")
+        self._file.write(spectra.tobytes())
+        self.count += 1 if spectra.ndim == 1 else len(spectra)
+
+    def flush(self, sync=False):
+        self._file.flush()
+        if sync:
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class SpectrumFile:
+    """Read a ``.nirs`` file; ``spectra`` is a read-only (n, pixels) memmap."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            header = f.read(HEADER_SIZE)
+            if len(header) < HEADER_SIZE:
+                raise ValueError(f"{filename} is not a spectrum file")
+            magic, version, dtype_code, pixels, meta_length, data_offset = HEADER.unpack_from(header)
+            if magic != MAGIC:
+                raise ValueError(f"{filename} is not a spectrum file")
+            if version > VERSION or dtype_code not in DTYPE_CODES:
+                raise ValueError(f"Unsupported spectrum file version {version}")
+            self.pixels = pixels
+            self.dtype = DTYPE_CODES[dtype_code]
+            self.data_offset = data_offset
+            self.wavelengths = np.frombuffer(f.read(pixels * 8), dtype='<f8')
+            self.metadata = json.loads(f.read(meta_length).decode('utf-8') or '{}')
+
+        row_bytes = pixels * self.dtype.itemsize
+        self.count = max(0, (os.path.getsize(filename) - data_offset) // row_bytes)
+        if self.count:
+            self.spectra = np.memmap(filename, dtype=self.dtype, mode='r', offset=data_offset,
+                                     shape=(self.count, pixels))
+        else:
+            self.spectra = np.empty((0, pixels), dtype=self.dtype)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        return self.spectra[index]
+
+def write_spectra(filename, wavelengths, spectra, metadata=None, dtype='float32'):
+    """Write spectra (1-D or 2-D) to a new ``.nirs`` file."""
+    with SpectrumWriter(filename, wavelengths, metadata, dtype) as writer:
+        writer.append(spectra)
+    return True
+
+def append_spectra(filename, spectra):
+    """Append spectra to an existing ``.nirs`` file."""
+    with SpectrumWriter(filename, append=True) as writer:
+        writer.append(spectra)
+    return True
+
+def load_spectra(filename):
+    """Return ``(wavelengths, spectra_memmap, metadata)`` for a ``.nirs`` file."""
+    spectrum_file = SpectrumFile(filename)
+    return spectrum_file.wavelengths, spectrum_file.spectra, spectrum_file.metadata
+
+def csv_to_binary(csv_filename, filename, dtype='float32'):
+    """Convert a CSV written by save_to_csv/save_with_metadata to ``.nirs``."""
+    from backend.data_saving import load_from_csv
+    wavelengths, intensities, metadata = load_from_csv(csv_filename)
+    if wavelengths is None:
+        return False
+    return write_spectra(filename, wavelengths, intensities, metadata, dtype)
+
+def binary_to_csv(filename, csv_filename, index=-1):
+    """Write one spectrum of a ``.nirs`` file in the save_with_metadata CSV layout."""
+    from backend.data_saving import save_with_metadata
+    spectrum_file = SpectrumFile(filename)
+    metadata = {key: value for key, value in spectrum_file.metadata.items() if key not in _DERIVED_CSV_KEYS}
+    return save_with_metadata(spectrum_file.wavelengths, np.asarray(spectrum_file[index]),
+                              filename=csv_filename, metadata=metadata)
@@ -0,0 +1,323 @@
+"""Publish live spectra to local clients.
+
+``SpectrumServer`` runs an asyncio event loop on its own thread and serves
+any combination of a TCP port, a Unix socket and a WebSocket port.
+``publish()`` may be called from any thread (normally the acquisition
+reader): the frame is encoded once and offered to every client, and the
+caller never waits for a client.
+
+Every message is a 32-byte little-endian header followed by the samples:
+
+    offset  type  field
+    0       2s    magic b'NS'
+    2       u8    version (1)
+    3       u8    sample type: 1 = uint16, 2 = float32
+    4       u16   flags: bit 0 set when the samples are reflectance (%)
+    6       2x    reserved
+    8       u32   sequence number of the published frame
+    12      u32   pixels
+    16      f64   timestamp (seconds since the epoch)
+    24      f32   first wavelength (nm)
+    28      f32   last wavelength (nm)
+
+Over TCP and Unix sockets messages follow each other back to back (the
+header gives the payload size); over WebSocket each message is one binary
+frame. A client that cannot keep up never builds a queue: each client
+holds at most one unsent message, and a newer frame replaces it (counted
+in ``dropped``).
+"""
+import asyncio
+import base64
+import hashlib
+import os
+import struct
+import threading
+import time
+from collections import namedtuple
+import numpy as np
+
+MAGIC = b'NS'
+VERSION = 1
+HEADER = struct.Struct('<2sBBH2xIIdff')
+SAMPLE_TYPES = {1: np.dtype('<u2'), 2: np.dtype('<f4')}
+FLAG_REFLECTANCE = 1
+
+MessageHeader = namedtuple('MessageHeader', 'sample_type, flags, sequence, pixels, timestamp, first_wavelength, '
+                                            'last_wavelength')
+
+_WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+def encode_message(spectrum, sequence=0, timestamp=None, wavelength_range=(0.0, 0.0), flags=0):
+    """Encode one spectrum; integer counts are sent as uint16, anything else as float32."""
+    spectrum = np.asarray(spectrum)
+    sample_type = 1 if spectrum.dtype.kind in 'ui' else 2
+    samples = spectrum.astype(SAMPLE_TYPES[sample_type], copy=False)
+    header = HEADER.pack(MAGIC, VERSION, sample_type, flags, sequence & 0xFFFFFFFF, len(samples),
+                         time.time() if timestamp is None else timestamp, *wavelength_range)
+    return header + samples.tobytes()
+
+def decode_message(data):
+    """Return ``(MessageHeader, samples)`` for one message."""
+    magic, version, sample_type, flags, sequence, pixels, timestamp, first, last = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION or sample_type not in SAMPLE_TYPES:
+        raise ValueError("Not a spectrum message")
+    samples = np.frombuffer(data, dtype=SAMPLE_TYPES[sample_type], count=pixels, offset=HEADER.size)
+    return MessageHeader(sample_type, flags, sequence, pixels, timestamp, first, last), samples
+
+def read_message(stream):
+    """Read one message from a binary file-like stream (e.g. ``socket.makefile('rb')``).
+
+    Returns ``(MessageHeader, samples)``, or None at the end of the stream.
+    """
+    header = stream.read(HEADER.size)
+    if len(header) < HEADER.size:
+        return None
+    pixels = HEADER.unpack(header)[5]
+    sample_type = header[3]
+    payload = stream.read(pixels * SAMPLE_TYPES[sample_type].itemsize if sample_type in SAMPLE_TYPES else 0)
+    return decode_message(header + payload)
+
+def _websocket_frame(payload, opcode=0x2):
+    """One unmasked, final WebSocket frame (server to client)."""
+    size = len(payload)
+    if size < 126:
+        header = struct.pack('!BB', 0x80 | opcode, size)
+    elif size < 1 << 16:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, size)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, size)
+    return header + payload
+
+async def _websocket_handshake(reader, writer):
+    request = await reader.readuntil(b'\r\n\r\n')
+    headers = {}
+    for line in request.decode('latin-1').split('\r\n')[1:]:
+        if ':' in line:
+            key, value = line.split(':', 1)
+            headers[key.strip().lower()] = value.strip()
+    key = headers.get('sec-websocket-key')
+    if not key or headers.get('upgrade', '').lower() != 'websocket':
+        writer.write(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n')
+        await writer.drain()
+        return False
+    accept = base64.b64encode(hashlib.sha1((key + _WEBSOCKET_GUID).encode()).digest()).decode()
+    writer.write(('HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                  f'Sec-WebSocket-Accept: {accept}\r\n\r\n').encode())
+    await writer.drain()
+    return True
+
+class _Client:
+    """One connection; holds at most one message waiting to be sent."""
+
+    def __init__(self, writer, websocket):
+        self.writer = writer
+        self.websocket = websocket
+        self.pending = None
+        self.ready = asyncio.Event()
+        self.sent = 0
+        self.dropped = 0
+
+    def offer(self, message):
+        if self.pending is not None:
+            self.dropped += 1
+        self.pending = message
+        self.ready.set()
+
+class SpectrumServer:
+    """Broadcast published spectra to TCP, Unix socket and WebSocket clients.
+
+    Give ``port``, ``unix_path`` and/or ``websocket_port`` (0 picks a free
+    port; see ``addresses`` after ``start()``). The server also works as a
+    sink of backend.headless: ``write(wavelengths, spectrum, timestamp)``
+    publishes and ``close()`` stops it.
+    """
+
+    def __init__(self, port=None, unix_path=None, websocket_port=None, host='127.0.0.1', flags=0):
+        if port is None and unix_path is None and websocket_port is None:
+            raise ValueError("Give a port, a Unix socket path or a WebSocket port")
+        self.port = port
+        self.unix_path = unix_path
+        self.websocket_port = websocket_port
+        self.host = host
+        self.flags = flags
+        self.addresses = {}
+        self.published = 0
+        self.clients = 0
+        self._clients = set()
+        self._handlers = set()
+        self._loop = None
+        self._thread = None
+        self._stopped = None
+        self._ready = threading.Event()
+        self._error = None
+        self._lock = threading.Lock()
+        self._message = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, timeout=5.0):
+        """Start serving on a background thread; raises OSError if an address is taken."""
+        if self.running:
+            return
+        self._ready.clear()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name='spectrum-server', daemon=True)
+        self._thread.start()
+        self._ready.wait(timeout)
+        if self._error is not None:
+            self._thread.join(timeout)
+            raise self._error
+
+    def stop(self, timeout=5.0):
+        if self._loop is not None and self.running:
+            self._loop.call_soon_threadsafe(self._stopped.set)
+            self._thread.join(timeout)
+        self._thread = None
+
+    def publish(self, spectrum, timestamp=None, wavelength_range=(0.0, 0.0), flags=None):
+        """Send a spectrum to every client (thread-safe, never blocks on clients)."""
+        self.published += 1
+        if not self.clients:
+            return
+        message = encode_message(spectrum, self.published, timestamp, wavelength_range,
+                                 self.flags if flags is None else flags)
+        with self._lock:
+            # Frames published faster than the loop runs replace each other
+            scheduled = self._message is not None
+            self._message = message
+        if not scheduled:
+            self._loop.call_soon_threadsafe(self._broadcast)
+
+    def write(self, wavelengths, spectrum, timestamp):
+        self.publish(spectrum, timestamp, (wavelengths[0], wavelengths[-1]))
+
+    close = stop
+
+    def client_stats(self):
+        """Return ``[{'websocket', 'sent', 'dropped'}, ...]`` for the connected clients."""
+        return [{'websocket': client.websocket, 'sent': client.sent, 'dropped': client.dropped}
+                for client in list(self._clients)]
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._loop.run_until_complete(self._serve())
+        finally:
+            self._loop.close()
+            self._ready.set()
+
+    async def _serve(self):
+        self._stopped = asyncio.Event()
+        servers = []
+        try:
+            if self.port is not None:
+                servers.append(('tcp', await asyncio.start_server(self._handle_stream, self.host, self.port)))
+            if self.unix_path is not None:
+                if os.path.exists(self.unix_path):
+                    os.unlink(self.unix_path)
+                servers.append(('unix', await asyncio.start_unix_server(self._handle_stream, self.unix_path)))
+            if self.websocket_port is not None:
+                servers.append(('websocket', await asyncio.start_server(self._handle_websocket, self.host,
+                                                                        self.websocket_port)))
+        except OSError as e:
+            self._error = e
+        for name, server in servers:
+            self.addresses[name] = server.sockets[0].getsockname()
+        self._ready.set()
+
+        if self._error is None:
+            await self._stopped.wait()
+        for _, server in servers:
+            server.close()
+        # Dropping the connections (unsent data included) ends every client handler
+        for client in list(self._clients):
+            client.writer.transport.abort()
+        if self._handlers:
+            await asyncio.wait(self._handlers, timeout=1.0)
+        for _, server in servers:
+            await server.wait_closed()
+        if self.unix_path is not None and os.path.exists(self.unix_path):
+            os.unlink(self.unix_path)
+
+    def _broadcast(self):
+        with self._lock:
+            message, self._message = self._message, None
+        framed = None
+        for client in self._clients:
+            if client.websocket:
+                if framed is None:
+                    framed = _websocket_frame(message)
+                client.offer(framed)
+            else:
+                client.offer(message)
+
+    async def _handle_stream(self, reader, writer):
+        await self._serve_client(reader, writer, websocket=False)
+
+    async def _handle_websocket(self, reader, writer):
+        try:
+            upgraded = await _websocket_handshake(reader, writer)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            upgraded = False
+        if not upgraded:
+            writer.close()
+            return
+        await self._serve_client(reader, writer, websocket=True)
+
+    async def _serve_client(self, reader, writer, websocket):
+        # drain() only returns once everything is handed to the socket, so a
+        # slow client holds one message in hand instead of a growing buffer
+        writer.transport.set_write_buffer_limits(high=0)
+        client = _Client(writer, websocket)
+        handler = asyncio.current_task()
+        self._handlers.add(handler)
+        self._clients.add(client)
+        self.clients = len(self._clients)
+        sender = asyncio.ensure_future(self._send(client))
+        try:
+            if websocket:
+                await self._read_websocket(reader, client)
+            else:
+                # Stream clients only listen; reading tells us when they go away
+                while await reader.read(4096):
+                    pass
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            sender.cancel()
+            await asyncio.gather(sender, return_exceptions=True)
+            self._clients.discard(client)
+            self.clients = len(self._clients)
+            self._handlers.discard(handler)
+            writer.close()
+
+    async def _send(self, client):
+        try:
+            while True:
+                await client.ready.wait()
+                client.ready.clear()
+                message, client.pending = client.pending, None
+                client.writer.write(message)
+                await client.writer.drain()
+                client.sent += 1
+        except ConnectionError:
+            pass
+
+    async def _read_websocket(self, reader, client):
+        """Answer pings and close frames; the data clients send is ignored."""
+        while True:
+            first, second = await reader.readexactly(2)
+            opcode, size = first & 0x0F, second & 0x7F
+            if size == 126:
+                size, = struct.unpack('!H', await reader.readexactly(2))
+            elif size == 127:
+                size, = struct.unpack('!Q', await reader.readexactly(8))
+            mask = await reader.readexactly(4) if second & 0x80 else bytes(4)
+            payload = bytes(b ^ mask[i % 4] for i, b in enumerate(await reader.readexactly(size)))
+            if opcode == 0x8:
+                client.writer.write(_websocket_frame(payload[:2], opcode=0x8))
+                return
+            if opcode == 0x9:
+                client.writer.write(_websocket_frame(payload, opcode=0xA))
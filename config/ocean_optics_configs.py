@@ -23,11 +23,20 @@ command_set = {
     'SPECTR_SET_INTEGRATION_TIME': 0x02,
     'SPECTR_QUERY_INFORMATION': 0x05,
     'SPECTR_REQUEST_SPECTRA': 0x09,
+    'SPECTR_SET_TRIGGER_MODE': 0x0A,
     'SPECTR_WRITE_REG_INFO': 0x6A,
     'SPECTR_READ_PCB_TEMP': 0x6C,
     'SPECTR_QUERY_STATUS': 0xFE
 }
 
+# Trigger modes sent with SPECTR_SET_TRIGGER_MODE
+trigger_modes = {
+    'normal': 0,
+    'software': 1,
+    'external_sync': 2,
+    'external_hardware': 3
+}
+
 # Ocean Optics spectrometers list
 # (device id, 'model name', packet size, cmd end point out, data end point in, size, spectra end point in, size)
 model_configs = [
@@ -47,3 +56,43 @@ model_configs = [
     ([0x1010, 0x100C], 'NIR', 4097, end_points['EP2_OUT'], end_points['EP7_IN'], 64, end_points['EP7_IN'], 64)
 ]
 
+
+# Integration time protocol per model
+# 'model name': (encoding, minimum us, maximum us, saturation counts)
+# 'us32': SPECTR_SET_INTEGRATION_TIME followed by a little-endian uint32 in microseconds
+# 'ms16': SPECTR_SET_INTEGRATION_TIME followed by a little-endian uint16 in milliseconds
+integration_time_configs = {
+    'Maya2000 Pro': ('us32', 7200, 65000000, 65535),
+    'NIRQUEST': ('us32', 1000, 120000000, 65535),
+    'USB2000+': ('us32', 1000, 65000000, 65535),
+    'HR2000+': ('us32', 1000, 65000000, 16383),
+    'QE65 Pro': ('us32', 8000, 1600000000, 65535),
+    'QE65000': ('us32', 8000, 900000000, 65535),
+    'USB2000': ('ms16', 3000, 65535000, 4095),
+    'USB650': ('ms16', 3000, 65535000, 4095),
+    'HR2000': ('ms16', 3000, 65535000, 4095),
+    'Torus': ('us32', 1000, 65000000, 65535),
+    'Apex': ('us32', 15000, 65000000, 65535),
+    'Maya': ('us32', 10000, 65000000, 65535),
+    'Jaz': ('us32', 1000, 65000000, 65535),
+    'NIR': ('ms16', 1000, 65535000, 65535)
+}
+
+# Nominal wavelength range (nm) per model, used to lay out the pixels when
+# merging several spectrometers onto one axis
+wavelength_ranges = {
+    'Maya2000 Pro': (200, 1100),
+    'NIRQUEST': (900, 2500),
+    'USB2000+': (200, 850),
+    'HR2000+': (200, 1100),
+    'QE65 Pro': (200, 1000),
+    'QE65000': (200, 1000),
+    'USB2000': (200, 850),
+    'USB650': (350, 1000),
+    'HR2000': (200, 1100),
+    'Torus': (360, 825),
+    'Apex': (785, 1100),
+    'Maya': (200, 1100),
+    'Jaz': (200, 1100),
+    'NIR': (900, 1700)
+}
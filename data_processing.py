@@ -1,21 +1,57 @@
+from functools import lru_cache
 import numpy as np
-from scipy.signal import savgol_filter
+from backend.smoothing import savitzky_golay
 from utils import validate_formula, calculate_custom
 
+# One record per spectrum from DataProcessor.extract_features
+FEATURE_DTYPE = np.dtype([
+    ('max_intensity', np.float64),
+    ('mean_intensity', np.float64),
+    ('min_intensity', np.float64),
+    ('std_intensity', np.float64),
+    ('peak_index', np.int64),
+])
+
+@lru_cache(maxsize=32)
+def _baseline_basis(pixels, degree):
+    """Vandermonde matrix of a pixel axis and its pseudo-inverse.
+
+    The axis is scaled to [-1, 1], which spans the same polynomials as
+    np.polyfit on arange(pixels) but keeps the matrix well conditioned.
+    """
+    vandermonde = np.vander(np.linspace(-1.0, 1.0, pixels), degree + 1)
+    vandermonde.flags.writeable = False
+    pinv = np.linalg.pinv(vandermonde)
+    pinv.flags.writeable = False
+    return vandermonde, pinv
+
 class DataProcessor:
+    """Spectrum processing steps.
+
+    Every method takes a single spectrum or an (N, pixels) stack and works
+    along the last axis, so whole archives can be processed in one call.
+    """
+
     @staticmethod
     def smooth_data(data, window_length=11, polyorder=3):
-        return savgol_filter(data, window_length, polyorder)
+        return savitzky_golay(data, window_length, polyorder)
 
     @staticmethod
     def normalize_data(data):
-        return (data - np.min(data)) / (np.max(data) - np.min(data))
+        data = np.asarray(data, dtype=np.float64)
+        minimum = np.min(data, axis=-1, keepdims=True)
+        spread = np.max(data, axis=-1, keepdims=True) - minimum
+        # Flat spectra have nothing to scale; map them to 0 instead of NaN
+        spread[spread == 0] = np.inf
+        return (data - minimum) / spread
 
     @staticmethod
     def baseline_correction(data, degree=2):
-        coeffs = np.polyfit(np.arange(len(data)), data, degree)
-        baseline = np.polyval(coeffs, np.arange(len(data)))
-        return data - baseline
+        # One least-squares solve for all rows against the cached basis
+        data = np.asarray(data, dtype=np.float64)
+        vandermonde, pinv = _baseline_basis(data.shape[-1], degree)
+        coefficients = data @ pinv.T
+        return data - coefficients @ vandermonde.T
 
     @staticmethod
     def apply_formula(data, formula):
@@ -24,7 +60,13 @@ class DataProcessor:
 
     @staticmethod
     def extract_features(data):
-        return {
-            "max_intensity": np.max(data),
-            "mean_intensity": np.mean(data),
-        }
+        """Return a FEATURE_DTYPE record per spectrum (a single record for 1-D input)."""
+        data = np.asarray(data)
+        batch = np.atleast_2d(data)
+        features = np.empty(len(batch), dtype=FEATURE_DTYPE)
+        features['max_intensity'] = batch.max(axis=1)
+        features['mean_intensity'] = batch.mean(axis=1)
+        features['min_intensity'] = batch.min(axis=1)
+        features['std_intensity'] = batch.std(axis=1)
+        features['peak_index'] = batch.argmax(axis=1)
+        return features[0] if data.ndim == 1 else features
@@ -0,0 +1,98 @@
+import numpy as np
+
+class LivePlot:
+    """Incrementally redraw a live spectrum on a matplotlib Axes.
+
+    One persistent ``Line2D`` is kept and only its y data changes per frame.
+    The line is animated, so full figure draws leave it out; after every full
+    draw the axes background is cached with ``copy_from_bbox`` and the line
+    drawn on top. Regular frames then restore that background and draw only
+    the line (blitting). The y axis is only rescaled when the data leaves a
+    hysteresis band around the current limits, so steady spectra never force
+    a full redraw.
+    """
+
+    def __init__(self, ax, setup=None, hysteresis=0.25, **line_kwargs):
+        self.ax = ax
+        self.setup = setup
+        self.hysteresis = hysteresis
+        self.line_kwargs = line_kwargs or {'color': 'b', 'linestyle': '-', 'linewidth': 1.5}
+        self.line = None
+        self.background = None
+        self.full_redraws = 0
+        self.blits = 0
+        self._draw_cid = self.ax.figure.canvas.mpl_connect('draw_event', self._on_draw)
+
+    def _on_draw(self, event):
+        """Cache the freshly drawn background and draw the line over it."""
+        if self.line is None or self.line.axes is not self.ax:
+            self.background = None
+            return
+        canvas = event.canvas
+        self.background = canvas.copy_from_bbox(self.ax.bbox)
+        self.ax.draw_artist(self.line)
+
+    def _target_ylim(self, ydata, y_max):
+        min_value = float(np.min(ydata))
+        max_value = float(np.max(ydata))
+        # Add buffer for better visualization
+        buffer = (max_value - min_value) * 0.1
+        y_min = max(0, min_value - buffer)
+        if y_max is None:
+            y_max = max_value + buffer
+        if y_max <= y_min:
+            y_max = y_min + 1
+        return y_min, y_max
+
+    def _needs_rescale(self, ydata, y_max):
+        low, high = self.ax.get_ylim()
+        if np.min(ydata) < low or np.max(ydata) > high:
+            return True
+        target_low, target_high = self._target_ylim(ydata, y_max)
+        band = self.hysteresis * (high - low)
+        return abs(target_low - low) > band or abs(target_high - high) > band
+
+    def _create_line(self, xdata, ydata):
+        self.ax.clear()
+        (self.line,) = self.ax.plot(xdata, ydata, label=f'Spectrum ({len(ydata)} points)',
+                                    animated=True, **self.line_kwargs)
+        self.ax.legend(loc='upper right')
+        if self.setup is not None:
+            self.setup()
+
+    def update(self, xdata, ydata, y_label=None, y_max=None):
+        """Show a new frame.
+
+        Returns True when the caller must do a full figure draw (the axes
+        changed) and False when the line was blitted onto the Agg buffer and
+        only needs to be presented.
+        """
+        full = False
+        if (self.line is None or self.line.axes is not self.ax
+                or len(self.line.get_xdata()) != len(ydata)
+                or not np.array_equal(self.line.get_xdata(), xdata)):
+            self._create_line(xdata, ydata)
+            full = True
+        else:
+            self.line.set_ydata(ydata)
+
+        if y_label is not None and self.ax.get_ylabel() != y_label:
+            self.ax.set_ylabel(y_label)
+            full = True
+
+        if full or self._needs_rescale(ydata, y_max):
+            self.ax.set_ylim(*self._target_ylim(ydata, y_max))
+            full = True
+
+        if full or self.background is None:
+            self.full_redraws += 1
+            return True
+
+        canvas = self.ax.figure.canvas
+        canvas.restore_region(self.background)
+        self.ax.draw_artist(self.line)
+        self.blits += 1
+        return False
+
+    def disconnect(self):
+        self.ax.figure.canvas.mpl_disconnect(self._draw_cid)
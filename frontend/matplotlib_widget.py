@@ -1,48 +1,155 @@
 from kivy.uix.widget import Widget
 from kivy.graphics import Rectangle, Color
 from matplotlib.backends.backend_agg import FigureCanvasAgg
-import matplotlib.pyplot as plt
-import io
-from kivy.core.image import Image as CoreImage
-from kivy.properties import ObjectProperty
+from matplotlib.figure import Figure
+import time
+from kivy.graphics.texture import Texture
+from kivy.properties import ObjectProperty, NumericProperty
 from kivy.clock import Clock
 
 class MatplotlibWidget(Widget):
-    """Simple widget to embed matplotlib figures in Kivy"""
+    """Simple widget to embed matplotlib figures in Kivy
+
+    Redraws go through a small scheduler: ``draw()`` and ``blit()`` only mark
+    the plot dirty, all requests made within one frame are merged into a
+    single render, renders are capped at ``max_fps`` and a render after a
+    resize waits until the size has been stable for ``resize_debounce``
+    seconds.
+    """
     figure = ObjectProperty(None)
-    
+    max_fps = NumericProperty(30)
+    resize_debounce = NumericProperty(0.15)
+
     def __init__(self, **kwargs):
         super(MatplotlibWidget, self).__init__(**kwargs)
-        self.bind(size=self._update_figure)
-        self.bind(pos=self._update_figure)
         if self.figure is None:
-            self.figure = plt.figure()
-        
+            self.figure = Figure()
+        # One Agg canvas for the widget's lifetime so blitted regions stay valid
+        self.agg_canvas = FigureCanvasAgg(self.figure)
+        # One texture, reallocated only when the rendered size changes
+        self._texture = None
+        self._rect = None
+        # Per-frame timings (seconds)
+        self.frames = 0
+        self.render_time = 0.0
+        self.upload_time = 0.0
+        self.total_render_time = 0.0
+        self.total_upload_time = 0.0
+        # Redraw scheduling
+        self.requested_renders = 0
+        self.performed_renders = 0
+        self.requested_uploads = 0
+        self.performed_uploads = 0
+        self._render_dirty = False
+        self._upload_dirty = False
+        self._last_flush = 0.0
+        self._flush_trigger = Clock.create_trigger(self._flush, 0)
+        self._resize_trigger = Clock.create_trigger(lambda dt: self.draw(), self.resize_debounce)
+        self.bind(size=self._on_size)
+        self.bind(pos=self._on_pos)
+
+    def _on_pos(self, *args):
+        # Moving the widget only moves the existing texture
+        if self._rect is not None:
+            self._rect.pos = self.pos
+
+    def _on_size(self, *args):
+        # Stretch the current texture while resizing, render once it settles
+        if self._rect is not None:
+            self._rect.size = self.size
+        self._resize_trigger.cancel()
+        self._resize_trigger.timeout = self.resize_debounce
+        self._resize_trigger()
+
+    def _schedule_flush(self):
+        wait = self._last_flush + 1.0 / self.max_fps - time.perf_counter() if self.max_fps else 0
+        self._flush_trigger.cancel()
+        self._flush_trigger.timeout = max(0, wait)
+        self._flush_trigger()
+
+    def _flush(self, dt):
+        """Perform the pending render or upload, at most max_fps times per second."""
+        if self.max_fps and time.perf_counter() - self._last_flush < 1.0 / self.max_fps:
+            self._schedule_flush()
+            return
+        self._last_flush = time.perf_counter()
+        if self._render_dirty:
+            self._update_figure()
+        elif self._upload_dirty and self.canvas and self.figure:
+            self._upload()
+        self._render_dirty = False
+        self._upload_dirty = False
+
     def _update_figure(self, *args):
         if not self.canvas or not self.figure:
             return
-            
+
         # Draw matplotlib figure to buffer
-        canvas = FigureCanvasAgg(self.figure)
-        canvas.draw()
-        buf = io.BytesIO()
-        canvas.print_png(buf)
-        buf.seek(0)
-        
-        # Update Kivy canvas
-        self.canvas.clear()
-        with self.canvas:
-            Color(1, 1, 1, 1)
-            tex = CoreImage(buf, ext='png').texture
-            Rectangle(texture=tex, pos=self.pos, size=self.size)
-    
+        start = time.perf_counter()
+        if self.figure.canvas is not self.agg_canvas:
+            self.agg_canvas = FigureCanvasAgg(self.figure)
+        self.agg_canvas.draw()
+        self.render_time = time.perf_counter() - start
+        self.total_render_time += self.render_time
+        self.performed_renders += 1
+        self._upload()
+
+    def _upload(self):
+        """Copy the current Agg buffer straight into the Kivy texture."""
+        start = time.perf_counter()
+        width, height = self.agg_canvas.get_width_height()
+        if self._texture is None or self._texture.size != (width, height):
+            self._texture = Texture.create(size=(width, height), colorfmt='rgba')
+            # Agg rows start at the top, OpenGL textures at the bottom
+            self._texture.flip_vertical()
+            self.canvas.clear()
+            with self.canvas:
+                Color(1, 1, 1, 1)
+                self._rect = Rectangle(texture=self._texture, pos=self.pos, size=self.size)
+
+        # buffer_rgba() is a (height, width, 4) view; flatten it without copying
+        pixels = self.agg_canvas.buffer_rgba().cast('B')
+        self._texture.blit_buffer(pixels, colorfmt='rgba', bufferfmt='ubyte')
+        self._rect.pos = self.pos
+        self._rect.size = self.size
+        self.canvas.ask_update()
+
+        self.upload_time = time.perf_counter() - start
+        self.total_upload_time += self.upload_time
+        self.performed_uploads += 1
+        self.frames += 1
+
+    def stats(self):
+        """Return render/upload timings in milliseconds."""
+        frames = max(self.frames, 1)
+        return {
+            'frames': self.frames,
+            'render_ms': self.render_time * 1e3,
+            'upload_ms': self.upload_time * 1e3,
+            'mean_render_ms': self.total_render_time / frames * 1e3,
+            'mean_upload_ms': self.total_upload_time / frames * 1e3,
+            'requested_renders': self.requested_renders,
+            'performed_renders': self.performed_renders,
+            'requested_uploads': self.requested_uploads,
+            'performed_uploads': self.performed_uploads,
+        }
+
     def draw(self):
-        """Refresh the matplotlib figure"""
-        Clock.schedule_once(lambda dt: self._update_figure(), 0)
+        """Refresh the matplotlib figure (merged with other requests this frame)"""
+        self.requested_renders += 1
+        self._render_dirty = True
+        self._schedule_flush()
+
+    def blit(self):
+        """Show artists drawn onto the Agg buffer without re-rendering the figure."""
+        self.requested_uploads += 1
+        self._upload_dirty = True
+        self._schedule_flush()
 
 def plot_spectrum(wavelengths, intensities):
+    import matplotlib.pyplot as plt
     plt.plot(wavelengths, intensities)
     plt.xlabel("Wavelength (nm)")
     plt.ylabel("Intensity (counts)")
     plt.title("Spectrum Window")
-    plt.show()
\ No newline at end of file
+    plt.show()
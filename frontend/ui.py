@@ -4,15 +4,24 @@ from kivy.uix.button import Button
 from kivy.uix.image import Image
 from kivy.uix.label import Label
 from kivy.clock import Clock
-import matplotlib.pyplot as plt
-from kivy.uix.filechooser import FileChooserListView
 from kivy.uix.popup import Popup
-import csv
+from kivy.uix.slider import Slider
+from kivy.uix.switch import Switch
+from matplotlib.figure import Figure
 import numpy as np
 import os
-from backend.spectrometer import find_spectrometer, request_spectrum, drop_spectrometer
+import threading
+import traceback
+from datetime import datetime
+from backend.spectrometer import find_spectrometer, drop_spectrometer, EMPTY_PROFILE
+from backend.acquisition import AcquisitionEngine, read_average
+from backend.exposure import AutoExposure
+from backend.pipeline import ReferenceStage, correction_pipeline
 from backend.data_saving import save_to_csv, save_with_metadata, load_from_csv
+from backend.export import BackgroundExporter
+from backend.recorder import SpectrumRecorder
 from frontend.matplotlib_widget import MatplotlibWidget
+from frontend.live_plot import LivePlot
 from frontend.custom_widgets import IconButton
 from kivy.graphics import Color, Rectangle
 
@@ -21,44 +30,22 @@ class MainLayout(BoxLayout):
         super().__init__(**kwargs)
         self.orientation = 'vertical'
         
-        # Ensure we're in the right directory for icon loading
-        print(f"Current working directory: {os.getcwd()}")
-        
-        # Verify icon paths
+        # Verify icon paths once the first frame is up
         self.verify_icons = True  # Set to True to enable detailed icon debugging
-        if self.verify_icons:
-            print("Checking for icon directories...")
-            if not os.path.exists("frontend"):
-                print("WARNING: 'frontend' directory not found!")
-            if not os.path.exists("frontend/icons"):
-                print("WARNING: 'frontend/icons' directory not found!")
-            else:
-                print(f"frontend/icons directory exists and contains: {os.listdir('frontend/icons')}")
         
         # Grid settings
         self.grid_enabled = True
         self.grid_style = {'color': 'lightgray', 'linestyle': '--', 'alpha': 0.7}
         self.major_grid_style = {'color': 'gray', 'linestyle': '-', 'alpha': 0.5}
 
-        # Initialize spectrometer
-        self.spectrometer = find_spectrometer()
+        # The spectrometer is discovered in the background (see _discover_spectrometer)
+        self.spectrometer = EMPTY_PROFILE
+        self.discovering = True
         
         # Get wavelength range based on spectrometer model
         self.wavelength_start = 900
         self.wavelength_end = 2500
         
-        # Adjust range if we know the spectrometer model
-        if hasattr(self.spectrometer, 'model_name'):
-            model = self.spectrometer.model_name
-            print(f"Detected spectrometer model: {model}")
-            # You could have different ranges based on model
-            if "NIR" in model or "NIRQUEST" in model:
-                self.wavelength_start = 900
-                self.wavelength_end = 2500
-            elif "USB2000" in model:
-                self.wavelength_start = 200
-                self.wavelength_end = 850
-        
         # Initialize wavelength array and spectrum data
         self.num_pixels = 512  # Will be adjusted based on actual data received
         self.wavelengths = np.linspace(self.wavelength_start, self.wavelength_end, self.num_pixels)
@@ -69,18 +56,39 @@ class MainLayout(BoxLayout):
         self.scans_to_average = 10  # Default value, can be adjusted by user
         self.averaging_enabled = True
         
+        # Background acquisition; the UI only pulls the newest processed frame
+        self.acquisition = AcquisitionEngine(self.spectrometer, processor=self._process_frame, pipeline_depth=2)
+        self._plotted_sequence = 0
+        # Dark/reference files are written off the UI thread
+        self.exporter = BackgroundExporter()
+        # Time-series recording of every raw frame
+        self.recorder = None
+        self.recording_filename = None
+        self._recording_lock = threading.Lock()
+        self.integration_time_ms = 100
+        # Optional backend.streaming.SpectrumServer that gets every processed frame
+        self.stream_server = None
+        
         # Correction spectra
         self.dark_spectrum = None
+        self.dark_noise = None
         self.reference_spectrum = None
         self.use_dark_correction = True
         self.use_reference_correction = False  # Enables reflectance mode when True
+        # Live processing: dark -> boxcar smoothing -> reflectance
+        self._plain_pipeline = correction_pipeline()
+        self.pipeline = self._plain_pipeline
         
-        # Create a matplotlib figure
-        self.fig, self.ax = plt.subplots(figsize=(10, 6), dpi=100)
+        # Create a matplotlib figure (without pyplot, which is slow to import)
+        self.fig = Figure(figsize=(10, 6), dpi=100)
+        self.ax = self.fig.add_subplot()
         
         # Create our custom MatplotlibWidget with the figure
         self.plot_widget = MatplotlibWidget(figure=self.fig)
         
+        # Live spectra are blitted onto one persistent line
+        self.live_plot = LivePlot(self.ax, setup=self._setup_plot)
+        
         # Setup plot AFTER creating plot_widget
         self._setup_plot()
         
@@ -112,13 +120,23 @@ class MainLayout(BoxLayout):
             Rectangle(pos=icon_bar2.pos, size=icon_bar2.size)
         icon_bar2.bind(pos=self._update_bar_bg, size=self._update_bar_bg)
 
-        # Create a status bar
+        # Create a status bar; the loading animation runs while the USB bus is scanned
         status_bar = BoxLayout(size_hint=(1, None), height=30)
-        status_label = Label(text="NIR Spectrometer Software - Ready", size_hint=(1, 1))
-        status_bar.add_widget(status_label)
+        self.loading_indicator = Image(source='frontend/icons/application_loading.gif', anim_delay=0.05,
+                                       size_hint=(None, 1), width=30)
+        self.status_label = Label(text="NIR Spectrometer Software - Searching for spectrometer...",
+                                  size_hint=(1, 1))
+        status_bar.add_widget(self.loading_indicator)
+        status_bar.add_widget(self.status_label)
+        self.status_bar = status_bar
         self.add_widget(status_bar)
 
-        self.check_icon_paths()
+        if self.verify_icons:
+            Clock.schedule_once(lambda dt: self.check_icon_paths(), 1)
+
+        self._discovery_thread = threading.Thread(target=self._discover_spectrometer,
+                                                  name='spectrometer-discovery', daemon=True)
+        self._discovery_thread.start()
 
         # Add all widgets to the main layout in the correct order (top to bottom)
         self.clear_widgets()  # Clear any existing widgets
@@ -127,6 +145,44 @@ class MainLayout(BoxLayout):
         self.add_widget(self.plot_widget)  # Plot in the middle (takes most space)
         self.add_widget(status_bar)  # Status bar at bottom
 
+    def _discover_spectrometer(self):
+        """Scan the USB bus (worker thread); the result is applied on the UI thread."""
+        try:
+            profile = find_spectrometer()
+        except Exception as e:
+            print(f"Error searching for spectrometer: {e}")
+            profile = EMPTY_PROFILE
+        Clock.schedule_once(lambda dt: self._on_spectrometer_found(profile))
+
+    def _on_spectrometer_found(self, profile):
+        """Use the spectrometer found by _discover_spectrometer."""
+        self.spectrometer = profile
+        self.acquisition.profile = profile
+        self.discovering = False
+        self.status_bar.remove_widget(self.loading_indicator)
+        if not profile.usb_device:
+            self.status_label.text = "NIR Spectrometer Software - No spectrometer found"
+            return
+
+        model = profile.model_name
+        print(f"Detected spectrometer model: {model}")
+        # You could have different ranges based on model
+        if "NIR" in model or "NIRQUEST" in model:
+            self.wavelength_start = 900
+            self.wavelength_end = 2500
+        elif "USB2000" in model:
+            self.wavelength_start = 200
+            self.wavelength_end = 850
+        self.wavelengths = np.linspace(self.wavelength_start, self.wavelength_end, self.num_pixels)
+        self.status_label.text = f"NIR Spectrometer Software - {model} ready"
+
+        if self.measuring or getattr(self, 'continuous_mode', False):
+            # Measurement was started while the bus was still being scanned
+            self.acquisition.scans_to_average = self.scans_to_average if self.averaging_enabled else 1
+            self.acquisition.start()
+        elif self.spectrum_data is None:
+            self.initialize_empty_plot()
+
     def _update_grid(self):
         """Update gridlines based on current settings."""
         self.ax.grid(self.grid_enabled, which='both', **self.grid_style)
@@ -241,6 +297,14 @@ class MainLayout(BoxLayout):
         )
         ref_button.bind(on_press=self.collect_reference_spectrum)
         
+        # Record every raw frame to a file
+        record_button = IconButton(
+            icon_source='frontend/icons/save_graph.png',
+            tooltip_text='Start/Stop Recording Frames',
+            size_hint=(1, 1)
+        )
+        record_button.bind(on_press=self.toggle_recording)
+        
         # Add all buttons to the icon bar
         icon_bar.add_widget(app_icon)
         icon_bar.add_widget(self.start_button)
@@ -248,6 +312,7 @@ class MainLayout(BoxLayout):
         icon_bar.add_widget(run_pause_button)
         icon_bar.add_widget(dark_button)
         icon_bar.add_widget(ref_button)
+        icon_bar.add_widget(record_button)
         
         return icon_bar
 
@@ -349,10 +414,10 @@ class MainLayout(BoxLayout):
         """Toggle the measurement loop."""
         if not self.measuring:
             self.measuring = True
-            Clock.schedule_interval(self.collect_data, 0.5)
+            self._start_acquisition(0.5)
         else:
             self.measuring = False
-            Clock.unschedule(self.collect_data)
+            self._stop_acquisition()
 
     def toggle_continuous_mode(self, instance):
         """Toggle continuous measurement mode."""
@@ -363,130 +428,144 @@ class MainLayout(BoxLayout):
         
         if self.continuous_mode:
             # Start continuous measurement with faster refresh
-            Clock.schedule_interval(self.collect_data, 0.2)  # 5 times per second
+            self._start_acquisition(0.2)  # 5 times per second
             print("Continuous mode enabled")
         else:
             # Stop continuous measurement
-            Clock.unschedule(self.collect_data)
+            self._stop_acquisition()
             print("Continuous mode disabled")
 
+    def _start_acquisition(self, refresh_interval):
+        """Start the background reader and refresh the plot every refresh_interval seconds."""
+        if self.spectrometer.usb_device:
+            self.acquisition.scans_to_average = self.scans_to_average if self.averaging_enabled else 1
+            self.acquisition.start()
+        Clock.unschedule(self.collect_data)
+        Clock.schedule_interval(self.collect_data, refresh_interval)
+
+    def _stop_acquisition(self):
+        """Stop the plot refresh and the background reader."""
+        Clock.unschedule(self.collect_data)
+        self.acquisition.stop()
+        if self.pipeline.runs:
+            print(f"Processing per spectrum: {self.pipeline.timing_summary()}")
+
+    def toggle_recording(self, instance):
+        """Toggle recording of every raw frame to a .nirr file."""
+        if self.recording_filename is None:
+            self.start_recording()
+            self.status_label.text = f"NIR Spectrometer Software - Recording to {self.recording_filename}"
+        else:
+            self.stop_recording()
+            self.status_label.text = "NIR Spectrometer Software - Recording stopped"
+
+    def start_recording(self, filename=None):
+        """Log every raw frame (with timestamp) to a .nirr file until stop_recording()."""
+        with self._recording_lock:
+            if self.recording_filename is not None:
+                return
+            self.recording_filename = filename or datetime.now().strftime('recording_%Y%m%d_%H%M%S.nirr')
+        self.acquisition.add_frame_callback(self._record_frame)
+        print(f"Recording frames to {self.recording_filename}")
+
+    def stop_recording(self):
+        """Stop recording and close the file."""
+        self.acquisition.remove_frame_callback(self._record_frame)
+        # A frame already in _record_frame must not reopen (and truncate) the file
+        with self._recording_lock:
+            self.recording_filename = None
+            recorder, self.recorder = self.recorder, None
+        if recorder is not None:
+            recorder.close()
+            print(f"Recorded {recorder.frames_written} frames to {recorder.filename} "
+                  f"({recorder.dropped_frames} dropped)")
+
+    def _record_frame(self, frame, timestamp):
+        """Frame callback; the file is created once the frame length is known."""
+        with self._recording_lock:
+            if self.recording_filename is None:
+                return
+            if self.recorder is None:
+                wavelengths = np.linspace(self.wavelength_start, self.wavelength_end, len(frame))
+                self.recorder = SpectrumRecorder(
+                    self.recording_filename, wavelengths,
+                    integration_time_us=self.integration_time_ms * 1000,
+                    metadata={'Device': getattr(self.spectrometer, 'model_name', 'Unknown')}
+                )
+            # Auto exposure can change the integration time between frames
+            if self.acquisition.integration_time_us:
+                self.recorder.integration_time_us = self.acquisition.integration_time_us
+            self.recorder.record(frame, timestamp)
+
+    def _process_frame(self, raw_data):
+        """Correct and smooth an averaged frame (runs on the acquisition thread)."""
+        wavelengths = self.wavelengths
+        # Adjust wavelength array if necessary to match data length
+        if len(raw_data) != len(wavelengths):
+            print(f"Adjusting wavelength array to match data: {len(raw_data)} points")
+            wavelengths = np.linspace(self.wavelength_start, self.wavelength_end, len(raw_data))
+            self.wavelengths = wavelengths
+        
+        raw_data = np.asarray(raw_data, dtype=np.float64)
+        
+        # The pipeline is swapped as a whole when dark/reference change
+        pipeline = self.pipeline
+        if not pipeline.matches(raw_data):
+            print(f"Warning: Correction spectra length mismatch. Got {len(raw_data)} points")
+            pipeline = self._plain_pipeline
+        
+        # Dark-corrected counts are copied back into raw_data; the smoothed
+        # result (reflectance if a reference is set) is what gets plotted
+        plot_data = pipeline.run(raw_data, taps={'dark': raw_data})
+        
+        if isinstance(pipeline.stages[-1], ReferenceStage):
+            y_label = "Reflectance (%)"
+            y_max = 100
+        else:
+            y_label = "Intensity (counts)"
+            y_max = None
+        
+        if self.stream_server is not None:
+            from backend.streaming import FLAG_REFLECTANCE
+            self.stream_server.publish(plot_data, wavelength_range=(wavelengths[0], wavelengths[-1]),
+                                       flags=FLAG_REFLECTANCE if y_max == 100 else 0)
+        
+        return wavelengths, raw_data, plot_data, y_label, y_max
+
+    def _rebuild_correction(self):
+        """Rebuild the processing pipeline after dark/reference spectra change."""
+        dark = self.dark_spectrum if self.use_dark_correction else None
+        reference = self.reference_spectrum if self.use_reference_correction else None
+        self.pipeline = correction_pipeline(dark, reference)
+
     def collect_data(self, dt):
-        """Collect data from the spectrometer with improved noise reduction."""
+        """Plot the newest spectrum published by the acquisition thread."""
         if not self.spectrometer.usb_device:
             print("No spectrometer device found")
             return
 
-        print("Acquiring spectrum data...")
-        
-        # Collect multiple scans for averaging
-        scan_count = self.scans_to_average if self.averaging_enabled else 1
-        collected_scans = []
-        
-        for i in range(scan_count):
-            acquired = request_spectrum(
-                self.spectrometer.usb_device,
-                self.spectrometer.packet_size,
-                self.spectrometer.spectra_ep_in,
-                self.spectrometer.cmd_ep_out
-            )
-            if acquired:
-                collected_scans.append(acquired)
-                if i % 2 == 0:  # Update progress every 2 scans
-                    print(f"Collecting scan {i+1}/{scan_count}")
-        
-        if collected_scans:
-            # Average the scans to reduce noise
-            raw_data = np.mean(collected_scans, axis=0)
-            print(f"Averaged {len(collected_scans)} scans")
-            print(f"Data length: {len(raw_data)}")
-            
-            # Adjust wavelength array if necessary to match data length
-            if len(raw_data) != len(self.wavelengths):
-                print(f"Adjusting wavelength array to match data: {len(raw_data)} points")
-                self.wavelengths = np.linspace(self.wavelength_start, self.wavelength_end, len(raw_data))
-            
-            # Apply dark correction if available
-            if self.dark_spectrum is not None and self.use_dark_correction:
-                print("Applying dark correction...")
-                # Ensure dark spectrum length matches data
-                if len(self.dark_spectrum) == len(raw_data):
-                    dark_corrected = raw_data - self.dark_spectrum
-                    # Ensure no negative values after dark correction
-                    dark_corrected = np.maximum(dark_corrected, 0)
-                    raw_data = dark_corrected
-                else:
-                    print(f"Warning: Dark spectrum length mismatch. Expected {len(raw_data)}, got {len(self.dark_spectrum)}")
-            
-            # Store the processed raw data
-            self.spectrum_data = raw_data
-            
-            # Apply boxcar smoothing to reduce noise (sliding window average)
-            boxcar_width = 3  # Must be odd number: 3, 5, 7, etc.
-            smoothed_data = np.copy(raw_data)
-            half_width = boxcar_width // 2
-            
-            for i in range(half_width, len(raw_data) - half_width):
-                smoothed_data[i] = np.mean(raw_data[i-half_width:i+half_width+1])
-            
-            # Calculate reflectance if reference spectrum is available
-            if self.reference_spectrum is not None and self.use_reference_correction:
-                print("Calculating reflectance...")
-                if len(self.reference_spectrum) == len(smoothed_data):
-                    # Calculate reflectance as I/I0 * 100%
-                    reflectance = (smoothed_data / self.reference_spectrum) * 100
-                    # Clip to reasonable range
-                    reflectance = np.clip(reflectance, 0, 100)
-                    plot_data = reflectance
-                    y_label = "Reflectance (%)"
-                    y_max = 100
-                else:
-                    print(f"Warning: Reference spectrum length mismatch. Expected {len(smoothed_data)}, got {len(self.reference_spectrum)}")
-                    plot_data = smoothed_data
-                    y_label = "Intensity (counts)"
-                    y_max = None
+        sequence, frame = self.acquisition.latest()
+        if frame is None or sequence == self._plotted_sequence:
+            # Nothing new since the last refresh
+            return
+        self._plotted_sequence = sequence
+        
+        self.wavelengths, raw_data, plot_data, y_label, y_max = frame
+        
+        # Store the processed raw data
+        self.spectrum_data = raw_data
+        
+        try:
+            # Only the persistent spectrum line is redrawn unless the axes changed
+            if self.live_plot.update(self.wavelengths, plot_data, y_label=y_label, y_max=y_max):
+                self.plot_widget.draw()
             else:
-                # Just use the smoothed counts
-                plot_data = smoothed_data
-                y_label = "Intensity (counts)"
-                y_max = None
+                self.plot_widget.blit()
             
-            try:
-                # Clear the previous plot
-                self.ax.clear()
-                
-                # Plot with proper formatting
-                min_value = np.min(plot_data)
-                max_value = np.max(plot_data)
-                
-                # Add buffer for better visualization
-                buffer = (max_value - min_value) * 0.1
-                y_min = max(0, min_value - buffer)
-                if y_max is None:
-                    y_max = max_value + buffer
-                
-                self.ax.plot(self.wavelengths, plot_data, 'b-', 
-                             linewidth=1.5, 
-                             label=f'Spectrum ({len(plot_data)} points)')
-                
-                # Set y-axis limits and label
-                self.ax.set_ylim(y_min, y_max)
-                self.ax.set_ylabel(y_label)
-                
-                # Add legend
-                self.ax.legend(loc='upper right')
-                
-                # Reapply plot settings
-                self._setup_plot()
-                
-                # Force redraw
-                self.plot_widget.draw()
-                
-                print("Plot updated successfully")
-            except Exception as e:
-                print(f"Error plotting data: {e}")
-                traceback.print_exc()
-        else:
-            print("Failed to acquire spectrum data")
+            print("Plot updated successfully")
+        except Exception as e:
+            print(f"Error plotting data: {e}")
+            traceback.print_exc()
 
     def collect_dark_spectrum(self, instance):
         """Collect a dark spectrum for noise correction."""
@@ -522,28 +601,36 @@ class MainLayout(BoxLayout):
                                size_hint=(0.6, 0.3))
         progress_popup.open()
         
+        # The reader thread must not share the USB device with us
+        resume_acquisition = self.acquisition.running
+        self.acquisition.stop()
+        
         # Collect multiple scans for better dark spectrum
-        dark_scans = []
         DARK_SCANS = 20  # More scans for better dark noise profile
-        
-        for _ in range(DARK_SCANS):
-            acquired = request_spectrum(
-                self.spectrometer.usb_device,
-                self.spectrometer.packet_size,
-                self.spectrometer.spectra_ep_in,
-                self.spectrometer.cmd_ep_out
-            )
-            if acquired:
-                dark_scans.append(acquired)
-        
-        if dark_scans:
-            # Average the dark scans
-            self.dark_spectrum = np.mean(dark_scans, axis=0)
+        try:
+            dark_scans = read_average(self.spectrometer, DARK_SCANS, track_variance=True,
+                                      integration_time_us=self.acquisition.integration_time_us)
+        except Exception as e:
+            print(f"Error collecting dark spectrum: {e}")
+            dark_scans = None
+        finally:
+            # Whatever happened, the popup below closes and the live view continues
+            if resume_acquisition:
+                self.acquisition.start()
+        
+        if dark_scans is not None and dark_scans.count:
+            # Average the dark scans and keep the per-pixel read noise
+            self.dark_spectrum = dark_scans.mean()
+            self.dark_noise = dark_scans.std()
             print(f"Dark spectrum collected - avg value: {np.mean(self.dark_spectrum):.2f}")
+            if self.dark_noise is not None:
+                print(f"Dark noise - avg std: {np.mean(self.dark_noise):.2f}")
+            self._rebuild_correction()
             
             # Save dark spectrum for future use
-            np.savetxt('dark_spectrum.csv', np.column_stack((self.wavelengths, self.dark_spectrum)), 
-                       delimiter=',', header='Wavelength,Dark_Counts')
+            self.exporter.submit(save_with_metadata, np.array(self.wavelengths), self.dark_spectrum.copy(),
+                                 filename='dark_spectrum.csv', spectra=1,
+                                 metadata={'Spectrum': 'Dark', 'Scans': dark_scans.count, 'Units': 'Counts'})
             
             progress_popup.dismiss()
             Popup(title='Success', 
@@ -586,36 +673,36 @@ class MainLayout(BoxLayout):
                                size_hint=(0.6, 0.3))
         progress_popup.open()
         
-        # Collect multiple scans for better reference spectrum
-        ref_scans = []
-        REF_SCANS = 10
+        # The reader thread must not share the USB device with us
+        resume_acquisition = self.acquisition.running
+        self.acquisition.stop()
         
-        for _ in range(REF_SCANS):
-            acquired = request_spectrum(
-                self.spectrometer.usb_device,
-                self.spectrometer.packet_size,
-                self.spectrometer.spectra_ep_in,
-                self.spectrometer.cmd_ep_out
-            )
-            if acquired and self.dark_spectrum is not None:
-                # Apply dark correction immediately
-                corrected = np.array(acquired) - self.dark_spectrum
-                corrected = np.maximum(corrected, 0)  # Ensure no negative values
-                ref_scans.append(corrected)
-            elif acquired:
-                ref_scans.append(acquired)
-        
-        if ref_scans:
+        # Collect multiple scans for better reference spectrum, dark-corrected as they arrive
+        REF_SCANS = 10
+        try:
+            ref_scans = read_average(self.spectrometer, REF_SCANS, dark=self.dark_spectrum,
+                                     integration_time_us=self.acquisition.integration_time_us)
+        except Exception as e:
+            print(f"Error collecting reference spectrum: {e}")
+            ref_scans = None
+        finally:
+            # Whatever happened, the popup below closes and the live view continues
+            if resume_acquisition:
+                self.acquisition.start()
+        
+        if ref_scans is not None and ref_scans.count:
             # Average the reference scans
-            self.reference_spectrum = np.mean(ref_scans, axis=0)
+            self.reference_spectrum = ref_scans.mean()
             print(f"Reference spectrum collected - avg value: {np.mean(self.reference_spectrum):.2f}")
             
             # Save reference spectrum for future use
-            np.savetxt('reference_spectrum.csv', np.column_stack((self.wavelengths, self.reference_spectrum)), 
-                       delimiter=',', header='Wavelength,Reference_Counts')
+            self.exporter.submit(save_with_metadata, np.array(self.wavelengths), self.reference_spectrum.copy(),
+                                 filename='reference_spectrum.csv', spectra=1,
+                                 metadata={'Spectrum': 'Reference', 'Scans': ref_scans.count, 'Units': 'Counts'})
             
             # Enable reference correction
             self.use_reference_correction = True
+            self._rebuild_correction()
             
             progress_popup.dismiss()
             Popup(title='Success', 
@@ -629,6 +716,7 @@ class MainLayout(BoxLayout):
 
     def open_file(self, instance):
         """Open a file dialog to load spectrum data."""
+        from kivy.uix.filechooser import FileChooserListView
         file_chooser = FileChooserListView()
         popup = Popup(title='Open File', content=file_chooser, size_hint=(0.9, 0.9))
         file_chooser.bind(on_submit=lambda instance, value, _: self.load_file(value))
@@ -637,9 +725,14 @@ class MainLayout(BoxLayout):
     def load_file(self, file_path):
         """Load spectrum data from a file and plot it."""
         try:
-            data = np.loadtxt(file_path, delimiter=',')
+            wavelengths, intensities, metadata = load_from_csv(file_path)
+            if wavelengths is None:
+                return
+            self.loaded_metadata = metadata
+            for key, value in metadata.items():
+                print(f"{key}: {value}")
             self.ax.clear()
-            self.ax.plot(data[:, 0], data[:, 1])
+            self.ax.plot(wavelengths, intensities)
             self._setup_plot()  # Reapply grid and labels
             self.plot_widget.draw()
         except Exception as e:
@@ -688,9 +781,8 @@ class MainLayout(BoxLayout):
                 import pyperclip
                 
                 # Create a formatted string with wavelength and intensity data
-                data_str = "Wavelength (nm),Intensity\n"
-                for i in range(len(self.wavelengths)):
-                    data_str += f"{self.wavelengths[i]:.2f},{self.spectrum_data[i]:.2f}\n"
+                rows = np.column_stack((self.wavelengths, self.spectrum_data)).tolist()
+                data_str = "Wavelength (nm),Intensity\n" + ''.join('%.2f,%.2f\n' % tuple(row) for row in rows)
                 
                 # Copy to clipboard
                 pyperclip.copy(data_str)
@@ -713,6 +805,7 @@ class MainLayout(BoxLayout):
         """Save the current spectrum data to a CSV file."""
         if hasattr(self, 'spectrum_data') and self.spectrum_data is not None:
             # Open a file chooser popup
+            from kivy.uix.filechooser import FileChooserListView
             file_chooser = FileChooserListView(filters=['*.csv'])
             
             # Create a save button
@@ -757,7 +850,7 @@ class MainLayout(BoxLayout):
                     filename=filename,
                     metadata={
                         'Device': 'NIR-Quest',
-                        'Integration time': '100ms',
+                        'Integration time': f'{self._current_integration_time_ms()}ms',
                         'Units': 'Reflectance (%)',  # Note the units in metadata
                         'Raw count max': str(max(self.spectrum_data))  # Keep raw info too
                     }
@@ -811,7 +904,7 @@ class MainLayout(BoxLayout):
         content = BoxLayout(orientation='vertical', spacing=10, padding=10)
         
         # Current integration time display
-        current_time = 100  # Default ms, replace with actual value if available
+        current_time = self._current_integration_time_ms()
         
         # Integration time slider
         slider_layout = BoxLayout(orientation='horizontal', size_hint=(1, 0.5))
@@ -828,6 +921,13 @@ class MainLayout(BoxLayout):
             value_label.text = f"{int(value)} ms"
         time_slider.bind(value=update_label)
         
+        # Auto exposure: the slider value is only the starting point
+        auto_layout = BoxLayout(orientation='horizontal', size_hint=(1, 0.3))
+        auto_label = Label(text="Auto Exposure:", size_hint=(0.6, 1))
+        auto_switch = Switch(active=self.acquisition.auto_exposure is not None, size_hint=(0.4, 1))
+        auto_layout.add_widget(auto_label)
+        auto_layout.add_widget(auto_switch)
+        
         # Buttons
         button_layout = BoxLayout(orientation='horizontal', size_hint=(1, 0.3))
         cancel_btn = Button(text="Cancel", size_hint=(0.5, 1))
@@ -838,37 +938,50 @@ class MainLayout(BoxLayout):
         # Build the layout
         content.add_widget(slider_layout)
         content.add_widget(value_label)
+        content.add_widget(auto_layout)
         content.add_widget(button_layout)
         
         # Create the popup
-        popup = Popup(title='Set Integration Time', content=content, size_hint=(0.7, 0.4))
+        popup = Popup(title='Set Integration Time', content=content, size_hint=(0.7, 0.5))
         
         # Button actions
         cancel_btn.bind(on_release=popup.dismiss)
-        apply_btn.bind(on_release=lambda x: self._apply_integration_time(popup, time_slider.value))
+        apply_btn.bind(on_release=lambda x: self._apply_integration_time(
+            popup, time_slider.value, auto_switch.active))
         
         popup.open()
 
-    def _apply_integration_time(self, popup, integration_time):
-        """Apply the selected integration time to the spectrometer."""
+    def _current_integration_time_ms(self):
+        """Integration time in use (auto exposure may have changed it since it was set)."""
+        if self.acquisition.integration_time_us:
+            return self.acquisition.integration_time_us // 1000
+        return self.integration_time_ms
+
+    def _apply_integration_time(self, popup, integration_time, auto_exposure=False):
+        """Apply the selected integration time (and auto exposure) to the spectrometer."""
         integration_time = int(integration_time)
         popup.dismiss()
         
         try:
-            # Here you would call the appropriate USB command to set integration time
-            # on the NIRQuest spectrometer. This requires proper USB command structure.
-            # For example (pseudo-code):
-            set_integration_time_command(
-                self.spectrometer.usb_device,
-                self.spectrometer.cmd_ep_out,
-                integration_time
-            )
+            if auto_exposure:
+                # Peak counts are measured above the dark level when a dark spectrum is known
+                dark_level = float(np.median(self.dark_spectrum)) if self.dark_spectrum is not None else 0.0
+                self.acquisition.auto_exposure = AutoExposure.for_model(
+                    self.spectrometer.model_name, dark_level=dark_level)
+            else:
+                self.acquisition.auto_exposure = None
+            # Sent by the acquisition thread between reads when it is running
+            applied = self.acquisition.set_integration_time(integration_time * 1000)
+            if applied is not None:
+                integration_time = applied // 1000
             
-            print(f"Integration time set to {integration_time} ms")
+            self.integration_time_ms = integration_time
+            mode = " (auto exposure)" if auto_exposure else ""
+            print(f"Integration time set to {integration_time} ms{mode}")
             
             # Show confirmation
             Popup(title='Success', 
-                  content=Label(text=f'Integration time set to {integration_time} ms'),
+                  content=Label(text=f'Integration time set to {integration_time} ms{mode}'),
                   size_hint=(0.6, 0.3)).open()
         except Exception as e:
             print(f"Error setting integration time: {e}")
@@ -931,6 +1044,7 @@ class MainLayout(BoxLayout):
         
         self.averaging_enabled = enabled
         self.scans_to_average = scans
+        self.acquisition.scans_to_average = scans if enabled else 1
         
         print(f"Averaging settings updated: enabled={enabled}, scans={scans}")
         
@@ -942,7 +1056,13 @@ class MainLayout(BoxLayout):
         
     def check_icon_paths(self):
         """Debug method to verify icon paths exist."""
-        import os
+        print("Checking for icon directories...")
+        if not os.path.exists("frontend"):
+            print("WARNING: 'frontend' directory not found!")
+        if not os.path.exists("frontend/icons"):
+            print("WARNING: 'frontend/icons' directory not found!")
+        else:
+            print(f"frontend/icons directory exists and contains: {os.listdir('frontend/icons')}")
         
         icon_paths = [
             'frontend/icons/app_icon.png',
@@ -951,6 +1071,7 @@ class MainLayout(BoxLayout):
             'frontend/icons/run_n_pause.png',
             'frontend/icons/dark_mode.png',
             'frontend/icons/reference.png',
+            'frontend/icons/save_graph.png',
             'frontend/icons/scale_to_fill_window.png',
             'frontend/icons/zoom_into_graph.png',
             'frontend/icons/zoom_out.png',
@@ -982,15 +1103,39 @@ class MainLayout(BoxLayout):
         print(f"Updated bar background: pos={instance.pos}, size={instance.size}")
 
 class SpectrumApp(App):
+    # Called with the app once its first frame has been drawn (startup timing)
+    first_frame_callback = None
+    # Started backend.streaming.SpectrumServer to publish live frames on, if any
+    stream_server = None
+
     def build(self):
         # Simplify app initialization for now to ensure the main screen appears
         print("Starting NIR Spectrometer Software...")
         
         # Create and return the main layout directly
-        return MainLayout()
+        layout = MainLayout()
+        layout.stream_server = self.stream_server
+        return layout
+
+    def on_start(self):
+        if self.first_frame_callback is not None:
+            from kivy.core.window import Window
+            Window.bind(on_flip=self._first_frame)
+
+    def _first_frame(self, window):
+        window.unbind(on_flip=self._first_frame)
+        self.first_frame_callback(self)
 
     def on_stop(self):
         """Clean up resources when the app stops."""
+        if hasattr(self.root, 'acquisition'):
+            self.root.acquisition.stop()
+        if hasattr(self.root, 'recorder'):
+            self.root.stop_recording()
+        if hasattr(self.root, 'exporter'):
+            self.root.exporter.stop()
+        if self.stream_server is not None:
+            self.stream_server.stop()
         if hasattr(self.root, 'spectrometer'):
             drop_spectrometer(self.root.spectrometer.usb_device)
 
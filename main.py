@@ -1,4 +1,13 @@
-from frontend.ui import SpectrumApp
+import time
+
+STARTED = time.perf_counter()
+
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
 # import usb.backend.libusb1
 # import usb.core
 
@@ -11,5 +20,89 @@ from frontend.ui import SpectrumApp
 # for device in devices:
 #     print(device)
 
+FIRST_WINDOW_MARKER = 'FIRST WINDOW'
+
+def parse_args(argv=None):
+    """Parse our options; anything else is left for Kivy."""
+    parser = argparse.ArgumentParser(description='NIR Spectrometer Software')
+    parser.add_argument('--headless', action='store_true',
+                        help='acquire and write spectra without the GUI (see --headless --help)')
+    parser.add_argument('--startup-time', action='store_true',
+                        help='start the application once, report the time to the first window and '
+                             'the import time per package, then exit')
+    parser.add_argument('--top', type=int, default=15, help='packages listed by --startup-time')
+    parser.add_argument('--tcp-port', type=int, help='publish live spectra to clients on this TCP port')
+    parser.add_argument('--unix-socket', help='publish live spectra to clients on this Unix socket')
+    parser.add_argument('--websocket-port', type=int, help='publish live spectra to WebSocket clients on this port')
+    parser.add_argument('--host', default='127.0.0.1', help='address the TCP and WebSocket ports listen on')
+    # Run by --startup-time under -X importtime: exit after the first frame
+    parser.add_argument('--first-window', action='store_true', help=argparse.SUPPRESS)
+    return parser.parse_known_args(argv)
+
+def parse_import_times(text):
+    """Return ``{package: seconds}`` of self import time from ``-X importtime`` output.
+
+    Times are summed per top-level package, so nested modules (e.g. every
+    ``scipy.*`` submodule) count towards their package.
+    """
+    packages = defaultdict(float)
+    for line in text.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # column header
+        name = fields[2].strip().split('.')[0]
+        packages[name] += int(fields[0]) / 1e6
+    return dict(packages)
+
+def measure_startup(top=15, kivy_args=()):
+    """Run the application once under ``-X importtime`` and print the startup report."""
+    command = [sys.executable, '-X', 'importtime', os.path.abspath(__file__), '--first-window', *kivy_args]
+    result = subprocess.run(command, capture_output=True, text=True)
+    timings = [line for line in result.stdout.splitlines() if line.startswith(FIRST_WINDOW_MARKER)]
+    if not timings:
+        print(result.stdout[-2000:])
+        print(result.stderr[-2000:])
+        raise SystemExit(f"The application exited (code {result.returncode}) before showing a window")
+
+    packages = parse_import_times(result.stderr)
+    total = sum(packages.values())
+    print(timings[-1])
+    print(f"Imports: {total:.3f} s in {len(packages)} packages (includes -X importtime overhead)")
+    for name, seconds in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]:
+        print(f"  {name:24s} {seconds * 1000:8.1f} ms  {seconds / total:5.1%}")
+
+def run_app(first_window=False, stream_options=None):
+    from frontend.ui import SpectrumApp
+    imported = time.perf_counter()
+    app = SpectrumApp()
+    if stream_options:
+        from backend.streaming import SpectrumServer
+        app.stream_server = SpectrumServer(**stream_options)
+        app.stream_server.start()
+        print(f"Publishing live spectra on {app.stream_server.addresses}")
+    if first_window:
+        def report(app):
+            print(f"{FIRST_WINDOW_MARKER} after {time.perf_counter() - STARTED:.3f} s "
+                  f"(imports done after {imported - STARTED:.3f} s)", flush=True)
+            app.stop()
+        app.first_frame_callback = report
+    app.run()
+
 if __name__ == '__main__':
-    SpectrumApp().run()
\ No newline at end of file
+    if '--headless' in sys.argv[1:]:
+        # Never imports Kivy or matplotlib; every other option (--help too) is its own
+        from backend.headless import main as headless_main
+        sys.exit(headless_main([arg for arg in sys.argv[1:] if arg != '--headless']))
+    args, kivy_args = parse_args()
+    # Kivy parses sys.argv itself and rejects options it does not know
+    sys.argv = sys.argv[:1] + kivy_args
+    if args.startup_time:
+        measure_startup(args.top, kivy_args)
+    else:
+        stream_options = None
+        if any(option is not None for option in (args.tcp_port, args.unix_socket, args.websocket_port)):
+            stream_options = dict(port=args.tcp_port, unix_path=args.unix_socket,
+                                  websocket_port=args.websocket_port, host=args.host)
+        run_app(args.first_window, stream_options)
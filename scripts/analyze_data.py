@@ -1,5 +1,228 @@
+"""Batch analysis of saved spectra.
+
+Walks a directory tree of saved spectra (.csv and .nirs), smooths and
+baseline-corrects them, extracts features and peaks, and writes one row per
+spectrum to a single CSV. Files are handed to a process pool in chunks so
+the work spreads over all cores:
+
+    python scripts/analyze_data.py DATA_DIR -o results.csv --workers 8
+
+CSV spectra of the same length are processed as one stack; .nirs archives
+are read straight from their memory map in blocks of ``--rows-per-batch``
+spectra, so an archive never has to fit in memory as float64. Peaks are
+found per file with backend.peaks.detect_peaks_batch (see ``--height``,
+``--prominence`` and ``--width``).
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
 import pandas as pd
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.data_saving import load_from_csv
+from backend.peaks import detect_peaks_batch
+from backend.pipeline import Pipeline, SmoothStage, BaselineStage
+from backend.spectrum_file import SpectrumFile
+from data_processing import DataProcessor, FEATURE_DTYPE
+
+EXTENSIONS = ('.csv', '.nirs')
+COLUMNS = (['file', 'index', 'points'] + list(FEATURE_DTYPE.names) + ['peak_count', 'peak_wavelengths'])
+
 def analyze_data(filename="spectrum_data.csv"):
     data = pd.read_csv(filename)
-    print(data.describe())
\ No newline at end of file
+    print(data.describe())
+
+def find_spectrum_files(root, extensions=EXTENSIONS):
+    """Yield spectrum files below ``root`` in a stable (sorted) order."""
+    if os.path.isfile(root):
+        yield root
+        return
+    entries = sorted(os.scandir(root), key=lambda entry: entry.name)
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            yield from find_spectrum_files(entry.path, extensions)
+        elif entry.name.lower().endswith(extensions):
+            yield entry.path
+
+def _load(path):
+    """Return ``(wavelengths, spectra_2d)`` for a CSV or .nirs file.
+
+    The spectra of a .nirs file stay memory-mapped in their stored dtype.
+    """
+    if path.lower().endswith('.nirs'):
+        spectrum_file = SpectrumFile(path)
+        return spectrum_file.wavelengths, spectrum_file.spectra
+    wavelengths, intensities, _ = load_from_csv(path, dtype=np.float64)
+    if wavelengths is None:
+        raise ValueError("unreadable CSV")
+    return wavelengths, intensities[np.newaxis]
+
+_pipelines = {}
+
+def _pipeline(smooth_window, polyorder, baseline_degree):
+    # Built once per worker process and reused for every chunk
+    key = (smooth_window, polyorder, baseline_degree)
+    if key not in _pipelines:
+        stages = []
+        if smooth_window:
+            stages.append(SmoothStage('savgol', window_length=smooth_window, polyorder=polyorder))
+        if baseline_degree is not None:
+            stages.append(BaselineStage(baseline_degree))
+        _pipelines[key] = Pipeline(stages)
+    return _pipelines[key]
+
+def _rows(path, first_index, wavelengths, processed, features, peak_options):
+    """Result rows for consecutive processed spectra of one file."""
+    peaks = detect_peaks_batch(processed, wavelengths, interpolation=None, **peak_options)
+    # Records come row by row, so each spectrum's peaks are one slice
+    bounds = np.searchsorted(peaks['spectrum'], np.arange(len(processed) + 1))
+    rows = []
+    for row, record in enumerate(features):
+        found = peaks['wavelength'][bounds[row]:bounds[row + 1]]
+        rows.append([path, first_index + row, processed.shape[1]] + list(record.tolist())
+                    + [len(found), ';'.join(f'{peak:.2f}' for peak in found)])
+    return rows
+
+def analyze_chunk(paths, smooth_window=11, polyorder=3, baseline_degree=None, height=1000, prominence=None,
+                  width=None, rows_per_batch=4096):
+    """Analyze a list of files; returns ``(rows, failed_paths)``.
+
+    CSV spectra with the same length are stacked and processed as one batch;
+    .nirs archives are processed in blocks of ``rows_per_batch`` spectra.
+    """
+    pipeline = _pipeline(smooth_window, polyorder, baseline_degree)
+    peak_options = {'height': height, 'prominence': prominence, 'width': width}
+    groups = {}
+    failed = []
+    rows = []
+    for path in paths:
+        try:
+            wavelengths, spectra = _load(path)
+            if not path.lower().endswith('.nirs'):
+                groups.setdefault(spectra.shape[1], []).append((path, wavelengths, spectra[0]))
+                continue
+            file_rows = []
+            for start in range(0, len(spectra), rows_per_batch):
+                block = np.asarray(spectra[start:start + rows_per_batch], dtype=np.float64)
+                processed = pipeline.run(block) if pipeline.stages else block
+                file_rows.extend(_rows(path, start, wavelengths, processed,
+                                       DataProcessor.extract_features(processed), peak_options))
+            rows.extend(file_rows)
+        except Exception as e:
+            failed.append((path, str(e)))
+
+    for pixels, items in groups.items():
+        batch = np.vstack([spectrum for _, _, spectrum in items])
+        try:
+            processed = pipeline.run(batch) if pipeline.stages else batch
+        except ValueError as e:
+            failed.extend((path, str(e)) for path, _, _ in items)
+            continue
+        features = DataProcessor.extract_features(processed)
+        for row, (path, wavelengths, _) in enumerate(items):
+            rows.extend(_rows(path, 0, wavelengths, processed[row:row + 1], features[row:row + 1], peak_options))
+    return rows, failed
+
+def _chunks(paths, chunk_size):
+    chunk = []
+    for path in paths:
+        chunk.append(path)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _progress(done_files, total_files, started, stream=sys.stderr):
+    elapsed = time.perf_counter() - started
+    rate = done_files / elapsed if elapsed > 0 else 0.0
+    stream.write(f"\r{done_files}/{total_files} files ({rate:.0f} files/s)")
+    stream.flush()
+
+def analyze_directory(root, output, workers=None, chunk_size=256, progress=True, **options):
+    """Analyze every spectrum file below ``root`` and write the rows to ``output``.
+
+    Returns a summary dict with file, spectrum and failure counts and the
+    elapsed time. ``workers=1`` runs in this process without a pool.
+    """
+    workers = workers or os.cpu_count() or 1
+    output_path = os.path.abspath(output)
+    paths = [path for path in find_spectrum_files(root) if os.path.abspath(path) != output_path]
+    started = time.perf_counter()
+    summary = {'files': len(paths), 'spectra': 0, 'failed': 0, 'workers': workers}
+
+    with open(output, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        done = 0
+
+        def collect(chunk, result):
+            nonlocal done
+            rows, failed = result
+            writer.writerows(rows)
+            for path, error in failed:
+                print(f"\nError analyzing {path}: {error}", file=sys.stderr)
+            summary['spectra'] += len(rows)
+            summary['failed'] += len(failed)
+            done += len(chunk)
+            if progress:
+                _progress(done, len(paths), started)
+
+        if workers == 1:
+            for chunk in _chunks(paths, chunk_size):
+                collect(chunk, analyze_chunk(chunk, **options))
+        else:
+            # Keep a bounded number of chunks in flight so memory stays flat
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                pending = {}
+                chunks = _chunks(paths, chunk_size)
+                for chunk in chunks:
+                    pending[executor.submit(analyze_chunk, chunk, **options)] = chunk
+                    if len(pending) >= workers * 4:
+                        finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            collect(pending.pop(future), future.result())
+                for future in list(pending):
+                    collect(pending.pop(future), future.result())
+        if progress and paths:
+            sys.stderr.write('\n')
+
+    summary['elapsed'] = time.perf_counter() - started
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze a directory tree of saved spectra.")
+    parser.add_argument('root', help="directory (or single file) of .csv/.nirs spectra")
+    parser.add_argument('-o', '--output', default='analysis_results.csv', help="aggregated results CSV")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--chunk-size', type=int, default=256, help="files per work unit")
+    parser.add_argument('--smooth-window', type=int, default=11, help="Savitzky-Golay window, 0 to disable")
+    parser.add_argument('--polyorder', type=int, default=3, help="Savitzky-Golay polynomial order")
+    parser.add_argument('--baseline-degree', type=int, default=None, help="subtract a polynomial baseline")
+    parser.add_argument('--height', type=float, default=1000,
+                        help="minimum peak height in the processed spectra (default: 1000)")
+    parser.add_argument('--prominence', type=float, default=None, help="minimum peak prominence")
+    parser.add_argument('--width', type=float, default=None, help="minimum peak width in pixels")
+    parser.add_argument('--rows-per-batch', type=int, default=4096,
+                        help=".nirs spectra read from disk and processed at a time")
+    parser.add_argument('--quiet', action='store_true', help="do not show progress")
+    args = parser.parse_args(argv)
+
+    summary = analyze_directory(args.root, args.output, workers=args.workers, chunk_size=args.chunk_size,
+                                progress=not args.quiet, smooth_window=args.smooth_window,
+                                polyorder=args.polyorder, baseline_degree=args.baseline_degree,
+                                height=args.height, prominence=args.prominence, width=args.width,
+                                rows_per_batch=args.rows_per_batch)
+    print(f"Analyzed {summary['spectra']} spectra from {summary['files']} files "
+          f"({summary['failed']} failed) in {summary['elapsed']:.1f} s with {summary['workers']} workers; "
+          f"results in {args.output}")
+    return 0 if not summary['failed'] else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,667 @@
+"""Microbenchmarks for the acquisition and processing hot paths.
+
+Run from the repository root:
+
+    python scripts/benchmark.py [name ...]
+"""
+import contextlib
+import os
+import struct
+import sys
+import tempfile
+import time
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.spectrometer import decode_frame, END_MARKER
+from config.ocean_optics_configs import model_configs
+
+
+def _time_per_call(func, repeat=5, number=None):
+    """Return the best time per call in seconds."""
+    timer = timeit.Timer(func)
+    if number is None:
+        number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+@contextlib.contextmanager
+def _quiet():
+    """Silence the per-frame prints of the USB helpers while timing."""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def _legacy_decode(received_data):
+    """The per-pixel decoder request_spectrum used before decode_frame."""
+    actual_size = len(received_data)
+    if actual_size > 0 and received_data[actual_size - 1] != 0x69:
+        return None
+    spectrum = []
+    for i in range(0, actual_size - 1, 2):
+        if i + 1 < actual_size:
+            intensity = struct.unpack('<H', bytes([received_data[i], received_data[i + 1]]))[0]
+            spectrum.append(intensity)
+    return spectrum
+
+
+def bench_decoder():
+    """Compare the legacy decoder with decode_frame for every packet size."""
+    from array import array
+
+    print("Frame decoder (per frame)")
+    packet_sizes = sorted({config[2] for config in model_configs})
+    rng = np.random.default_rng(0)
+    for packet_size in packet_sizes:
+        payload = rng.integers(0, 65535, (packet_size - 1) // 2, dtype='<u2').tobytes()
+        frame = array('B', payload + bytes([END_MARKER]))
+        models = ', '.join(config[1] for config in model_configs if config[2] == packet_size)
+
+        legacy = _time_per_call(lambda: _legacy_decode(frame), number=20)
+        vectorized = _time_per_call(lambda: decode_frame(frame))
+        print(f"  {packet_size} bytes ({models})")
+        print(f"    legacy:     {legacy * 1e6:10.1f} us")
+        print(f"    vectorized: {vectorized * 1e6:10.1f} us  ({legacy / vectorized:.0f}x)")
+
+
+def bench_simulated_pipeline(duration=1.0):
+    """Run acquisition, processing and saving against simulated spectrometers."""
+    from backend.acquisition import AcquisitionEngine
+    from backend.data_saving import save_with_metadata
+    from backend.simulator import SimulatedSpectrometer
+    from backend.spectrometer import find_spectrometer
+
+    print(f"Simulated acquisition pipeline ({duration:.1f} s per model)")
+    models = {}
+    for config in model_configs:
+        models.setdefault(config[2], config[1])
+    for model_name in models.values():
+        device = SimulatedSpectrometer(model_name, integration_time_us=100, seed=0)
+        with _quiet():
+            engine = AcquisitionEngine(find_spectrometer([device]), scans_to_average=10)
+            engine.start()
+            time.sleep(duration)
+            engine.stop()
+        _, spectrum = engine.latest()
+
+        wavelengths = np.linspace(900, 2500, len(spectrum))
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'spectrum.csv')
+            save_time = _time_per_call(lambda: save_with_metadata(wavelengths, spectrum, filename), repeat=3)
+        print(f"  {model_name}: {engine.frame_rate:8.0f} frames/s, "
+              f"{engine.processed_count / duration:6.0f} averaged spectra/s, save {save_time * 1e3:.1f} ms")
+
+
+def _legacy_boxcar(raw_data, boxcar_width=3):
+    """The per-pixel boxcar loop collect_data used before backend.smoothing."""
+    smoothed_data = np.copy(raw_data)
+    half_width = boxcar_width // 2
+    for i in range(half_width, len(raw_data) - half_width):
+        smoothed_data[i] = np.mean(raw_data[i - half_width:i + half_width + 1])
+    return smoothed_data
+
+
+def bench_smoothing():
+    """Time the smoothing kernels on single spectra and batches."""
+    from scipy.signal import savgol_filter
+    from backend.smoothing import boxcar, savitzky_golay, gaussian
+
+    print("Smoothing")
+    rng = np.random.default_rng(0)
+    for pixels in (512, 4096):
+        spectrum = rng.normal(10000, 100, pixels)
+        legacy = _time_per_call(lambda: _legacy_boxcar(spectrum), number=5)
+        vectorized = _time_per_call(lambda: boxcar(spectrum))
+        print(f"  {pixels} px boxcar(3): legacy {legacy * 1e3:8.3f} ms, "
+              f"cumsum {vectorized * 1e3:8.3f} ms ({legacy / vectorized:.0f}x)")
+
+        for batch in (1, 100, 10000):
+            spectra = rng.normal(10000, 100, (batch, pixels))
+            number = 1 if batch * pixels > 10**6 else None
+            times = {
+                'boxcar(5)': _time_per_call(lambda: boxcar(spectra, 5), repeat=3, number=number),
+                'savgol(11,3)': _time_per_call(lambda: savitzky_golay(spectra, 11, 3), repeat=3, number=number),
+                'scipy savgol': _time_per_call(lambda: savgol_filter(spectra, 11, 3), repeat=3, number=number),
+                'gaussian(2)': _time_per_call(lambda: gaussian(spectra, 2.0), repeat=3, number=number),
+            }
+            summary = ', '.join(f"{name} {batch / seconds:,.0f}/s" for name, seconds in times.items())
+            print(f"  {pixels} px x {batch}: {summary}")
+            del spectra
+
+
+def bench_live_plot(pixels=4096):
+    """Compare a full re-plot per frame with the blitted LivePlot update."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from backend.simulator import SimulatedSpectrometer
+    from frontend.live_plot import LivePlot
+
+    print(f"Live plot redraw ({pixels} points, 1000x600 px)")
+    device = SimulatedSpectrometer(seed=0, integration_time_us=100000)
+    device.signal = np.interp(np.linspace(0, 1, pixels), np.linspace(0, 1, device.pixels), device.signal)
+    device.pixels = pixels
+    wavelengths = np.linspace(900, 2500, pixels)
+    frames = [device.render_frame().astype(np.float64) for _ in range(8)]
+
+    fig, ax = plt.subplots(figsize=(10, 6), dpi=100)
+    canvas = FigureCanvasAgg(fig)
+    state = {'i': 0}
+
+    def full_replot():
+        data = frames[state['i'] % len(frames)]
+        state['i'] += 1
+        ax.clear()
+        ax.plot(wavelengths, data, 'b-', linewidth=1.5, label=f'Spectrum ({pixels} points)')
+        ax.set_ylim(0, data.max() * 1.1)
+        ax.legend(loc='upper right')
+        ax.minorticks_on()
+        ax.grid(True, which='both', color='lightgray', linestyle='--', alpha=0.7)
+        canvas.draw()
+
+    live_plot = LivePlot(ax)
+    ax.clear()
+
+    def live_update():
+        data = frames[state['i'] % len(frames)]
+        state['i'] += 1
+        if live_plot.update(wavelengths, data, y_label='Intensity (counts)'):
+            canvas.draw()
+
+    full = _time_per_call(full_replot, repeat=3, number=10)
+    live_update()
+    blit = _time_per_call(live_update, repeat=3, number=50)
+    print(f"  full re-plot: {full * 1e3:7.2f} ms")
+    print(f"  blit update:  {blit * 1e3:7.2f} ms  ({full / blit:.0f}x, "
+          f"{live_plot.full_redraws} full redraws, {live_plot.blits} blits)")
+    plt.close(fig)
+
+
+def _legacy_load_from_csv(filename):
+    """The two-pass loader data_saving used before the single-pass parser."""
+    import pandas as pd
+    with open(filename, 'r') as f:
+        lines = f.readlines()
+    metadata = {}
+    data_start = 0
+    for i, line in enumerate(lines):
+        if line.startswith('#'):
+            if ':' in line:
+                key, value = line[1:].strip().split(':', 1)
+                metadata[key.strip()] = value.strip()
+            data_start = i + 1
+        else:
+            break
+    df = pd.read_csv(filename, skiprows=data_start)
+    return df['Wavelength'].values, df['Intensity'].values, metadata
+
+
+def bench_csv_load(files=300, pixels=2048):
+    """Load archived CSV spectra with the old and the single-pass loader."""
+    from backend.data_saving import save_with_metadata, load_from_csv
+
+    print(f"CSV loading ({files} files x {pixels} points)")
+    rng = np.random.default_rng(0)
+    wavelengths = np.linspace(900, 2500, pixels)
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        for i in range(files):
+            path = os.path.join(directory, f'spectrum_{i:05d}.csv')
+            save_with_metadata(wavelengths, rng.uniform(0, 100, pixels), filename=path,
+                               metadata={'Device': 'NIR-Quest', 'Integration time': '100ms'})
+            paths.append(path)
+
+        def load_all(loader):
+            for path in paths:
+                loader(path)
+
+        legacy = _time_per_call(lambda: load_all(_legacy_load_from_csv), repeat=3, number=1)
+        loadtxt = _time_per_call(lambda: load_all(lambda path: np.loadtxt(path, delimiter=',', skiprows=8)),
+                                 repeat=3, number=1)
+        single_pass = _time_per_call(lambda: load_all(load_from_csv), repeat=3, number=1)
+        print(f"  two-pass readlines + read_csv: {files / legacy:8.0f} files/s")
+        print(f"  np.loadtxt (no metadata):      {files / loadtxt:8.0f} files/s")
+        print(f"  single-pass loader:            {files / single_pass:8.0f} files/s ({legacy / single_pass:.1f}x)")
+
+
+def bench_export(spectra=1000, pixels=512):
+    """Export a stack of spectra: one file per spectrum vs one batch file."""
+    from backend.data_saving import save_with_metadata
+    from backend.export import export_spectra, BackgroundExporter
+
+    print(f"Batch export ({spectra} spectra x {pixels} points)")
+    rng = np.random.default_rng(0)
+    wavelengths = np.linspace(900, 2500, pixels)
+    stack = rng.uniform(0, 65535, (spectra, pixels))
+    rows = [{'Index': i, 'Timestamp': f'{i * 0.01:.2f}'} for i in range(spectra)]
+    with tempfile.TemporaryDirectory() as directory:
+        def per_file():
+            for i, spectrum in enumerate(stack):
+                save_with_metadata(wavelengths, spectrum, filename=os.path.join(directory, f'{i}.csv'))
+
+        per_spectrum = _time_per_call(per_file, repeat=1, number=1)
+        print(f"  save_with_metadata per spectrum: {spectra / per_spectrum:9.0f} spectra/s")
+        for extension in ('csv', 'nirs'):
+            path = os.path.join(directory, f'batch.{extension}')
+            elapsed = _time_per_call(lambda: export_spectra(path, wavelengths, stack, row_metadata=rows),
+                                     repeat=3, number=1)
+            print(f"  export_spectra .{extension:<16s} {spectra / elapsed:9.0f} spectra/s")
+
+        # Time spent by the caller when the writes go to the background thread
+        exporter = BackgroundExporter()
+        start = time.perf_counter()
+        for i in range(0, spectra, 100):
+            exporter.export(os.path.join(directory, f'bg{i}.csv'), wavelengths, stack[i:i + 100])
+        queued = time.perf_counter() - start
+        exporter.join()
+        exporter.stop()
+        print(f"  background .csv:                 {exporter.spectra_per_second:9.0f} spectra/s "
+              f"(caller blocked {queued * 1e3:.1f} ms)")
+
+
+def bench_recorder(frames=20000, pixels=2048, duration=1.0):
+    """Record raw frames: record() cost, disk throughput and a live simulated run."""
+    from backend.acquisition import AcquisitionEngine
+    from backend.recorder import SpectrumRecorder
+    from backend.simulator import SimulatedSpectrometer
+    from backend.spectrometer import find_spectrometer
+
+    print(f"Time-series recorder ({pixels} points per frame)")
+    rng = np.random.default_rng(0)
+    stack = rng.integers(0, 65535, (64, pixels), dtype=np.uint16)
+    wavelengths = np.linspace(900, 2500, pixels)
+    with tempfile.TemporaryDirectory() as directory:
+        recorder = SpectrumRecorder(os.path.join(directory, 'bench.nirr'), wavelengths,
+                                    chunk_frames=256, max_pending_chunks=frames // 256 + 1)
+        start = time.perf_counter()
+        for i in range(frames):
+            recorder.record(stack[i % 64])
+        queued = time.perf_counter() - start
+        recorder.close()
+        total = time.perf_counter() - start
+        size = os.path.getsize(recorder.filename) / 1e6
+        print(f"  record():       {frames / queued:9.0f} frames/s ({queued / frames * 1e6:.2f} us per frame)")
+        print(f"  written to disk: {frames / total:8.0f} frames/s ({size / total:.0f} MB/s, "
+              f"{recorder.fsyncs} fsyncs)")
+
+        device = SimulatedSpectrometer('NIRQUEST', integration_time_us=100, seed=0)
+        with _quiet():
+            engine = AcquisitionEngine(find_spectrometer([device]))
+            engine.start()
+            time.sleep(duration / 2)
+            engine.stop()
+            unrecorded_rate = engine.frame_rate
+            recorder = SpectrumRecorder(os.path.join(directory, 'live.nirr'),
+                                        np.linspace(900, 2500, device.pixels), fsync_interval=0.5)
+            engine.add_frame_callback(recorder.on_frame)
+            engine.start()
+            time.sleep(duration)
+            engine.stop()
+            recorder.close()
+        print(f"  simulated NIRQUEST: {unrecorded_rate:6.0f} frames/s without recording, "
+              f"{engine.frame_rate:6.0f} frames/s recorded ({recorder.frames_written} written, "
+              f"{recorder.dropped_frames} dropped)")
+
+
+def _legacy_calculate_custom(data, formula):
+    """The eval-per-call formula evaluation utils used before the compiled engine."""
+    formula = formula.replace('x', 'data')
+    return eval(formula)
+
+
+def bench_formula(spectra=1000, pixels=2048):
+    """Evaluate custom formulas per spectrum and on a whole batch."""
+    from utils import calculate_custom, compile_formula
+
+    print(f"Custom formulas ({spectra} spectra x {pixels} points)")
+    batch = np.random.default_rng(0).uniform(1, 65535, (spectra, pixels))
+    for formula in ('(x - 1500) / 655.35', 'log10(100 / x)', 'x / max(x)'):
+        compiled = compile_formula(formula)
+        backend = 'numexpr' if compiled.uses_numexpr else 'numpy'
+        try:
+            legacy = _time_per_call(lambda: [_legacy_calculate_custom(row, formula) for row in batch], repeat=3)
+            legacy_rate = f"{spectra / legacy:9.0f} spectra/s"
+        except Exception:
+            legacy_rate = f"{'fails':>19s}"
+        per_spectrum = _time_per_call(lambda: [calculate_custom(row, formula) for row in batch], repeat=3)
+        batched = _time_per_call(lambda: calculate_custom(batch, formula), repeat=3)
+        print(f"  {formula:22s} eval per call {legacy_rate}, compiled {spectra / per_spectrum:9.0f}, "
+              f"2-D batch ({backend}) {spectra / batched:9.0f}")
+
+
+def _legacy_process(spectrum):
+    """Normalize, baseline and features one spectrum at a time, as DataProcessor used to."""
+    normalized = (spectrum - np.min(spectrum)) / (np.max(spectrum) - np.min(spectrum))
+    pixels = np.arange(len(spectrum))
+    baseline = np.polyval(np.polyfit(pixels, spectrum, 2), pixels)
+    features = {"max_intensity": np.max(spectrum), "mean_intensity": np.mean(spectrum)}
+    return normalized, spectrum - baseline, features
+
+
+def bench_batch_processing(spectra=100000, pixels=512, chunk=10000):
+    """Normalize, baseline-correct and extract features for an archive of spectra."""
+    from data_processing import DataProcessor
+
+    print(f"Batch DataProcessor ({spectra} spectra x {pixels} points, {chunk} per batch)")
+    rng = np.random.default_rng(0)
+    archive = rng.uniform(0, 65535, (chunk, pixels)).astype(np.float32)
+
+    sample = archive[:1000]
+    legacy = _time_per_call(lambda: [_legacy_process(row) for row in sample], repeat=1, number=1)
+    print(f"  per spectrum (polyfit):  {len(sample) / legacy:9.0f} spectra/s "
+          f"(~{spectra * legacy / len(sample):.0f} s for {spectra})")
+
+    def process_archive():
+        # The archive is processed in chunks to keep memory bounded
+        for _ in range(spectra // chunk):
+            DataProcessor.normalize_data(archive)
+            DataProcessor.baseline_correction(archive)
+            DataProcessor.extract_features(archive)
+
+    batched = _time_per_call(process_archive, repeat=1, number=1)
+    print(f"  2-D batches:             {spectra / batched:9.0f} spectra/s ({batched:.1f} s for {spectra})")
+
+
+def bench_pipeline(spectra=10000, pixels=2048):
+    """Full processing chain: separate DataProcessor calls vs a prepared Pipeline."""
+    from backend.pipeline import (Pipeline, DarkStage, ReferenceStage, SmoothStage, BaselineStage,
+                                  NormalizeStage, FeaturesStage)
+    from data_processing import DataProcessor
+
+    print(f"Processing pipeline ({pixels} points)")
+    rng = np.random.default_rng(0)
+    dark = rng.uniform(900, 1100, pixels)
+    reference = rng.uniform(20000, 40000, pixels)
+    batch = rng.uniform(0, 45000, (spectra, pixels))
+    dark_stage, reference_stage = DarkStage(dark), ReferenceStage(reference)
+
+    def step_by_step(data):
+        corrected = dark_stage.apply(data, np.empty(data.shape))
+        corrected = reference_stage.apply(corrected, np.empty(data.shape))
+        smoothed = DataProcessor.smooth_data(corrected, 11, 3)
+        normalized = DataProcessor.normalize_data(DataProcessor.baseline_correction(smoothed))
+        return DataProcessor.extract_features(normalized)
+
+    def build():
+        return Pipeline([DarkStage(dark), ReferenceStage(reference), SmoothStage('savgol', window_length=11,
+                         polyorder=3), BaselineStage(2), NormalizeStage(), FeaturesStage()], timed=True)
+
+    pipeline = build()
+    frame = batch[0]
+    single_steps = _time_per_call(lambda: step_by_step(frame))
+    single_pipeline = _time_per_call(lambda: pipeline(frame))
+    print(f"  live frame:  separate steps {single_steps * 1e6:7.1f} us, pipeline {single_pipeline * 1e6:7.1f} us")
+    batch_steps = _time_per_call(lambda: [step_by_step(row) for row in batch[:1000]], repeat=1, number=1) * spectra / 1000
+    pipeline = build()
+    batch_pipeline = _time_per_call(lambda: pipeline(batch), repeat=3, number=1)
+    print(f"  {spectra} spectra: per-spectrum steps {spectra / batch_steps:8.0f} spectra/s, "
+          f"pipeline batch {spectra / batch_pipeline:8.0f} spectra/s")
+    for name, timing in pipeline.timings().items():
+        print(f"    {name:15s} {timing['mean_ms']:8.1f} ms per batch")
+
+
+def bench_analyze(files=2000, pixels=512):
+    """Batch-analyze a directory of saved spectra with 1..N worker processes."""
+    from analyze_data import analyze_directory
+    from backend.data_saving import save_with_metadata
+
+    cores = os.cpu_count() or 1
+    print(f"Batch analysis CLI ({files} CSV files x {pixels} points, {cores} cores)")
+    rng = np.random.default_rng(0)
+    wavelengths = np.linspace(900, 2500, pixels)
+    with tempfile.TemporaryDirectory() as directory:
+        root = os.path.join(directory, 'spectra')
+        for i in range(files):
+            folder = os.path.join(root, f'day{i % 10}')
+            os.makedirs(folder, exist_ok=True)
+            save_with_metadata(wavelengths, rng.uniform(0, 3000, pixels), filename=os.path.join(folder, f'{i}.csv'))
+
+        baseline = None
+        for workers in sorted({1, 2, max(1, cores // 2), cores}):
+            summary = analyze_directory(root, os.path.join(directory, 'results.csv'), workers=workers,
+                                        chunk_size=64, progress=False)
+            rate = summary['files'] / summary['elapsed']
+            baseline = baseline or rate
+            print(f"  {workers:3d} workers: {rate:8.0f} files/s ({rate / baseline:.2f}x)")
+
+
+def bench_peaks(frames=500, spectra=20000, pixels=2048):
+    """Full peak search per live frame vs. incremental tracking; batch vs. per-row detection.
+
+    Live frames carry detector noise (sigma 10 counts), which stays below
+    the tracker's noise-relative change threshold. In the static scene
+    nothing else changes; in the drifting one a peak moves 0.2 pixels per
+    frame.
+    """
+    from backend.peaks import detect_peaks, detect_peaks_batch, PeakTracker
+
+    print(f"Peak analysis ({pixels} points)")
+    rng = np.random.default_rng(0)
+    x = np.arange(pixels)
+    centres = rng.uniform(50, pixels - 50, 12)
+    background = 1000.0 + 20000.0 * np.exp(-0.5 * ((x[None, :] - centres[:, None]) / 5.0) ** 2).sum(axis=0)
+    static = np.repeat(background[None, :], frames, axis=0) + rng.normal(0, 10, (frames, pixels))
+    drifting = static.copy()
+    for i in range(frames):
+        drifting[i] += 15000.0 * np.exp(-0.5 * ((x - 200 - 0.2 * i) / 5.0) ** 2)
+
+    for scene, live in (('static', static), ('drifting', drifting)):
+        def full():
+            for frame in live:
+                detect_peaks(frame, prominence=2000)
+
+        def tracked():
+            tracker = PeakTracker(prominence=2000, search_radius=4, full_search_interval=100)
+            for frame in live:
+                tracker.update(frame)
+
+        full_time = _time_per_call(full, repeat=3, number=1) / frames
+        tracked_time = _time_per_call(tracked, repeat=3, number=1) / frames
+        print(f"  {scene:8s} full search: {full_time * 1e6:7.1f} us/frame, "
+              f"tracker: {tracked_time * 1e6:7.1f} us/frame ({full_time / tracked_time:.1f}x)")
+
+    stack = rng.normal(0, 30, (spectra, 512)) + background[:512]
+    stack[::2] = rng.normal(0, 30, (spectra - spectra // 2, 512))
+
+    def per_row():
+        for spectrum in stack:
+            detect_peaks(spectrum, height=5000)
+
+    row_time = _time_per_call(per_row, repeat=1, number=1)
+    batch_time = _time_per_call(lambda: detect_peaks_batch(stack, height=5000), repeat=1, number=1)
+    print(f"  archive per row:  {spectra / row_time:8.0f} spectra/s")
+    print(f"  archive batch:    {spectra / batch_time:8.0f} spectra/s ({row_time / batch_time:.1f}x)")
+
+
+def bench_exposure(duration=2.0):
+    """Frame rate and saturation at the default 100 ms vs. auto exposure on a bright source."""
+    from backend.acquisition import AcquisitionEngine
+    from backend.exposure import AutoExposure
+    from backend.simulator import SimulatedSpectrometer, _default_signal
+    from backend.spectrometer import find_spectrometer
+
+    print(f"Auto exposure (simulated NIRQUEST, bright source, {duration:.0f} s per mode)")
+    for mode in ('fixed 100 ms', 'auto'):
+        device = SimulatedSpectrometer(seed=0, signal=_default_signal(2048) * 8)
+        auto_exposure = AutoExposure.for_model('NIRQUEST', dark_level=device.dark_offset) if mode == 'auto' else None
+        saturated = []
+        with _quiet():
+            engine = AcquisitionEngine(find_spectrometer([device]), ewma_alpha=1.0, auto_exposure=auto_exposure)
+            engine.add_frame_callback(lambda frame, timestamp: saturated.append(frame.max() >= 65535))
+            engine.set_integration_time(100000)
+            engine.start()
+            time.sleep(duration)
+            engine.stop()
+        settled = saturated[len(saturated) // 2:]
+        print(f"  {mode:13s} {engine.frame_rate:6.1f} frames/s, integration {engine.integration_time_us / 1000:6.1f} ms, "
+              f"saturated frames (second half) {sum(settled)}/{len(settled)}")
+
+
+def bench_burst(scans=10, integration_us=5000, latency=0.001):
+    """Averaging ``scans`` scans: one request at a time vs. pipelined burst reads, per model."""
+    from backend.simulator import SimulatedSpectrometer
+    from backend.spectrometer import find_spectrometer, request_spectrum, BurstReader
+
+    print(f"Burst acquisition ({scans} scans at {integration_us / 1000:.0f} ms, "
+          f"{latency * 1e3:.0f} ms USB round trip)")
+    models = {}
+    for config in model_configs:
+        models.setdefault((config[2], config[7]), config[1])
+    for model_name in models.values():
+        device = SimulatedSpectrometer(model_name, integration_time_us=integration_us, latency=latency, seed=0)
+        with _quiet():
+            profile = find_spectrometer([device])
+
+            def serial():
+                for _ in range(scans):
+                    request_spectrum(profile.usb_device, profile.packet_size, profile.spectra_ep_in,
+                                     profile.cmd_ep_out)
+
+            serial_time = _time_per_call(serial, repeat=3, number=1)
+        reader = BurstReader.from_profile(profile, depth=2)
+        burst_time = _time_per_call(lambda: reader.burst(scans), repeat=3, number=1)
+        integration = scans * integration_us / 1e6
+        print(f"  {model_name:12s} serial {scans / serial_time:6.1f} frames/s ({serial_time / integration:.2f}x integration), "
+              f"burst {scans / burst_time:6.1f} frames/s ({burst_time / integration:.2f}x integration)")
+
+
+def _legacy_find(usb_devices):
+    """find_spectrometer's per-call config list and nested product id scan (first device only)."""
+    from collections import namedtuple
+    ModelConfigs = namedtuple('ModelConfigs', 'device_ids, model_name, packet_size, cmd_epo, data_epi, '
+                                              'data_epi_size, spect_epi, spect_epi_size')
+    spectrometers = list(map(ModelConfigs._make, model_configs))
+    for usb_device in usb_devices:
+        spectrometer = [item for item in spectrometers for id in item.device_ids if id == usb_device.idProduct]
+        if spectrometer:
+            usb_device.set_configuration()
+            return spectrometer[0]
+    return None
+
+
+def bench_discovery(devices=8, rescans=1000):
+    """Model lookup and enumeration of a multi-spectrometer rig, and hot-plug rescans."""
+    from backend.simulator import SimulatedSpectrometer
+    from backend.spectrometer import enumerate_spectrometers, DeviceScanner
+
+    names = [config[1] for config in model_configs]
+    rig = [SimulatedSpectrometer(names[i % len(names)], address=i + 1) for i in range(devices)]
+    print(f"Device discovery ({devices} simulated spectrometers)")
+    # The last device of the rig is the worst case for the legacy first-match scan
+    legacy = _time_per_call(lambda: [_legacy_find([device]) for device in rig])
+    with _quiet():
+        enumerated = _time_per_call(lambda: enumerate_spectrometers(rig))
+    print(f"  legacy lookup (each device):  {legacy * 1e6:8.1f} us")
+    print(f"  enumerate_spectrometers:      {enumerated * 1e6:8.1f} us ({legacy / enumerated:.1f}x)")
+
+    scanner = DeviceScanner(lambda: rig)
+    with _quiet():
+        scanner.rescan()
+        rescan = _time_per_call(scanner.rescan, number=rescans)
+    print(f"  rescan, nothing changed:      {rescan * 1e6:8.1f} us")
+
+
+def bench_multi(duration=1.5, integration_us=2000):
+    """Aggregate frame rate of 1, 2 and 4 simulated spectrometers read concurrently."""
+    from backend.coordinator import AcquisitionCoordinator
+    from backend.spectrometer import enumerate_spectrometers
+
+    print(f"Multi-spectrometer acquisition ({integration_us / 1000:.0f} ms integration, {duration:.1f} s, "
+          f"{os.cpu_count() or 1} cores)")
+    for mode in ('thread', 'process'):
+        for count in (1, 2, 4):
+            models = (['NIRQUEST', 'USB2000+'] * 2)[:count]
+            os.environ['NIR_SIMULATED_SPECTROMETER'] = ','.join(models)
+            with _quiet():
+                coordinator = AcquisitionCoordinator(enumerate_spectrometers(), mode=mode, tolerance=0.01,
+                                                     integration_time_us=integration_us)
+                coordinator.start()
+                # Process readers need a moment to start up before counting
+                time.sleep(1.0 if mode == 'process' else 0.1)
+                for channel in coordinator.channels:
+                    channel.started_at, channel.frames = time.perf_counter(), 0
+                merged = 0
+                deadline = time.perf_counter() + duration
+                while time.perf_counter() < deadline:
+                    time.sleep(0.01)
+                    merged += coordinator.latest() is not None
+                rate = coordinator.frame_rate
+                coordinator.stop()
+            del os.environ['NIR_SIMULATED_SPECTROMETER']
+            print(f"  {mode:7s} {count} devices: {rate:7.0f} frames/s aggregate "
+                  f"({rate / count:5.0f} per device), {merged} merged records")
+
+
+def bench_streaming(frames=2000, pixels=2048):
+    """Publish cost of the streaming server, and delivery to a fast and a stalled client."""
+    import socket
+    import threading
+    import numpy as np
+    from backend.streaming import SpectrumServer, read_message
+
+    spectrum = np.random.default_rng(0).integers(0, 65535, pixels).astype(np.uint16)
+    server = SpectrumServer(port=0)
+    server.start()
+    print(f"Streaming server ({pixels} pixels, {frames} frames)")
+    idle = _time_per_call(lambda: server.publish(spectrum))
+    print(f"  publish, no clients:          {idle * 1e6:8.1f} us")
+
+    fast = socket.create_connection(server.addresses['tcp'][:2])
+    stalled = socket.create_connection(server.addresses['tcp'][:2])
+    stalled.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    while server.clients < 2:
+        time.sleep(0.01)
+    received = []
+    stream = fast.makefile('rb')
+
+    def read():
+        while read_message(stream) is not None:
+            received.append(1)
+
+    reader = threading.Thread(target=read, daemon=True)
+    reader.start()
+    elapsed = 0.0
+    for _ in range(frames):
+        started = time.perf_counter()
+        server.publish(spectrum)
+        elapsed += time.perf_counter() - started
+        time.sleep(0.0002)
+    time.sleep(0.2)
+    stats = sorted(server.client_stats(), key=lambda client: client['sent'])
+    print(f"  publish, 2 clients:           {elapsed / frames * 1e6:8.1f} us")
+    print(f"  fast client:                  {len(received):8d} frames received")
+    print(f"  stalled client:               {stats[0]['sent']:8d} sent, {stats[0]['dropped']} dropped")
+    server.stop()
+    fast.close()
+    stalled.close()
+
+
+BENCHMARKS = {
+    'decoder': bench_decoder,
+    'pipeline': bench_simulated_pipeline,
+    'smoothing': bench_smoothing,
+    'live_plot': bench_live_plot,
+    'csv_load': bench_csv_load,
+    'export': bench_export,
+    'recorder': bench_recorder,
+    'formula': bench_formula,
+    'batch': bench_batch_processing,
+    'processing': bench_pipeline,
+    'analyze': bench_analyze,
+    'peaks': bench_peaks,
+    'exposure': bench_exposure,
+    'burst': bench_burst,
+    'discovery': bench_discovery,
+    'multi': bench_multi,
+    'streaming': bench_streaming,
+}
+
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
@@ -0,0 +1,173 @@
+import io
+import time
+import unittest
+from contextlib import redirect_stdout
+import numpy as np
+from backend.acquisition import AcquisitionEngine, read_average
+from backend.exposure import AutoExposure
+from backend.simulator import SimulatedSpectrometer
+from backend.spectrometer import find_spectrometer
+
+class TestAcquisitionEngine(unittest.TestCase):
+    def test_averages_and_processes_in_background(self):
+        counter = iter(range(10**6))
+
+        def read_spectrum():
+            time.sleep(0.001)
+            return np.full(8, next(counter), dtype=np.uint16)
+
+        engine = AcquisitionEngine(None, scans_to_average=4, processor=lambda data: data * 2,
+                                   read_spectrum=read_spectrum)
+        engine.start()
+        try:
+            deadline = time.time() + 5
+            while engine.latest()[0] < 3 and time.time() < deadline:
+                time.sleep(0.005)
+        finally:
+            engine.stop()
+
+        self.assertFalse(engine.running)
+        sequence, frame = engine.latest()
+        self.assertGreaterEqual(sequence, 3)
+        # Four consecutive scans n-3..n averaged, then doubled by the processor
+        self.assertEqual(frame[0] % 2, 1)
+        self.assertEqual(engine.read_errors, 0)
+
+    def test_failing_reads_back_off_and_stop(self):
+        calls = []
+
+        def read_spectrum():
+            calls.append(time.perf_counter())
+            return None
+
+        engine = AcquisitionEngine(None, read_spectrum=read_spectrum, max_read_errors=5, error_backoff=0.02)
+        engine.start()
+        engine._thread.join(5)
+
+        self.assertFalse(engine.running)
+        self.assertEqual(engine.read_errors, 5)
+        self.assertGreaterEqual(calls[-1] - calls[0], 4 * 0.02 * 0.9)
+
+    def test_stop_keeps_running_until_the_reader_is_done(self):
+        def read_spectrum():
+            time.sleep(0.3)
+            return np.zeros(8, dtype=np.uint16)
+
+        engine = AcquisitionEngine(None, read_spectrum=read_spectrum)
+        engine.start()
+        time.sleep(0.05)
+        engine.stop(timeout=0.01)
+        self.assertTrue(engine.running)
+        engine.stop()
+        self.assertFalse(engine.running)
+
+    def test_long_integration_time_does_not_time_out(self):
+        device = SimulatedSpectrometer(integration_time_us=2000, seed=0)
+        engine = AcquisitionEngine(find_spectrometer([device]), pipeline_depth=2)
+        engine.set_integration_time(1200000)
+        engine.start()
+        try:
+            sequence, _ = engine.wait_latest(0, timeout=5)
+        finally:
+            engine.stop()
+        self.assertGreaterEqual(sequence, 1)
+        self.assertEqual(engine.burst_reader.timeouts, 0)
+        self.assertEqual(engine.burst_reader.timeout_ms, 2200)
+
+    def test_auto_exposure_with_simulator(self):
+        device = SimulatedSpectrometer(noise=5, dark_offset=1500, seed=0)
+        engine = AcquisitionEngine(find_spectrometer([device]), ewma_alpha=0.5,
+                                   auto_exposure=AutoExposure(dark_level=1500, max_us=200000))
+        self.assertEqual(engine.set_integration_time(1000), 1000)
+        self.assertEqual(device.integration_time_us, 1000)
+        engine.start()
+        try:
+            deadline = time.time() + 5
+            while not engine.auto_exposure.converged and time.time() < deadline:
+                time.sleep(0.01)
+            # Changes made while running are sent by the reader thread
+            time.sleep(0.05)
+        finally:
+            engine.stop()
+
+        self.assertTrue(engine.auto_exposure.converged)
+        self.assertEqual(device.integration_time_us, engine.integration_time_us)
+        self.assertGreater(engine.frames_discarded, 0)
+        peak = engine.latest()[1].max()
+        self.assertGreater(peak, 0.6 * 65535)
+        self.assertLess(peak, 65535)
+
+    def test_pipelined_reads_leave_nothing_queued(self):
+        device = SimulatedSpectrometer(integration_time_us=2000, seed=0)
+        engine = AcquisitionEngine(find_spectrometer([device]), scans_to_average=5, pipeline_depth=3)
+        engine.start()
+        try:
+            deadline = time.time() + 5
+            while engine.latest()[0] < 2 and time.time() < deadline:
+                time.sleep(0.005)
+        finally:
+            engine.stop()
+
+        self.assertGreaterEqual(engine.latest()[0], 2)
+        self.assertEqual(engine.read_errors, 0)
+        self.assertEqual(engine.burst_reader.outstanding, 0)
+        self.assertFalse(device._frame_ready)
+
+    def test_external_trigger_waits_without_errors(self):
+        device = SimulatedSpectrometer(integration_time_us=2000, seed=0)
+        engine = AcquisitionEngine(find_spectrometer([device]), trigger_mode='external_hardware', max_read_errors=2)
+        engine.start()
+        try:
+            deadline = time.time() + 5
+            while not device.trigger() and time.time() < deadline:
+                time.sleep(0.005)
+            sequence, _ = engine.wait_latest(0, timeout=5)
+            self.assertEqual(sequence, 1)
+            # Waiting for the next trigger times out over and over without counting as failed reads
+            engine.burst_reader.timeout_ms = 10
+            deadline = time.time() + 5
+            while engine.trigger_timeouts <= 2 and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertTrue(engine.running)
+            self.assertGreater(engine.trigger_timeouts, 2)
+            self.assertEqual((engine.read_errors, engine.burst_reader.outstanding), (0, 1))
+            self.assertTrue(device.trigger())
+            self.assertEqual(engine.wait_latest(sequence, timeout=5)[0], 2)
+        finally:
+            engine.stop()
+
+        self.assertEqual(device.trigger_mode, 0)
+        self.assertEqual(engine.burst_reader.outstanding, 0)
+        self.assertFalse(device._frame_ready or device._awaiting_trigger)
+
+    def test_wait_latest_blocks_until_published(self):
+        engine = AcquisitionEngine(find_spectrometer([SimulatedSpectrometer(integration_time_us=5000, seed=0)]))
+        self.assertEqual(engine.wait_latest(0, timeout=0.01), (0, None))
+        engine.start()
+        try:
+            sequence, frame = engine.wait_latest(0, timeout=5)
+            self.assertGreaterEqual(sequence, 1)
+            self.assertGreater(engine.wait_latest(sequence, timeout=5)[0], sequence)
+        finally:
+            engine.stop()
+
+class TestReadAverage(unittest.TestCase):
+    def test_dark_corrected_average(self):
+        device = SimulatedSpectrometer(noise=0, dark_offset=500, integration_time_us=1000, seed=0)
+        profile = find_spectrometer([device])
+        device.light_on = False
+        dark = read_average(profile, 4, track_variance=True)
+        self.assertEqual(dark.count, 4)
+        np.testing.assert_array_equal(dark.mean(), 500)
+        np.testing.assert_array_equal(dark.std(), 0)
+        device.light_on = True
+        reference = read_average(profile, 3, dark=dark.mean())
+        np.testing.assert_allclose(reference.mean(), device.render_frame() - 500.0)
+        # A dark spectrum of another model is ignored rather than failing the collection
+        with redirect_stdout(io.StringIO()) as output:
+            uncorrected = read_average(profile, 1, dark=np.zeros(16))
+        self.assertIn('not dark-corrected', output.getvalue())
+        np.testing.assert_allclose(uncorrected.mean(), device.render_frame())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import csv
+import os
+import sys
+import tempfile
+import unittest
+import numpy as np
+from backend.data_saving import save_with_metadata
+from backend.spectrum_file import write_spectra
+
+# Workers must be able to import the script by name to unpickle its functions
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+import analyze_data
+
+class TestAnalyzeData(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmp.name, 'data')
+        os.makedirs(os.path.join(self.root, 'run2'))
+        self.wavelengths = np.linspace(900, 2500, 200)
+        peak = 5000 * np.exp(-0.5 * ((self.wavelengths - 1450) / 20) ** 2)
+        for i in range(5):
+            save_with_metadata(self.wavelengths, peak + i, filename=os.path.join(self.root, f's{i}.csv'))
+        write_spectra(os.path.join(self.root, 'run2', 'batch.nirs'), self.wavelengths, np.vstack([peak] * 3))
+        with open(os.path.join(self.root, 'run2', 'notes.csv'), 'w') as f:
+            f.write('not,a\nspectrum,file\n')
+        self.output = os.path.join(self.root, 'results.csv')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _rows(self):
+        with open(self.output) as f:
+            return list(csv.DictReader(f))
+
+    def test_serial_and_pool_give_same_rows(self):
+        summary = analyze_data.analyze_directory(self.root, self.output, workers=1, chunk_size=2, progress=False)
+        self.assertEqual((summary['files'], summary['spectra'], summary['failed']), (7, 8, 1))
+        serial = self._rows()
+        self.assertEqual(serial[0]['peak_count'], '1')
+        self.assertAlmostEqual(float(serial[0]['peak_wavelengths']), 1450, delta=10)
+
+        # The output file sits inside the tree and must not be picked up
+        summary = analyze_data.analyze_directory(self.root, self.output, workers=2, chunk_size=2, progress=False)
+        self.assertEqual(summary['files'], 7)
+        key = lambda row: (row['file'], row['index'])
+        self.assertEqual(sorted(self._rows(), key=key), sorted(serial, key=key))
+
+    def test_main(self):
+        status = analyze_data.main([os.path.join(self.root, 's0.csv'), '-o', self.output, '--quiet',
+                                    '--baseline-degree', '1'])
+        self.assertEqual(status, 0)
+        self.assertEqual(len(self._rows()), 1)
+
+    def test_nirs_blocks_and_peak_options(self):
+        path = os.path.join(self.root, 'run2', 'batch.nirs')
+        whole, _ = analyze_data.analyze_chunk([path])
+        blocks, _ = analyze_data.analyze_chunk([path], rows_per_batch=2)
+        self.assertEqual([row[:2] for row in blocks], [[path, 0], [path, 1], [path, 2]])
+        self.assertEqual(blocks, whole)
+
+        rows, failed = analyze_data.analyze_chunk([path, os.path.join(self.root, 's0.csv')], height=6000)
+        self.assertEqual(failed, [])
+        self.assertEqual([row[-2] for row in rows], [0] * 4)
+
+        status = analyze_data.main([path, '-o', self.output, '--quiet', '--height', '100',
+                                    '--prominence', '100', '--width', '3'])
+        self.assertEqual(status, 0)
+        self.assertEqual([row['peak_count'] for row in self._rows()], ['1'] * 3)
+
+if __name__ == '__main__':
+    unittest.main()
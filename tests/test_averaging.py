@@ -0,0 +1,49 @@
+import unittest
+import numpy as np
+from backend.averaging import SpectrumAccumulator, ExponentialAverager
+
+class TestSpectrumAccumulator(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.scans = rng.integers(0, 65535, (50, 256)).astype(np.uint16)
+
+    def test_mean_matches_numpy(self):
+        accumulator = SpectrumAccumulator()
+        self.assertIsNone(accumulator.mean())
+        for scan in self.scans:
+            accumulator.add(scan)
+        self.assertEqual(accumulator.count, 50)
+        np.testing.assert_allclose(accumulator.mean(), self.scans.mean(axis=0))
+
+    def test_integer_sum_buffer(self):
+        accumulator = SpectrumAccumulator(256, dtype=np.uint32)
+        for scan in self.scans:
+            accumulator.add(scan)
+        np.testing.assert_allclose(accumulator.mean(), self.scans.mean(axis=0))
+
+    def test_welford_variance(self):
+        accumulator = SpectrumAccumulator(track_variance=True)
+        for scan in self.scans:
+            accumulator.add(scan)
+        np.testing.assert_allclose(accumulator.variance(), self.scans.var(axis=0, ddof=1))
+        np.testing.assert_allclose(accumulator.std(ddof=0), self.scans.std(axis=0))
+
+    def test_reset_and_length_check(self):
+        accumulator = SpectrumAccumulator()
+        accumulator.add(self.scans[0])
+        accumulator.reset()
+        self.assertEqual(accumulator.count, 0)
+        with self.assertRaises(ValueError):
+            accumulator.add(np.zeros(10))
+
+class TestExponentialAverager(unittest.TestCase):
+    def test_update(self):
+        averager = ExponentialAverager(alpha=0.5)
+        averager.update(np.zeros(4))
+        np.testing.assert_allclose(averager.update(np.full(4, 8.0)), 4.0)
+        np.testing.assert_allclose(averager.update(np.full(4, 8.0)), 6.0)
+        with self.assertRaises(ValueError):
+            ExponentialAverager(alpha=0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import time
+import unittest
+from unittest import mock
+import numpy as np
+from backend.coordinator import AcquisitionCoordinator, Stitcher, model_wavelengths
+from backend.simulator import SimulatedSpectrometer
+from backend.spectrometer import enumerate_spectrometers
+
+class TestStitcher(unittest.TestCase):
+    def test_overlap_and_gap(self):
+        visible = np.linspace(200, 850, 651)
+        infrared = np.linspace(800, 2500, 1701)
+        stitcher = Stitcher([visible, infrared])
+        self.assertAlmostEqual(stitcher.wavelengths[0], 200)
+        self.assertAlmostEqual(stitcher.wavelengths[-1], 2500)
+        spectrum = stitcher.stitch([visible * 2, infrared * 2])
+        # Both channels are linear in wavelength, so the merge reproduces the line everywhere
+        np.testing.assert_allclose(spectrum, stitcher.wavelengths * 2)
+
+        stitcher = Stitcher([model_wavelengths('USB2000+', 2048), model_wavelengths('NIRQUEST', 512)])
+        spectrum = stitcher.stitch([np.ones(2048), np.full(512, 3.0)])
+        gap = (stitcher.wavelengths > 851) & (stitcher.wavelengths < 899)
+        self.assertTrue(np.isnan(spectrum[gap]).all())
+        self.assertTrue(np.all(spectrum[stitcher.wavelengths < 850] == 1.0))
+        self.assertTrue(np.all(spectrum[stitcher.wavelengths > 900] == 3.0))
+
+class TestAcquisitionCoordinator(unittest.TestCase):
+    def wait_for_record(self, coordinator, deadline=10.0):
+        deadline = time.time() + deadline
+        record = None
+        while record is None and time.time() < deadline:
+            time.sleep(0.02)
+            record = coordinator.latest()
+        return record
+
+    def test_threads_merge_devices(self):
+        devices = [SimulatedSpectrometer('NIRQUEST', integration_time_us=2000, address=1, seed=0),
+                   SimulatedSpectrometer('USB2000+', integration_time_us=3000, address=2, seed=1)]
+        coordinator = AcquisitionCoordinator(enumerate_spectrometers(devices), tolerance=0.01,
+                                             integration_time_us=2000)
+        coordinator.start()
+        try:
+            record = self.wait_for_record(coordinator)
+        finally:
+            coordinator.stop()
+
+        self.assertIsNotNone(record)
+        self.assertEqual([len(frame) for frame in record.channels], [2048, 2048])
+        self.assertLessEqual(np.ptp(record.timestamps), 0.01)
+        self.assertEqual(len(record.spectrum), len(record.wavelengths))
+        self.assertAlmostEqual(record.wavelengths[0], 200)
+        self.assertAlmostEqual(record.wavelengths[-1], 2500, delta=0.5)
+        self.assertGreater(coordinator.frame_rate, 0)
+        self.assertEqual([device.integration_time_us for device in devices], [2000, 2000])
+        self.assertFalse(any(device._frame_ready for device in devices))
+
+    def test_processes(self):
+        with mock.patch.dict(os.environ, {'NIR_SIMULATED_SPECTROMETER': 'NIRQUEST,USB2000+'}):
+            coordinator = AcquisitionCoordinator(mode='process', tolerance=0.1)
+            coordinator.start()
+            try:
+                record = self.wait_for_record(coordinator, deadline=30.0)
+            finally:
+                coordinator.stop()
+        self.assertIsNotNone(record)
+        self.assertEqual([channel.model_name for channel in coordinator.channels], ['NIRQUEST', 'USB2000+'])
+        self.assertFalse(coordinator.running)
+
+    def test_process_errors_reach_the_channel(self):
+        with mock.patch.dict(os.environ, {'NIR_SIMULATED_SPECTROMETER': 'NIRQUEST'}):
+            coordinator = AcquisitionCoordinator(mode='process')
+            coordinator.channels[0].key = (99, 99, 0)
+            coordinator.start()
+            try:
+                deadline = time.time() + 30
+                while coordinator.channels[0].error is None and time.time() < deadline:
+                    time.sleep(0.02)
+            finally:
+                coordinator.stop()
+        self.assertIn('not found', coordinator.channels[0].error)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+import numpy as np
+from data_processing import DataProcessor, FEATURE_DTYPE
+
+class TestDataProcessor(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(4)
+        pixels = np.arange(256)
+        baselines = np.outer(rng.uniform(-1, 1, 5), (pixels - 100.0) ** 2 / 1000) + rng.uniform(0, 50, (5, 1))
+        self.spectra = baselines + rng.normal(0, 1, (5, 256))
+
+    def test_baseline_matches_polyfit(self):
+        corrected = DataProcessor.baseline_correction(self.spectra)
+        pixels = np.arange(self.spectra.shape[1])
+        for spectrum, row in zip(self.spectra, corrected):
+            expected = spectrum - np.polyval(np.polyfit(pixels, spectrum, 2), pixels)
+            np.testing.assert_allclose(row, expected, atol=1e-8)
+        np.testing.assert_allclose(DataProcessor.baseline_correction(self.spectra[0]), corrected[0])
+
+    def test_normalize_per_spectrum(self):
+        normalized = DataProcessor.normalize_data(np.vstack((self.spectra, np.full(256, 7.0))))
+        np.testing.assert_allclose(normalized[:-1].min(axis=1), 0)
+        np.testing.assert_allclose(normalized[:-1].max(axis=1), 1)
+        np.testing.assert_array_equal(normalized[-1], 0)
+
+    def test_features_structured_array(self):
+        features = DataProcessor.extract_features(self.spectra)
+        self.assertEqual(features.dtype, FEATURE_DTYPE)
+        self.assertEqual(features.shape, (5,))
+        np.testing.assert_allclose(features['mean_intensity'], self.spectra.mean(axis=1))
+        np.testing.assert_array_equal(features['peak_index'], self.spectra.argmax(axis=1))
+
+        single = DataProcessor.extract_features(self.spectra[1])
+        self.assertEqual(single['max_intensity'], self.spectra[1].max())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from backend.data_saving import save_to_csv, save_with_metadata, load_from_csv
+
+class TestLoadFromCsv(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'spectrum.csv')
+        self.wavelengths = np.linspace(900, 2500, 128)
+        self.intensities = np.random.default_rng(5).uniform(0, 60000, 128)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_metadata_and_data(self):
+        save_with_metadata(self.wavelengths, self.intensities, filename=self.path,
+                           metadata={'Device': 'NIRQUEST', 'Note': 'ratio: 1:2'})
+        wavelengths, intensities, metadata = load_from_csv(self.path)
+        self.assertEqual(wavelengths.dtype, np.float64)
+        self.assertEqual(intensities.dtype, np.float32)
+        np.testing.assert_allclose(wavelengths, self.wavelengths)
+        np.testing.assert_allclose(intensities, self.intensities, rtol=1e-6)
+        self.assertEqual(metadata['Device'], 'NIRQUEST')
+        self.assertEqual(metadata['Note'], 'ratio: 1:2')
+        self.assertEqual(metadata['Points'], '128')
+
+    def test_headerless_and_plain_files(self):
+        np.savetxt(self.path, np.column_stack((self.wavelengths, self.intensities)), delimiter=',')
+        wavelengths, intensities, metadata = load_from_csv(self.path, dtype=np.float64)
+        np.testing.assert_allclose(wavelengths, self.wavelengths)
+        np.testing.assert_allclose(intensities, self.intensities)
+        self.assertEqual(metadata, {})
+
+        save_to_csv(self.wavelengths, self.intensities, filename=self.path)
+        wavelengths, intensities, _ = load_from_csv(self.path, dtype=np.float64)
+        np.testing.assert_allclose(intensities, self.intensities)
+
+    def test_uint16_counts(self):
+        save_to_csv(self.wavelengths[:3], [1.6, 70000.0, -3.0], filename=self.path)
+        _, intensities, _ = load_from_csv(self.path, dtype=np.uint16)
+        self.assertEqual(intensities.dtype, np.uint16)
+        np.testing.assert_array_equal(intensities, [2, 65535, 0])
+
+    def test_missing_file(self):
+        self.assertEqual(load_from_csv(os.path.join(self.tmp.name, 'missing.csv')), (None, None, None))
+
+if __name__ == '__main__':
+    unittest.main()
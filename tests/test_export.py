@@ -0,0 +1,98 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+import numpy as np
+import pandas as pd
+from backend.data_saving import save_with_metadata, load_from_csv
+from backend.export import export_spectra, BackgroundExporter
+from backend.spectrum_file import SpectrumFile
+
+try:
+    import pyarrow  # noqa: F401
+    HAVE_PYARROW = True
+except ImportError:
+    HAVE_PYARROW = False
+
+class TestExport(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.wavelengths = np.linspace(900, 2500, 32)
+        self.spectra = np.random.default_rng(7).uniform(0, 60000, (4, 32))
+        self.rows = [{'Sample': f'S{i}', 'Note': 'a, b' if i == 2 else ''} for i in range(4)]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def test_wide_csv(self):
+        path = self._path('batch.csv')
+        export_spectra(path, self.wavelengths, self.spectra, row_metadata=self.rows, metadata={'Device': 'NIRQUEST'})
+        with open(path) as f:
+            self.assertIn('# Device: NIRQUEST\n', f.read())
+        table = pd.read_csv(path, comment='#')
+        self.assertEqual(list(table['Sample']), ['S0', 'S1', 'S2', 'S3'])
+        self.assertEqual(table['Note'][2], 'a, b')
+        np.testing.assert_allclose(table.iloc[:, 2:].to_numpy(), self.spectra, rtol=1e-6)
+
+    def test_nirs_keeps_row_metadata(self):
+        path = self._path('batch.nirs')
+        export_spectra(path, self.wavelengths, self.spectra, row_metadata=self.rows)
+        spectrum_file = SpectrumFile(path)
+        self.assertEqual(len(spectrum_file), 4)
+        self.assertEqual(spectrum_file.metadata['rows']['Sample'], ['S0', 'S1', 'S2', 'S3'])
+
+    @unittest.skipUnless(HAVE_PYARROW, "pyarrow is not installed")
+    def test_parquet(self):
+        path = self._path('batch.parquet')
+        export_spectra(path, self.wavelengths, self.spectra, row_metadata=self.rows)
+        table = pd.read_parquet(path)
+        np.testing.assert_allclose(table.iloc[:, 2:].to_numpy(), self.spectra, rtol=1e-6)
+
+    def test_rejects_bad_input(self):
+        with self.assertRaises(ValueError):
+            export_spectra(self._path('batch.txt'), self.wavelengths, self.spectra)
+        with self.assertRaises(ValueError):
+            export_spectra(self._path('batch.csv'), self.wavelengths, self.spectra, row_metadata=self.rows[:2])
+
+    def test_background_exporter(self):
+        exporter = BackgroundExporter()
+        spectra = self.spectra.copy()
+        exporter.export(self._path('bg.nirs'), self.wavelengths, spectra)
+        spectra[:] = 0  # The queued job works on its own copy
+        exporter.submit(save_with_metadata, self.wavelengths, self.spectra[0],
+                        filename=self._path('dark.csv'), spectra=1)
+        exporter.submit(export_spectra, self._path('bad.txt'), self.wavelengths, self.spectra)
+        exporter.join()
+        exporter.stop()
+
+        self.assertFalse(exporter.running)
+        self.assertEqual(exporter.files_written, 2)
+        self.assertEqual(exporter.spectra_written, 5)
+        self.assertEqual(exporter.errors, 1)
+        np.testing.assert_allclose(SpectrumFile(self._path('bg.nirs')).spectra, self.spectra.astype(np.float32))
+        _, intensities, _ = load_from_csv(self._path('dark.csv'), dtype=np.float64)
+        np.testing.assert_allclose(intensities, self.spectra[0])
+
+    def test_stop_does_not_hang_on_a_stuck_writer(self):
+        release = threading.Event()
+        exporter = BackgroundExporter(max_pending=1)
+        exporter.submit(release.wait)
+        while exporter.pending:
+            time.sleep(0.001)
+        exporter.submit(release.wait)  # fills the queue while the writer is stuck
+        started = time.monotonic()
+        exporter.stop(timeout=0.1)
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertTrue(exporter.running)
+
+        release.set()
+        exporter.stop()
+        self.assertFalse(exporter.running)
+        self.assertEqual(exporter.files_written, 2)
+
+if __name__ == '__main__':
+    unittest.main()
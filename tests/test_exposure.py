@@ -0,0 +1,37 @@
+import unittest
+from backend.exposure import AutoExposure
+from backend.simulator import SimulatedSpectrometer
+
+class TestAutoExposure(unittest.TestCase):
+    def converge(self, device, exposure, start_us, frames=10):
+        integration_time_us = start_us
+        for _ in range(frames):
+            device.integration_time_us = integration_time_us
+            new_time = exposure.update(device.render_frame(), integration_time_us)
+            if new_time is None:
+                break
+            integration_time_us = new_time
+        return integration_time_us
+
+    def test_converges_from_saturated_and_dark(self):
+        device = SimulatedSpectrometer(noise=5, dark_offset=1500, seed=0)
+        target_us = 0.8 * (65535 - 1500) / device.signal.max() * 100000
+        for start_us in (1000, 2000000):
+            with self.subTest(start_us=start_us):
+                exposure = AutoExposure(dark_level=1500, max_us=5000000)
+                integration_time_us = self.converge(device, exposure, start_us)
+                self.assertTrue(exposure.converged)
+                self.assertAlmostEqual(integration_time_us / target_us, 1.0, delta=0.1)
+                self.assertLess(exposure.last_peak, 65535)
+
+    def test_limits(self):
+        device = SimulatedSpectrometer('USB2000', noise=0, seed=0)
+        device.light_on = False
+        exposure = AutoExposure.for_model('USB2000', max_us=100000)
+        self.assertEqual(exposure.saturation, 4095)
+        # No light: integration time grows to the limit and stays there
+        self.assertEqual(self.converge(device, exposure, 10000), 100000)
+        self.assertIsNone(exposure.update(device.render_frame(), 100000))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import io
+import os
+import subprocess
+import sys
+import threading
+import time
+import unittest
+import numpy as np
+from backend.headless import CsvStream, HeadlessAcquisition, PeakStream
+from backend.peaks import PeakTracker
+from backend.simulator import SimulatedSpectrometer
+from backend.spectrometer import find_spectrometer
+
+class ListSink:
+    def __init__(self):
+        self.spectra = []
+
+    def write(self, wavelengths, spectrum, timestamp):
+        self.spectra.append((wavelengths, spectrum.copy(), timestamp))
+
+class TestHeadlessAcquisition(unittest.TestCase):
+    def setUp(self):
+        self.device = SimulatedSpectrometer('NIRQUEST', noise=0, dark_offset=500, seed=0)
+        self.profile = find_spectrometer([self.device])
+
+    def test_fixed_rate(self):
+        sink = ListSink()
+        service = HeadlessAcquisition(self.profile, sink, rate=20, scans=2, integration_time_us=2000)
+        self.assertEqual(service.run(count=4), 4)
+        self.assertEqual(self.device.integration_time_us, 2000)
+        wavelengths, spectrum, _ = sink.spectra[0]
+        self.assertEqual((len(wavelengths), len(spectrum)), (2048, 2048))
+        self.assertAlmostEqual(wavelengths[0], 900)
+        intervals = np.diff([timestamp for _, _, timestamp in sink.spectra])
+        self.assertTrue(np.all(intervals > 0.03), intervals)
+        self.assertFalse(service.engine.running)
+
+    def test_dark_and_reference_give_reflectance(self):
+        sink = ListSink()
+        service = HeadlessAcquisition(self.profile, sink, rate=0, scans=1, integration_time_us=2000)
+        self.device.light_on = False
+        np.testing.assert_array_equal(service.collect_dark(4), 500)
+        self.device.light_on = True
+        service.collect_reference(4)
+        service.run(count=2)
+        spectrum = sink.spectra[-1][1]
+        # The white reference itself reads back as 100% away from the boxcar edges
+        np.testing.assert_allclose(spectrum[300:1800], 100, atol=1.5)
+
+    def test_tracks_peaks_of_written_spectra(self):
+        sink = ListSink()
+        stream = io.StringIO()
+        service = HeadlessAcquisition(self.profile, sink, rate=0, scans=1, integration_time_us=10000,
+                                      peak_tracker=PeakTracker(prominence=1000), peak_sink=PeakStream(stream))
+        service.run(count=3)
+        lines = stream.getvalue().splitlines()
+        self.assertEqual(lines[0], 'timestamp,track,wavelength,height,prominence,width')
+        rows = [line.split(',') for line in lines[1:]]
+        self.assertTrue(rows)
+        self.assertEqual({row[0] for row in rows}, {f'{timestamp:.6f}' for _, _, timestamp in sink.spectra})
+        expected = service.peak_tracker.peaks
+        self.assertEqual([int(row[1]) for row in rows[-len(expected):]], list(expected['track']))
+        self.assertTrue(all(900 <= float(row[2]) <= 2500 for row in rows))
+
+    def test_external_trigger(self):
+        sink = ListSink()
+        service = HeadlessAcquisition(self.profile, sink, rate=0, scans=1, integration_time_us=2000,
+                                      trigger_mode='external_sync')
+        pulses = threading.Timer(0.1, lambda: [self.device.trigger() or time.sleep(0.05) for _ in range(20)])
+        pulses.start()
+        try:
+            self.assertEqual(service.run(count=2, duration=5), 2)
+        finally:
+            pulses.join()
+        self.assertEqual(service.engine.read_errors, 0)
+        self.assertEqual(self.device.trigger_mode, 0)
+
+    def test_duration_stops_without_spectra(self):
+        self.device.light_on = False
+        service = HeadlessAcquisition(self.profile, ListSink(), rate=1, scans=1000, integration_time_us=10000)
+        started = time.monotonic()
+        # 1000 scans of 10 ms never complete within the duration
+        self.assertEqual(service.run(duration=0.2), 0)
+        self.assertLess(time.monotonic() - started, 1.0)
+
+class TestCsvStream(unittest.TestCase):
+    def test_header_once_then_rows(self):
+        stream = io.StringIO()
+        sink = CsvStream(stream, metadata={'Device': 'NIRQUEST'})
+        sink.write(np.array([900.0, 901.5]), np.array([1.0, 2.5]), 10.0)
+        sink.write(np.array([900.0, 901.5]), np.array([3.0, 4.0]), 11.0)
+        lines = stream.getvalue().splitlines()
+        self.assertIn('# Device: NIRQUEST', lines)
+        self.assertEqual(lines[-3:], ['Timestamp,900.000,901.500', '10.000000,1,2.5', '11.000000,3,4'])
+
+class TestHeadlessEntryPoint(unittest.TestCase):
+    def test_streams_csv_to_stdout_without_gui_modules(self):
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        code = ("import runpy, sys\n"
+                "sys.argv = ['main.py', '--headless', '--rate', '0', '--scans', '1', '--count', '2',"
+                " '--integration-time', '2']\n"
+                "try:\n"
+                "    runpy.run_path('main.py', run_name='__main__')\n"
+                "except SystemExit:\n"
+                "    pass\n"
+                "sys.stderr.write(repr(sorted({name.split('.')[0] for name in sys.modules} & {'kivy', 'matplotlib'})))\n")
+        result = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True, text=True,
+                                env=dict(os.environ, NIR_SIMULATED_SPECTROMETER='NIRQUEST'))
+        rows = [line for line in result.stdout.splitlines() if not line.startswith('#')]
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(len(rows[1].split(',')), 2049)
+        self.assertTrue(result.stderr.endswith('[]'), result.stderr)
+
+    def test_help_lists_headless_options(self):
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        result = subprocess.run([sys.executable, 'main.py', '--headless', '--help'], cwd=root,
+                                capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0)
+        self.assertIn('main.py --headless', result.stdout)
+        self.assertIn('--integration-time', result.stdout)
+
+if __name__ == '__main__':
+    unittest.main()
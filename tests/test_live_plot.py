@@ -0,0 +1,48 @@
+import unittest
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from frontend.live_plot import LivePlot
+
+class TestLivePlot(unittest.TestCase):
+    def setUp(self):
+        self.fig, self.ax = plt.subplots()
+        self.canvas = FigureCanvasAgg(self.fig)
+        self.live_plot = LivePlot(self.ax)
+        self.x = np.linspace(900, 2500, 256)
+        self.y = 1000.0 + 100.0 * np.sin(np.linspace(0, 3, 256))
+
+    def tearDown(self):
+        plt.close(self.fig)
+
+    def _show(self, y, **kwargs):
+        if self.live_plot.update(self.x, y, **kwargs):
+            self.canvas.draw()
+            return 'full'
+        return 'blit'
+
+    def test_steady_frames_are_blitted(self):
+        y = self.y
+        self.assertEqual(self._show(y, y_label='Intensity (counts)'), 'full')
+        line = self.live_plot.line
+        self.assertEqual(self._show(y + 5), 'blit')
+        self.assertIs(self.live_plot.line, line)
+        np.testing.assert_array_equal(line.get_ydata(), y + 5)
+
+    def test_rescale_outside_hysteresis_band(self):
+        y = self.y
+        self._show(y)
+        self.assertEqual(self._show(y * 3), 'full')
+        self.assertGreater(self.ax.get_ylim()[1], 3000)
+
+    def test_axes_clear_recreates_line(self):
+        y = self.y
+        self._show(y)
+        self.ax.clear()
+        self.assertEqual(self._show(y), 'full')
+        self.assertIs(self.live_plot.line.axes, self.ax)
+
+if __name__ == '__main__':
+    unittest.main()
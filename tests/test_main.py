@@ -0,0 +1,24 @@
+import unittest
+from main import parse_args, parse_import_times
+
+class TestStartupTiming(unittest.TestCase):
+    def test_import_times_are_summed_per_package(self):
+        output = '\n'.join([
+            'import time: self [us] | cumulative | imported package',
+            'import time:       120 |        120 |   scipy._lib',
+            'import time:      2000 |       2120 | scipy',
+            'import time:       500 |        500 | backend.spectrometer',
+            '[INFO   ] [Logger      ] Record log in /tmp/kivy.txt',
+        ])
+        times = parse_import_times(output)
+        self.assertEqual(set(times), {'scipy', 'backend'})
+        self.assertAlmostEqual(times['scipy'], 0.00212)
+        self.assertAlmostEqual(times['backend'], 0.0005)
+
+    def test_unknown_options_are_left_for_kivy(self):
+        args, rest = parse_args(['--startup-time', '--size=800x600'])
+        self.assertTrue(args.startup_time)
+        self.assertEqual(rest, ['--size=800x600'])
+
+if __name__ == '__main__':
+    unittest.main()
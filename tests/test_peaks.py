@@ -0,0 +1,88 @@
+import unittest
+import numpy as np
+from scipy.signal import find_peaks
+from backend.data_processing import process_data
+from backend.peaks import detect_peaks, detect_peaks_batch, refine_positions, PeakTracker
+
+def gaussians(centres, pixels=512, height=10000.0, sigma=4.0, offset=500.0):
+    x = np.arange(pixels)
+    spectrum = np.full(pixels, float(offset))
+    for centre in centres:
+        spectrum += height * np.exp(-0.5 * ((x - centre) / sigma) ** 2)
+    return spectrum
+
+class TestPeaks(unittest.TestCase):
+    def setUp(self):
+        self.wavelengths = np.linspace(900, 1700, 512)
+
+    def test_sub_pixel_positions(self):
+        spectrum = gaussians([100.3, 300.7])
+        peaks = detect_peaks(spectrum, self.wavelengths, height=5000)
+        np.testing.assert_array_equal(peaks['index'], [100, 301])
+        np.testing.assert_allclose(peaks['position'], [100.3, 300.7], atol=0.05)
+        centroid = refine_positions(spectrum, peaks['index'], 'centroid')
+        np.testing.assert_allclose(centroid, [100.3, 300.7], atol=0.2)
+        expected = np.interp(peaks['position'], np.arange(512), self.wavelengths)
+        np.testing.assert_allclose(peaks['wavelength'], expected)
+
+    def test_criteria(self):
+        spectrum = gaussians([100, 300]) + gaussians([200], height=800, sigma=1.0, offset=0)
+        self.assertEqual(len(detect_peaks(spectrum, height=5000)), 2)
+        self.assertEqual(len(detect_peaks(spectrum, prominence=500)), 3)
+        self.assertEqual(len(detect_peaks(spectrum, prominence=500, width=5)), 2)
+
+    def test_process_data_defaults(self):
+        spectrum = gaussians([100.3, 300.7])
+        indices, _ = find_peaks(spectrum, height=1000)
+        np.testing.assert_array_equal(process_data(self.wavelengths, spectrum), self.wavelengths[indices])
+        refined = process_data(self.wavelengths, spectrum, interpolation='parabolic')
+        self.assertFalse(np.allclose(refined, self.wavelengths[indices]))
+
+    def test_batch_matches_single(self):
+        rng = np.random.default_rng(3)
+        spectra = np.array([gaussians(rng.uniform(20, 490, 3)) + rng.normal(0, 20, 512) for _ in range(20)])
+        spectra[5] = 0.0
+        batch = detect_peaks_batch(spectra, self.wavelengths, height=3000, prominence=1000)
+        for row, spectrum in enumerate(spectra):
+            single = detect_peaks(spectrum, self.wavelengths, height=3000, prominence=1000)
+            np.testing.assert_array_equal(batch[batch['spectrum'] == row]['position'], single['position'])
+        self.assertEqual(len(batch[batch['spectrum'] == 5]), 0)
+
+    def test_tracker_follows_moving_peak(self):
+        tracker = PeakTracker(self.wavelengths, height=5000, search_radius=4, full_search_interval=0)
+        first = tracker.update(gaussians([100.0, 300.0]))
+        tracks = dict(zip(first['index'], first['track']))
+        for step in range(1, 6):
+            peaks = tracker.update(gaussians([100.0 + 1.5 * step, 300.0]))
+            np.testing.assert_allclose(peaks['position'], [100.0 + 1.5 * step, 300.0], atol=0.1)
+            self.assertEqual(list(peaks['track']), [tracks[100], tracks[300]])
+        # The static peak was never searched again
+        self.assertEqual(tracker.peaks_reused, 5)
+        self.assertEqual(tracker.full_searches, 1)
+
+    def test_tracker_new_and_lost_peaks(self):
+        tracker = PeakTracker(height=5000, search_radius=4, full_search_interval=0)
+        tracker.update(gaussians([100.0, 300.0]))
+        peaks = tracker.update(gaussians([100.0, 400.0]))
+        np.testing.assert_array_equal(peaks['index'], [100, 400])
+        self.assertEqual(list(peaks['track']), [0, 2])
+        expected = detect_peaks(gaussians([100.0, 400.0]), height=5000)
+        np.testing.assert_allclose(peaks['position'], expected['position'])
+
+    def test_tracker_threshold_follows_noise(self):
+        rng = np.random.default_rng(5)
+        frames = gaussians([100.0, 300.0]) + rng.normal(0, 20, (20, 512))
+        tracker = PeakTracker(height=5000, search_radius=4, full_search_interval=0)
+        tracker.update(frames[0])
+        self.assertIsNone(tracker.threshold)
+        for frame in frames[1:]:
+            peaks = tracker.update(frame)
+        self.assertAlmostEqual(tracker.noise, 20, delta=3)
+        self.assertAlmostEqual(tracker.threshold, 8 * tracker.noise)
+        # Noise alone never moves the peaks or starts a search
+        np.testing.assert_array_equal(peaks['index'], [100, 300])
+        self.assertEqual((tracker.full_searches, tracker.peaks_searched), (1, 2))
+        self.assertEqual(PeakTracker(change_threshold=50).threshold, 50)
+
+if __name__ == '__main__':
+    unittest.main()
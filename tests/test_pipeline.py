@@ -0,0 +1,82 @@
+import unittest
+import numpy as np
+from backend.pipeline import (Pipeline, DarkStage, ReferenceStage, SmoothStage, BaselineStage,
+                              NormalizeStage, FormulaStage, FeaturesStage, correction_pipeline)
+from backend.smoothing import boxcar
+from data_processing import DataProcessor
+
+class TestPipeline(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(8)
+        self.dark = rng.uniform(900, 1100, 64)
+        self.reference = rng.uniform(20000, 40000, 64)
+        self.frames = rng.uniform(0, 45000, (6, 64))
+
+    def test_matches_step_by_step_processing(self):
+        pipeline = Pipeline([DarkStage(self.dark), ReferenceStage(self.reference),
+                             SmoothStage('savgol', window_length=7, polyorder=2),
+                             BaselineStage(2), NormalizeStage()], timed=True)
+        result = pipeline.run(self.frames)
+
+        expected = np.clip((self.frames - self.dark) * 100 / self.reference, 0, 100)
+        expected = DataProcessor.smooth_data(expected, 7, 2)
+        expected = DataProcessor.normalize_data(DataProcessor.baseline_correction(expected))
+        np.testing.assert_allclose(result, expected, atol=1e-9)
+
+        # Dark and reference share one pass; a single frame gives the same row
+        self.assertEqual(pipeline.stage_names, ['dark+reference', 'smooth', 'baseline', 'normalize'])
+        np.testing.assert_allclose(pipeline(self.frames[2]), expected[2], atol=1e-9)
+        self.assertEqual(pipeline.timings()['baseline']['calls'], 2)
+
+    def test_input_untouched_and_results_independent(self):
+        frames = self.frames.copy()
+        pipeline = Pipeline([SmoothStage('boxcar', width=3), FormulaStage('x / max(x)')])
+        first = pipeline(frames[0])
+        pipeline(frames[1])
+        np.testing.assert_array_equal(frames, self.frames)
+        np.testing.assert_allclose(first, boxcar(self.frames[0]) / boxcar(self.frames[0]).max())
+
+    def test_taps_and_features(self):
+        frame = self.frames[0].copy()
+        pipeline = Pipeline([DarkStage(self.dark), SmoothStage('boxcar'), FeaturesStage()])
+        features = pipeline.run(frame, taps={'dark': frame})
+        np.testing.assert_allclose(frame, np.maximum(self.frames[0] - self.dark, 0))
+        self.assertEqual(features['peak_index'], np.argmax(boxcar(frame)))
+
+    def test_validation(self):
+        with self.assertRaises(ValueError):
+            Pipeline([DarkStage(self.dark)], pixels=32)
+        with self.assertRaises(ValueError):
+            Pipeline([FeaturesStage(), NormalizeStage()])
+        with self.assertRaises(ValueError):
+            Pipeline([SmoothStage('savgol', window_length=11)], pixels=8)
+        self.assertFalse(Pipeline([DarkStage(self.dark)]).matches(np.zeros(32)))
+
+    def test_dark_and_reference_stages(self):
+        dark = np.full(4, 100.0)
+        reference = np.array([1000.0, 500.0, 0.0, 200.0])
+        frame = np.array([50.0, 600.0, 300.0, 400.0])
+        out = np.empty(4)
+        self.assertIs(DarkStage(dark).apply(frame, out), out)
+        np.testing.assert_array_equal(out, [0.0, 500.0, 200.0, 300.0])
+        # 300/200 would be 150% and is clipped; a zero reference maps to 0%
+        np.testing.assert_allclose(ReferenceStage(reference).apply(out, out), [0.0, 100.0, 0.0, 100.0])
+        pipeline = Pipeline([DarkStage(dark), ReferenceStage(reference)])
+        np.testing.assert_allclose(pipeline(np.array([600.0, 300.0, 100.0, 150.0])), [50.0, 40.0, 0.0, 25.0])
+        with self.assertRaises(ValueError):
+            Pipeline([DarkStage(dark), ReferenceStage(np.ones(8))], pixels=4)
+
+    def test_correction_pipeline(self):
+        self.assertEqual(correction_pipeline().stage_names, ['smooth'])
+        pipeline = correction_pipeline(self.dark, self.reference)
+        expected = boxcar(np.maximum(self.frames[0] - self.dark, 0)) * 100 / self.reference
+        np.testing.assert_allclose(pipeline(self.frames[0]), np.clip(expected, 0, 100))
+        # A reference of another length is left out
+        self.assertEqual([stage.name for stage in correction_pipeline(self.dark, self.reference[:32]).stages],
+                         ['dark', 'smooth'])
+        # The live chain always keeps per-stage timings
+        self.assertEqual(pipeline.timings()['dark']['calls'], 1)
+        self.assertRegex(pipeline.timing_summary(), r'^dark [\d.]+ ms, smooth [\d.]+ ms, reference [\d.]+ ms$')
+
+if __name__ == '__main__':
+    unittest.main()
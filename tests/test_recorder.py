@@ -0,0 +1,92 @@
+import os
+import tempfile
+import time
+import unittest
+import numpy as np
+from backend.acquisition import AcquisitionEngine
+from backend.recorder import SpectrumRecorder, Recording, load_recording, recover_recording
+
+class TestRecorder(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'run.nirr')
+        self.wavelengths = np.linspace(900, 2500, 16)
+        self.frames = np.random.default_rng(2).integers(0, 65535, (10, 16), dtype=np.uint16)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _record(self, frames, **kwargs):
+        with SpectrumRecorder(self.path, self.wavelengths, chunk_frames=4, metadata={'Device': 'NIRQUEST'},
+                              integration_time_us=100000, **kwargs) as recorder:
+            for i, frame in enumerate(frames):
+                recorder.record(frame, timestamp=1000.0 + i, scans=i % 3 + 1)
+        return recorder
+
+    def test_round_trip(self):
+        recorder = self._record(self.frames)
+        self.assertEqual(recorder.frames_written, 10)
+        self.assertEqual(recorder.chunks_written, 3)
+
+        wavelengths, timestamps, integration, scans, frames, metadata = load_recording(self.path)
+        np.testing.assert_array_equal(wavelengths, self.wavelengths)
+        np.testing.assert_array_equal(frames, self.frames)
+        np.testing.assert_array_equal(timestamps, 1000.0 + np.arange(10))
+        np.testing.assert_array_equal(integration, 100000)
+        np.testing.assert_array_equal(scans, np.arange(10) % 3 + 1)
+        self.assertEqual(metadata, {'Device': 'NIRQUEST'})
+
+    def test_recovers_torn_and_corrupt_chunks(self):
+        self._record(self.frames[:8])
+        size = os.path.getsize(self.path)
+        with open(self.path, 'ab') as f:
+            f.write(b'CHNK\x04\0\0\0')  # header of a chunk that never made it to disk
+        self.assertEqual(len(Recording(self.path)), 8)
+
+        # Flip a byte in the last complete chunk: it fails its CRC
+        with open(self.path, 'r+b') as f:
+            f.seek(size - 1)
+            last = f.read(1)
+            f.seek(size - 1)
+            f.write(b'\0' if last == b'\xff' else b'\xff')
+        recording = Recording(self.path)
+        self.assertTrue(recording.corrupt)
+        self.assertEqual(len(recording), 4)
+        del recording
+
+        self.assertEqual(recover_recording(self.path), 4)
+        with SpectrumRecorder(self.path, append=True) as recorder:
+            recorder.record(self.frames[9], timestamp=2000.0)
+        _, timestamps, _, _, frames, _ = load_recording(self.path)
+        np.testing.assert_array_equal(frames, np.vstack((self.frames[:4], self.frames[9:])))
+        self.assertEqual(timestamps[-1], 2000.0)
+
+    def test_drops_frames_when_buffers_are_full(self):
+        recorder = SpectrumRecorder(self.path, self.wavelengths, chunk_frames=2, max_pending_chunks=1)
+        recorder._pending.put(None)  # stop the writer so nothing is freed
+        recorder._thread.join()
+        results = [recorder.record(frame) for frame in self.frames[:4]]
+        self.assertEqual(results, [True, True, False, False])
+        self.assertEqual(recorder.dropped_frames, 2)
+
+    def test_records_engine_frames(self):
+        frames = iter(self.frames)
+
+        def read_spectrum():
+            time.sleep(0.001)
+            return next(frames, None)
+
+        recorder = SpectrumRecorder(self.path, self.wavelengths, chunk_frames=4, fsync_interval=0)
+        engine = AcquisitionEngine(None, read_spectrum=read_spectrum)
+        engine.add_frame_callback(recorder.on_frame)
+        engine.start()
+        deadline = time.time() + 2
+        while engine.frames_read < 10 and time.time() < deadline:
+            time.sleep(0.005)
+        engine.stop()
+        recorder.close()
+        self.assertGreater(recorder.fsyncs, 1)
+        np.testing.assert_array_equal(load_recording(self.path)[4], self.frames)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+import numpy as np
+from scipy.ndimage import gaussian_filter1d
+from scipy.signal import savgol_filter
+from backend.smoothing import boxcar, savitzky_golay, gaussian, smooth
+
+class TestSmoothing(unittest.TestCase):
+    def setUp(self):
+        self.spectra = np.random.default_rng(2).normal(1000, 50, (4, 300))
+
+    def test_boxcar_matches_loop(self):
+        spectrum = self.spectra[0]
+        expected = spectrum.copy()
+        for i in range(2, len(spectrum) - 2):
+            expected[i] = np.mean(spectrum[i - 2:i + 3])
+        np.testing.assert_allclose(boxcar(spectrum, 5), expected)
+        self.assertEqual(boxcar(spectrum, 5)[0], spectrum[0])
+
+    def test_boxcar_batch_and_out(self):
+        out = np.empty_like(self.spectra)
+        result = boxcar(self.spectra, 3, out=out)
+        self.assertIs(result, out)
+        np.testing.assert_allclose(result[2], boxcar(self.spectra[2], 3))
+        with self.assertRaises(ValueError):
+            boxcar(self.spectra, 4)
+
+    def test_savitzky_golay_matches_scipy(self):
+        np.testing.assert_allclose(savitzky_golay(self.spectra, 11, 3), savgol_filter(self.spectra, 11, 3))
+        np.testing.assert_allclose(savitzky_golay(self.spectra[1], 7, 2), savgol_filter(self.spectra[1], 7, 2))
+        # A one-point window leaves the data unchanged
+        np.testing.assert_allclose(savitzky_golay(np.arange(10.), 1, 0), np.arange(10.))
+        np.testing.assert_allclose(savitzky_golay(self.spectra, 1, 0), savgol_filter(self.spectra, 1, 0))
+
+    def test_gaussian_matches_scipy(self):
+        np.testing.assert_allclose(gaussian(self.spectra, 2.5),
+                                   gaussian_filter1d(self.spectra, 2.5, mode='nearest'))
+
+    def test_dispatch(self):
+        np.testing.assert_allclose(smooth(self.spectra, 'savgol', window_length=5, polyorder=2),
+                                   savgol_filter(self.spectra, 5, 2))
+        with self.assertRaises(ValueError):
+            smooth(self.spectra, 'median')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,195 @@
+import os
 import unittest
-from backend.spectrometer import find_spectrometer
+from array import array
+from unittest import mock
+import numpy as np
+import usb.core
+from backend.spectrometer import (find_spectrometer, request_spectrum, decode_frame, process_spectrum, END_MARKER,
+                                  encode_integration_time, set_integration_time, set_trigger_mode, BurstReader,
+                                  enumerate_spectrometers, DeviceScanner, MODEL_CONFIGS_BY_PRODUCT_ID)
+from backend.simulator import SimulatedSpectrometer
+from config.ocean_optics_configs import model_configs
 
 class TestSpectrometer(unittest.TestCase):
     def test_find_spectrometer(self):
-        spectrometer = find_spectrometer()
+        # No hardware needed: the USB scan also returns the simulated devices named here
+        with mock.patch.dict(os.environ, {'NIR_SIMULATED_SPECTROMETER': 'NIRQUEST'}):
+            spectrometer = find_spectrometer()
         self.assertIsNotNone(spectrometer.usb_device)
+        self.assertEqual(spectrometer.model_name, 'NIRQUEST')
+
+class TestDecodeFrame(unittest.TestCase):
+    def test_decode_usb_buffer(self):
+        values = np.arange(2048, dtype='<u2') * 31
+        frame = array('B', values.tobytes() + bytes([END_MARKER]))
+        spectrum = decode_frame(frame)
+        np.testing.assert_array_equal(spectrum, values)
+        self.assertEqual(spectrum.dtype, np.dtype('<u2'))
+
+    def test_decode_is_zero_copy(self):
+        frame = array('B', bytes(8) + bytes([END_MARKER]))
+        spectrum = decode_frame(frame)
+        frame[0] = 0x34
+        frame[1] = 0x12
+        self.assertEqual(spectrum[0], 0x1234)
+
+    def test_invalid_end_marker(self):
+        self.assertIsNone(decode_frame(array('B', bytes(9))))
+        self.assertIsNone(decode_frame(b''))
+
+    def test_process_spectrum_without_marker(self):
+        values = np.arange(4096, dtype='<u2')
+        spectrum = process_spectrum(values.tobytes())
+        np.testing.assert_array_equal(spectrum, values)
+
+class TestSimulatedSpectrometer(unittest.TestCase):
+    def test_every_model_returns_framed_spectra(self):
+        for config in model_configs:
+            with self.subTest(model=config[1]):
+                device = SimulatedSpectrometer(config[1], integration_time_us=100, seed=0)
+                spectrometer = find_spectrometer([device])
+                self.assertIs(spectrometer.usb_device, device)
+                self.assertEqual(spectrometer.model_name, config[1])
+                spectrum = request_spectrum(
+                    spectrometer.usb_device,
+                    spectrometer.packet_size,
+                    spectrometer.spectra_ep_in,
+                    spectrometer.cmd_ep_out
+                )
+                self.assertEqual(len(spectrum), (config[2] - 1) // 2)
+
+    def test_dark_offset_and_saturation(self):
+        device = SimulatedSpectrometer(noise=0, dark_offset=500, saturation=4000, integration_time_us=100)
+        device.light_on = False
+        np.testing.assert_array_equal(device.render_frame(), 500)
+        device.light_on = True
+        device.integration_time_us = 10**7
+        self.assertEqual(device.render_frame().max(), 4000)
+
+class TestDiscovery(unittest.TestCase):
+    def test_product_id_index(self):
+        for config in model_configs:
+            for device_id in config[0]:
+                self.assertEqual(MODEL_CONFIGS_BY_PRODUCT_ID[device_id].model_name, config[1])
+
+    def test_enumerate_is_ordered_by_bus_and_address(self):
+        devices = [SimulatedSpectrometer('USB2000+', bus=2, address=1),
+                   SimulatedSpectrometer('NIRQUEST', bus=1, address=7),
+                   SimulatedSpectrometer('Maya2000 Pro', bus=1, address=3)]
+        unknown = SimulatedSpectrometer('NIRQUEST', bus=0, address=1)
+        unknown.idProduct = 0xFFFF
+        profiles = enumerate_spectrometers(devices + [unknown])
+        self.assertEqual([profile.model_name for profile in profiles], ['Maya2000 Pro', 'NIRQUEST', 'USB2000+'])
+        self.assertTrue(all(device.configured for device in devices))
+        self.assertFalse(unknown.configured)
+
+    def test_enumerate_skips_devices_that_fail_to_configure(self):
+        busy = SimulatedSpectrometer('USB2000+', bus=1, address=1)
+        device = SimulatedSpectrometer('NIRQUEST', bus=1, address=2)
+        with mock.patch.object(busy, 'set_configuration', side_effect=usb.core.USBError('Resource busy')):
+            profiles = enumerate_spectrometers([busy, device])
+        self.assertEqual([profile.usb_device for profile in profiles], [device])
+        # Once it is free again the next scan finds it
+        self.assertIs(find_spectrometer([busy, device]).usb_device, busy)
+
+    def test_no_spectrometer(self):
+        self.assertIsNone(find_spectrometer([]).usb_device)
+        with self.assertRaises(ValueError):
+            find_spectrometer([], required=True)
+
+    def test_simulated_rig_from_environment(self):
+        with mock.patch.dict(os.environ, {'NIR_SIMULATED_SPECTROMETER': 'NIRQUEST, USB2000+'}):
+            profiles = enumerate_spectrometers()
+            self.assertEqual([profile.model_name for profile in profiles], ['NIRQUEST', 'USB2000+'])
+            self.assertIs(find_spectrometer().usb_device, profiles[0].usb_device)
+
+    def test_rescan_only_configures_new_devices(self):
+        attached = [SimulatedSpectrometer('NIRQUEST', address=1)]
+        scanner = DeviceScanner(lambda: list(attached))
+        added, removed = scanner.rescan()
+        self.assertEqual(([profile.model_name for profile in added], removed), (['NIRQUEST'], []))
+        first = scanner.profiles[0]
+
+        attached.append(SimulatedSpectrometer('USB2000+', address=2))
+        with mock.patch.object(attached[0], 'set_configuration') as set_configuration:
+            added, removed = scanner.rescan()
+        set_configuration.assert_not_called()
+        self.assertEqual([profile.model_name for profile in added], ['USB2000+'])
+        self.assertIs(scanner.profiles[0], first)
+
+        unplugged = attached.pop(0)
+        added, removed = scanner.rescan()
+        self.assertEqual((added, [profile.usb_device for profile in removed]), ([], [unplugged]))
+        self.assertFalse(unplugged.configured)
+        self.assertEqual([profile.model_name for profile in scanner.profiles], ['USB2000+'])
+
+class TestIntegrationTime(unittest.TestCase):
+    def test_encoding_per_model(self):
+        packet, applied = encode_integration_time('NIRQUEST', 25000)
+        self.assertEqual(packet, bytes([0x02]) + (25000).to_bytes(4, 'little'))
+        self.assertEqual(applied, 25000)
+        # Older models take whole milliseconds in 16 bits
+        packet, applied = encode_integration_time('USB2000', 25400)
+        self.assertEqual(packet, bytes([0x02]) + (25).to_bytes(2, 'little'))
+        self.assertEqual(applied, 25000)
+        # Clamped to the model's limits
+        self.assertEqual(encode_integration_time('NIRQUEST', 10)[1], 1000)
+        self.assertEqual(encode_integration_time('Unknown model', 5000)[1], 5000)
+
+    def test_simulator_applies_integration_time(self):
+        for config in model_configs:
+            with self.subTest(model=config[1]):
+                device = SimulatedSpectrometer(config[1], seed=0)
+                spectrometer = find_spectrometer([device])
+                applied = set_integration_time(device, spectrometer.cmd_ep_out, spectrometer.model_name, 20000)
+                self.assertEqual(applied, 20000)
+                self.assertEqual(device.integration_time_us, 20000)
+
+class TestBurstReader(unittest.TestCase):
+    def setUp(self):
+        self.device = SimulatedSpectrometer(integration_time_us=2000, noise=0, seed=0)
+        self.profile = find_spectrometer([self.device])
+
+    def test_burst_reassembles_chunks(self):
+        reader = BurstReader.from_profile(self.profile, depth=3)
+        scans = reader.burst(5)
+        self.assertEqual(scans.shape, (5, 2048))
+        np.testing.assert_array_equal(scans[0], self.device.render_frame())
+        # 4097-byte packets arrive in nine 512-byte reads; nothing is left queued
+        self.assertEqual(reader.chunk_reads, 45)
+        self.assertEqual(self.device.requests, 5)
+        self.assertEqual(reader.outstanding, 0)
+        self.assertFalse(self.device._frame_ready)
+
+    def test_broken_frame_is_dropped_and_resynchronized(self):
+        reader = BurstReader.from_profile(self.profile, depth=2, timeout_ms=50)
+        self.assertIsNotNone(reader.read())
+        # Stray half packet ahead of the next frame
+        self.device._queue(self.device.spectra_ep_in, bytes(1000))
+        self.assertIsNone(reader.read())
+        self.assertEqual(reader.bad_frames, 1)
+        self.assertEqual(reader.outstanding, 0)
+        np.testing.assert_array_equal(reader.read(), self.device.render_frame())
+
+    def test_timeout_follows_integration_time(self):
+        self.device.integration_time_us = 300000
+        reader = BurstReader.from_profile(self.profile, depth=2, integration_time_us=300000, timeout_margin_ms=100)
+        self.assertEqual(reader.timeout_ms, 400)
+        self.assertEqual(len(reader.burst(2)), 2)
+        self.assertEqual(reader.timeouts, 0)
+        reader.set_integration_time(10000)
+        self.assertEqual(reader.timeout_ms, 110)
+
+    def test_external_trigger(self):
+        set_trigger_mode(self.device, self.profile.cmd_ep_out, 'external_hardware')
+        reader = BurstReader.from_profile(self.profile, depth=1, timeout_ms=20)
+        self.assertIsNone(reader.read())
+        self.assertEqual((reader.timeouts, reader.outstanding), (1, 1))
+        self.assertTrue(self.device.trigger())
+        self.assertIsNotNone(reader.read())
+        self.assertFalse(self.device.trigger())
+        with self.assertRaises(ValueError):
+            set_trigger_mode(self.device, self.profile.cmd_ep_out, 'rising_edge')
 
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
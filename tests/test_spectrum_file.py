@@ -0,0 +1,65 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from backend.data_saving import save_with_metadata, load_from_csv
+from backend.spectrum_file import (SpectrumFile, SpectrumWriter, write_spectra, append_spectra,
+                                   load_spectra, csv_to_binary, binary_to_csv)
+
+class TestSpectrumFile(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'run.nirs')
+        self.wavelengths = np.linspace(900, 2500, 64)
+        self.spectra = np.random.default_rng(3).uniform(0, 60000, (5, 64))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_round_trip_and_append(self):
+        write_spectra(self.path, self.wavelengths, self.spectra[:3], metadata={'Device': 'NIRQUEST'})
+        append_spectra(self.path, self.spectra[3])
+        append_spectra(self.path, self.spectra[4:])
+
+        wavelengths, spectra, metadata = load_spectra(self.path)
+        np.testing.assert_array_equal(wavelengths, self.wavelengths)
+        self.assertIsInstance(spectra, np.memmap)
+        np.testing.assert_allclose(spectra, self.spectra.astype(np.float32))
+        self.assertEqual(metadata, {'Device': 'NIRQUEST'})
+
+    def test_uint16_rounds_and_clips(self):
+        write_spectra(self.path, self.wavelengths[:3], [[1.4, 70000.0, -5.0]], dtype='uint16')
+        spectrum_file = SpectrumFile(self.path)
+        self.assertEqual(spectrum_file.dtype, np.dtype('<u2'))
+        np.testing.assert_array_equal(spectrum_file[0], [1, 65535, 0])
+
+    def test_torn_last_row_is_ignored(self):
+        write_spectra(self.path, self.wavelengths, self.spectra[:2])
+        with open(self.path, 'ab') as f:
+            f.write(b'\1\2\3')
+        self.assertEqual(len(SpectrumFile(self.path)), 2)
+        with SpectrumWriter(self.path, append=True) as writer:
+            writer.append(self.spectra[2])
+        np.testing.assert_allclose(SpectrumFile(self.path)[2], self.spectra[2].astype(np.float32))
+
+    def test_csv_conversion(self):
+        csv_path = os.path.join(self.tmp.name, 'spectrum.csv')
+        save_with_metadata(self.wavelengths, self.spectra[0], filename=csv_path, metadata={'Device': 'NIRQUEST'})
+        csv_to_binary(csv_path, self.path)
+        self.assertEqual(SpectrumFile(self.path).metadata['Device'], 'NIRQUEST')
+
+        out_path = os.path.join(self.tmp.name, 'back.csv')
+        binary_to_csv(self.path, out_path, index=0)
+        wavelengths, intensities, metadata = load_from_csv(out_path)
+        np.testing.assert_allclose(wavelengths, self.wavelengths)
+        np.testing.assert_allclose(intensities, self.spectra[0], rtol=1e-6)
+        self.assertEqual(metadata['Device'], 'NIRQUEST')
+
+    def test_rejects_other_files(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'Wavelength,Intensity\n' * 10)
+        with self.assertRaises(ValueError):
+            SpectrumFile(self.path)
+
+if __name__ == '__main__':
+    unittest.main()
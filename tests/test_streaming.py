@@ -0,0 +1,121 @@
+import io
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+import numpy as np
+from backend.streaming import SpectrumServer, encode_message, decode_message, read_message, FLAG_REFLECTANCE
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+class TestEncoding(unittest.TestCase):
+    def test_round_trip(self):
+        counts = np.arange(2048, dtype=np.uint16)
+        reflectance = np.linspace(0, 100, 512)
+        stream = io.BytesIO(encode_message(counts, 7, 12.5, (900, 2500)) +
+                            encode_message(reflectance, 8, flags=FLAG_REFLECTANCE))
+
+        header, samples = read_message(stream)
+        self.assertEqual((header.sample_type, header.sequence, header.pixels), (1, 7, 2048))
+        self.assertEqual((header.timestamp, header.first_wavelength, header.last_wavelength), (12.5, 900, 2500))
+        np.testing.assert_array_equal(samples, counts)
+
+        header, samples = read_message(stream)
+        self.assertEqual((header.sample_type, header.flags), (2, FLAG_REFLECTANCE))
+        np.testing.assert_allclose(samples, reflectance, rtol=1e-6)
+        self.assertIsNone(read_message(stream))
+        # 32-byte header plus two bytes per pixel
+        self.assertEqual(len(encode_message(counts)), 32 + 4096)
+
+    def test_rejects_other_data(self):
+        with self.assertRaises(ValueError):
+            decode_message(bytes(64))
+
+class TestSpectrumServer(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.server = SpectrumServer(port=0, unix_path=os.path.join(self.directory.name, 'spectra.sock'),
+                                     websocket_port=0)
+        self.server.start()
+        self.sockets = []
+
+    def tearDown(self):
+        for sock in self.sockets:
+            sock.close()
+        self.server.stop()
+        self.directory.cleanup()
+
+    def connect(self, name):
+        if name == 'unix':
+            sock = socket.socket(socket.AF_UNIX)
+            sock.connect(self.server.addresses['unix'])
+        else:
+            sock = socket.create_connection(self.server.addresses[name][:2])
+        self.sockets.append(sock)
+        return sock
+
+    def test_every_transport_gets_the_frame(self):
+        tcp = self.connect('tcp').makefile('rb')
+        unix = self.connect('unix').makefile('rb')
+        websocket = self.connect('websocket')
+        websocket.sendall(b'GET / HTTP/1.1\r\nHost: localhost\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                          b'Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\nSec-WebSocket-Version: 13\r\n\r\n')
+        websocket = websocket.makefile('rb')
+        response = b''
+        while not response.endswith(b'\r\n\r\n'):
+            response += websocket.read(1)
+        self.assertIn(b'101 Switching Protocols', response)
+        self.assertIn(b'Sec-WebSocket-Accept: s3pPLMBiTxaQ9kYGzzhZRbK+xOo=', response)
+        self.assertTrue(wait_until(lambda: self.server.clients == 3))
+
+        frame = np.arange(100, dtype=np.uint16)
+        self.server.publish(frame, wavelength_range=(900, 2500))
+        for stream in (tcp, unix):
+            np.testing.assert_array_equal(read_message(stream)[1], frame)
+        # One unmasked binary frame with a 16-bit length
+        self.assertEqual(websocket.read(4), bytes([0x82, 126]) + (32 + 200).to_bytes(2, 'big'))
+        np.testing.assert_array_equal(decode_message(websocket.read(232))[1], frame)
+
+    def test_slow_client_drops_stale_frames(self):
+        fast = self.connect('tcp').makefile('rb')
+        slow = self.connect('tcp')
+        slow.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        self.assertTrue(wait_until(lambda: self.server.clients == 2))
+
+        received = []
+        def read_fast():
+            while True:
+                message = read_message(fast)
+                if message is None or message[0].sequence == 3000:
+                    break
+                received.append(message[0].sequence)
+        reader = threading.Thread(target=read_fast, daemon=True)
+        reader.start()
+        frame = np.zeros(2048, dtype=np.uint16)
+        for _ in range(3000):
+            self.server.publish(frame)
+            time.sleep(0.0001)
+        reader.join(10)
+
+        self.assertFalse(reader.is_alive())
+        stats = self.server.client_stats()
+        self.assertGreater(max(client['dropped'] for client in stats), 1000)
+        # The slow reader never held up the publisher or the other client
+        self.assertGreater(len(received), 1000)
+
+    def test_disconnects_are_noticed(self):
+        sock = self.connect('tcp')
+        self.assertTrue(wait_until(lambda: self.server.clients == 1))
+        sock.close()
+        self.assertTrue(wait_until(lambda: self.server.clients == 0))
+        self.server.publish(np.zeros(8))
+        self.assertEqual(self.server.published, 1)
+
+if __name__ == '__main__':
+    unittest.main()
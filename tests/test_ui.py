@@ -1,10 +1,74 @@
+import os
+import subprocess
+import sys
+import tempfile
 import unittest
+import time
+from unittest import mock
+from kivy.clock import Clock
+import matplotlib.pyplot as plt
+import numpy as np
+from backend.recorder import Recording
 from frontend.ui import SpectrumApp
+from frontend.matplotlib_widget import MatplotlibWidget
 
 class TestUI(unittest.TestCase):
     def test_ui_initialization(self):
         app = SpectrumApp()
         self.assertIsNotNone(app.build())
 
+    def test_spectrometer_is_discovered_in_background(self):
+        with mock.patch.dict(os.environ, {'NIR_SIMULATED_SPECTROMETER': 'NIRQUEST'}):
+            layout = SpectrumApp().build()
+            self.assertIsNone(layout.spectrometer.usb_device)
+            layout._discovery_thread.join(10)
+        Clock.tick()
+        self.assertFalse(layout.discovering)
+        self.assertEqual(layout.spectrometer.model_name, 'NIRQUEST')
+        self.assertIs(layout.acquisition.profile, layout.spectrometer)
+        self.assertIsNone(layout.loading_indicator.parent)
+
+    def test_recording_is_not_reopened_by_a_late_frame(self):
+        layout = SpectrumApp().build()
+        frame = np.arange(512, dtype=np.uint16)
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'frames.nirr')
+            layout.start_recording(filename)
+            for i in range(3):
+                layout._record_frame(frame, float(i))
+            layout.stop_recording()
+            # A frame the reader thread was already handling when recording stopped
+            layout._record_frame(frame, 3.0)
+            self.assertIsNone(layout.recorder)
+            self.assertEqual(len(Recording(filename)), 3)
+
+    def test_heavy_modules_load_on_first_use(self):
+        code = "import sys, frontend.ui; print(sorted({'pandas', 'scipy', 'matplotlib.pyplot', 'kivy.uix.filechooser'} & set(sys.modules)))"
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        result = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True, text=True,
+                                env=dict(os.environ, KIVY_NO_ARGS='1'))
+        self.assertEqual(result.stdout.strip().splitlines()[-1], '[]')
+
+class TestMatplotlibWidget(unittest.TestCase):
+    def test_redraw_requests_are_coalesced(self):
+        widget = MatplotlibWidget(figure=plt.figure(figsize=(2, 2), dpi=50), max_fps=1000)
+        for _ in range(5):
+            widget.draw()
+        widget.blit()
+        time.sleep(0.01)
+        Clock.tick()
+        stats = widget.stats()
+        self.assertEqual(stats['requested_renders'], 5)
+        self.assertEqual(stats['performed_renders'], 1)
+        self.assertEqual(stats['performed_uploads'], 1)
+
+    def test_render_rate_is_capped(self):
+        widget = MatplotlibWidget(figure=plt.figure(figsize=(2, 2), dpi=50), max_fps=2)
+        widget.draw()
+        Clock.tick()
+        widget.draw()
+        Clock.tick()
+        self.assertEqual(widget.performed_renders, 1)
+
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+import numpy as np
+from unittest import mock
+from utils import Formula, compile_formula, validate_formula, calculate_custom, numexpr
+from data_processing import DataProcessor
+
+class TestFormula(unittest.TestCase):
+    def setUp(self):
+        self.data = np.array([1.0, 2.0, 4.0])
+
+    def test_names_containing_x(self):
+        np.testing.assert_allclose(calculate_custom(self.data, 'exp(x)'), np.exp(self.data))
+        np.testing.assert_allclose(calculate_custom(self.data, 'x / max(x)'), self.data / 4)
+        np.testing.assert_allclose(calculate_custom(self.data, 'np.log10(x) + pi'), np.log10(self.data) + np.pi)
+        self.assertEqual(calculate_custom(self.data, 'mean(x)'), np.mean(self.data))
+
+    def test_batch_reductions_are_per_spectrum(self):
+        batch = np.array([[1.0, 2.0, 4.0], [10.0, 5.0, 20.0]])
+        np.testing.assert_allclose(DataProcessor.apply_formula(batch, 'x / max(x)'),
+                                   batch / batch.max(axis=1, keepdims=True))
+
+    def test_unsigned_counts_do_not_wrap(self):
+        counts = np.array([100, 5], dtype=np.uint16)
+        np.testing.assert_array_equal(calculate_custom(counts, 'x - 10'), [90, -5])
+
+    def test_comparisons_in_where(self):
+        np.testing.assert_allclose(calculate_custom(self.data, 'where(x > 1.5, x, 0)'), [0, 2, 4])
+        np.testing.assert_allclose(calculate_custom(self.data, 'np.where(x != 2, x * 10, -x)'), [10, -2, 40])
+
+    def test_rejects_unsafe_formulas(self):
+        for formula in ('__import__("os").system("ls")', 'x.__class__', 'open("f")', 'np.load("f")',
+                        'y + 1', 'sin(x, out=x)', '[x]', 'lambda: 1', '"text"', 'x +', '0 < x < 1',
+                        'x is 1', 'x in x'):
+            with self.subTest(formula=formula), self.assertRaises(ValueError):
+                validate_formula(formula)
+
+    def test_numexpr_only_for_what_it_supports(self):
+        with mock.patch('utils.numexpr', object()):
+            self.assertTrue(Formula('where(x > 1, sqrt(x) * 2, -x) ** 2 % 3').uses_numexpr)
+            for formula in ('x // 2', '+x', 'max(x)', 'floor(x)'):
+                with self.subTest(formula=formula):
+                    self.assertFalse(Formula(formula).uses_numexpr)
+
+    @unittest.skipIf(numexpr is None, "numexpr is not installed")
+    def test_numexpr_matches_numpy(self):
+        data = np.linspace(0.5, 5.0, 50)
+        for formula in ('where(x > 2, x, 0)', 'sqrt(x) * 2 - x ** 2 % 3', 'log(x) / pi', 'x // 2'):
+            with self.subTest(formula=formula):
+                expected = eval(formula, dict(np.__dict__, x=data))
+                np.testing.assert_allclose(calculate_custom(data, formula), expected)
+
+    def test_compiled_once(self):
+        self.assertIs(compile_formula('x * 2'), compile_formula('x * 2'))
+        self.assertEqual(compile_formula('np.sqrt(x)').expression, 'sqrt(x)')
+
+if __name__ == '__main__':
+    unittest.main()
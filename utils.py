@@ -1,15 +1,156 @@
+import ast
+from functools import lru_cache
+import numpy as np
+
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+# Element-wise functions a formula may call
+ELEMENTWISE_FUNCTIONS = {
+    'sin': np.sin, 'cos': np.cos, 'tan': np.tan,
+    'arcsin': np.arcsin, 'arccos': np.arccos, 'arctan': np.arctan, 'arctan2': np.arctan2,
+    'sinh': np.sinh, 'cosh': np.cosh, 'tanh': np.tanh,
+    'exp': np.exp, 'expm1': np.expm1, 'log': np.log, 'log10': np.log10, 'log2': np.log2,
+    'log1p': np.log1p, 'sqrt': np.sqrt, 'abs': np.abs, 'absolute': np.absolute,
+    'power': np.power, 'minimum': np.minimum, 'maximum': np.maximum,
+    'clip': np.clip, 'where': np.where, 'floor': np.floor, 'ceil': np.ceil,
+}
+
+def _per_spectrum(func):
+    """Reduce along the pixel axis, keeping it so the result broadcasts per spectrum."""
+    def reduce(data):
+        return func(data, axis=-1, keepdims=True)
+    return reduce
+
+# Reductions work per spectrum, so x / max(x) normalizes each row of a batch
+REDUCTIONS = {
+    'max': _per_spectrum(np.max), 'min': _per_spectrum(np.min),
+    'mean': _per_spectrum(np.mean), 'sum': _per_spectrum(np.sum),
+    'std': _per_spectrum(np.std), 'median': _per_spectrum(np.median),
+}
+
+CONSTANTS = {'pi': np.pi, 'e': np.e}
+VARIABLE = 'x'
+
+# Functions numexpr evaluates itself; formulas using anything else stay in NumPy
+NUMEXPR_FUNCTIONS = {
+    'sin', 'cos', 'tan', 'arcsin', 'arccos', 'arctan', 'arctan2', 'sinh', 'cosh', 'tanh',
+    'exp', 'expm1', 'log', 'log10', 'log1p', 'sqrt', 'abs', 'where',
+}
+
+_OPERATORS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow,
+              ast.USub, ast.UAdd)
+# Comparisons give the masks where(x > 0, x, 0) needs
+_COMPARISONS = (ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Eq, ast.NotEq)
+
+# Operators numexpr evaluates itself (it has no // and no unary +)
+NUMEXPR_OPERATORS = {ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Mod, ast.Pow, ast.USub} | set(_COMPARISONS)
+
+class _Canonicalize(ast.NodeTransformer):
+    """Check a parsed formula against the whitelist and drop ``np.`` prefixes."""
+
+    def __init__(self):
+        self.functions = set()
+        self.operators = set()
+
+    def generic_visit(self, node):
+        if isinstance(node, _OPERATORS + _COMPARISONS):
+            self.operators.add(type(node))
+        elif not isinstance(node, (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Compare, ast.Call, ast.Name,
+                                   ast.Constant, ast.Load)):
+            raise ValueError(f"Formula contains forbidden term: {type(node).__name__}")
+        return super().generic_visit(node)
+
+    def visit_Constant(self, node):
+        if not isinstance(node.value, (int, float)) or isinstance(node.value, bool):
+            raise ValueError(f"Formula contains forbidden term: {node.value!r}")
+        return node
+
+    def visit_Name(self, node):
+        if node.id != VARIABLE and node.id not in CONSTANTS:
+            raise ValueError(f"Unknown name in formula: {node.id}")
+        return node
+
+    def visit_Compare(self, node):
+        # 0 < x < 1 would need ``and``, which arrays do not support
+        if len(node.ops) > 1:
+            raise ValueError("Chained comparisons are not allowed in formulas")
+        return self.generic_visit(node)
+
+    def visit_Call(self, node):
+        func = node.func
+        # Accept np.sin(x) / numpy.sin(x) as well as sin(x)
+        if (isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name)
+                and func.value.id in ('np', 'numpy')):
+            func = ast.copy_location(ast.Name(id=func.attr, ctx=ast.Load()), func)
+        if not isinstance(func, ast.Name) or (func.id not in ELEMENTWISE_FUNCTIONS
+                                              and func.id not in REDUCTIONS):
+            raise ValueError(f"Formula uses a function that is not allowed: {ast.unparse(node.func)}")
+        if node.keywords:
+            raise ValueError("Keyword arguments are not allowed in formulas")
+        self.functions.add(func.id)
+        node.func = func
+        node.args = [self.visit(arg) for arg in node.args]
+        return node
+
+class Formula:
+    """A validated formula in ``x``, compiled once and evaluated on 1-D or 2-D data.
+
+    2-D input is a batch with one spectrum per row; reductions such as
+    ``max(x)`` are taken per spectrum. Element-wise formulas run through
+    numexpr when it is installed, otherwise through NumPy.
+    """
+
+    def __init__(self, formula):
+        try:
+            tree = ast.parse(formula.strip(), mode='eval')
+        except SyntaxError as e:
+            raise ValueError(f"Invalid formula {formula!r}: {e.msg}")
+        checker = _Canonicalize()
+        tree = ast.fix_missing_locations(checker.visit(tree))
+
+        self.source = formula
+        self.expression = ast.unparse(tree)
+        self.functions = frozenset(checker.functions)
+        self.uses_numexpr = (numexpr is not None and self.functions <= NUMEXPR_FUNCTIONS
+                             and checker.operators <= NUMEXPR_OPERATORS)
+        self._code = compile(tree, '<formula>', 'eval')
+        self._namespace = {'__builtins__': {}}
+        self._namespace.update(ELEMENTWISE_FUNCTIONS)
+        self._namespace.update(REDUCTIONS)
+        self._namespace.update(CONSTANTS)
+
+    def __call__(self, data):
+        data = np.asarray(data)
+        if data.dtype.kind != 'f':
+            # Raw counts are unsigned; evaluate in float so x - dark cannot wrap
+            data = data.astype(np.float64)
+        if self.uses_numexpr:
+            return numexpr.evaluate(self.expression, local_dict=dict(CONSTANTS, x=data))
+        result = eval(self._code, self._namespace, {VARIABLE: data})
+        if data.ndim == 1 and np.shape(result) == (1,) and len(data) != 1:
+            result = result[0]
+        return result
+
+    def __repr__(self):
+        return f"Formula({self.source!r})"
+
+@lru_cache(maxsize=128)
+def compile_formula(formula):
+    """Return the cached compiled ``Formula`` for a formula string."""
+    return Formula(formula)
+
 def validate_formula(formula):
-    # Basic validation to prevent unsafe operations
-    forbidden = ['eval', 'exec', 'import', '__']
-    for item in forbidden:
-        if item in formula:
-            raise ValueError(f"Formula contains forbidden term: {item}")
+    # Parse against the whitelist of operators, functions and names
+    compile_formula(formula)
     return True
 
 def calculate_custom(data, formula):
-    # Replace 'x' with actual data in the formula
-    formula = formula.replace('x', 'data')
+    # Evaluate the compiled formula with x bound to the data
+    formula = compile_formula(formula)
     try:
-        return eval(formula)
+        return formula(data)
     except Exception as e:
-        raise ValueError(f"Error calculating formula: {e}")
\ No newline at end of file
+        raise ValueError(f"Error calculating formula: {e}")